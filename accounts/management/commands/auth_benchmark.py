@@ -0,0 +1,70 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from accounts.middleware import forget_all_users
+
+PLAIN_AUTH = "django.contrib.auth.middleware.AuthenticationMiddleware"
+CACHED_AUTH = "accounts.middleware.CachedAuthenticationMiddleware"
+
+# (label, session engine, authentication middleware)
+SETUPS = [
+    ("db sessions", "django.contrib.sessions.backends.db", PLAIN_AUTH),
+    ("cached_db + cached user", "django.contrib.sessions.backends.cached_db", CACHED_AUTH),
+    ("signed cookies + cached user", "django.contrib.sessions.backends.signed_cookies", CACHED_AUTH),
+]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Count the queries of authenticated requests with database sessions and the stock "
+        "AuthenticationMiddleware, and with cached_db or signed-cookie sessions and the cached "
+        "user, and print how many each setup removes. Runs in a transaction that is rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", action="append", dest="paths", help="URL to request (repeatable); default the restaurant list.")
+        parser.add_argument("--requests", type=int, default=20, help="Requests per path and setup.")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1:
+            raise CommandError("--requests must be positive.")
+        paths = options["paths"] or [reverse("restaurants:restaurant_list")]
+        results = []
+        try:
+            with transaction.atomic():
+                user = get_user_model().objects.create_user("auth-benchmark", password="auth-benchmark")
+                for label, engine, middleware in SETUPS:
+                    results.append((label, self.measure(user, engine, middleware, paths, options["requests"])))
+                raise Rollback
+        except Rollback:
+            pass
+
+        baseline = results[0][1]
+        self.stdout.write(f"{'setup':<32}{'queries/request':>16}{'removed':>9}")
+        for label, per_request in results:
+            self.stdout.write(f"{label:<32}{per_request:>16.2f}{baseline - per_request:>9.2f}")
+
+    def measure(self, user, engine, middleware, paths, requests):
+        middlewares = [middleware if name in (PLAIN_AUTH, CACHED_AUTH) else name for name in settings.MIDDLEWARE]
+        with override_settings(SESSION_ENGINE=engine, MIDDLEWARE=middlewares, ALLOWED_HOSTS=["testserver"]):
+            forget_all_users()
+            client = Client()
+            client.force_login(user)
+            for path in paths:
+                client.get(path, secure=True)  # warm up the caches and the cached user
+            with CaptureQueriesContext(connection) as queries:
+                for _ in range(requests):
+                    for path in paths:
+                        response = client.get(path, secure=True)
+                        if response.status_code >= 400:
+                            raise CommandError(f"{path} answered {response.status_code}.")
+        return len(queries) / (requests * len(paths))
@@ -0,0 +1,81 @@
+"""
+AuthenticationMiddleware with the logged-in user served from an in-process cache.
+
+Each process keeps the users it loaded for CACHED_USER_TIMEOUT seconds, so a
+logged-in request skips the auth_user SELECT. Every hit is still checked against
+the session's auth hash like django.contrib.auth.get_user() does. Saving a user
+(password change or reset) and logging out drop the entry in this process (see
+signals.py); other processes notice within the timeout. Together with the
+cached_db or signed_cookies session engine, an authenticated request needs no
+query before the view runs.
+"""
+import copy
+import threading
+import time
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+_users = {}
+_lock = threading.Lock()
+
+
+def forget_user(pk):
+    with _lock:
+        _users.pop(pk, None)
+
+
+def forget_all_users():
+    with _lock:
+        _users.clear()
+
+
+def get_cached_user(request):
+    if not hasattr(request, "_cached_user"):
+        request._cached_user = _load_user(request)
+    return request._cached_user
+
+
+async def aget_cached_user(request):
+    if not hasattr(request, "_cached_user"):
+        request._cached_user = await sync_to_async(_load_user)(request)
+    return request._cached_user
+
+
+def _load_user(request):
+    timeout = settings.CACHED_USER_TIMEOUT
+    try:
+        pk = auth.get_user_model()._meta.pk.to_python(request.session[auth.SESSION_KEY])
+    except KeyError:
+        return auth.get_user(request)  # anonymous
+
+    if timeout:
+        with _lock:
+            expires, user = _users.get(pk, (0, None))
+        if user is not None and expires > time.monotonic():
+            session_hash = request.session.get(auth.HASH_SESSION_KEY)
+            if (
+                request.session.get(auth.BACKEND_SESSION_KEY) == user.backend
+                and session_hash
+                and constant_time_compare(session_hash, user.get_session_auth_hash())
+            ):
+                return copy.copy(user)  # requests may change their user; the cached one stays clean
+
+    user = auth.get_user(request)  # verifies the session hash and flushes a stale session
+    if timeout and user.is_authenticated:
+        user.backend = request.session[auth.BACKEND_SESSION_KEY]
+        with _lock:
+            _users[pk] = (time.monotonic() + timeout, copy.copy(user))
+    return user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    def process_request(self, request):
+        super().process_request(request)  # keeps the check for SessionMiddleware
+        request.user = SimpleLazyObject(lambda: get_cached_user(request))
+        request.auser = partial(aget_cached_user, request)
@@ -5,6 +5,10 @@ from django.utils.http import urlsafe_base64_encode
 from django.utils.encoding import force_bytes
 from restaurants.test_restaurants.mixins import AuthMixin  # Using your factory-based mixin
 from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.test import override_settings
+from io import StringIO
+from accounts.middleware import forget_all_users
 
 User = get_user_model()
 
@@ -141,3 +145,67 @@ class TestPasswordChangeDoneView(AuthMixin, TestCase):
         url = reverse("password_change_done")
         response = self.client.get(url)
         self.assertEqual(response.status_code, 200)
+
+
+# cached_db is the default only with a shared cache; the test run is a single process.
+@override_settings(SESSION_ENGINE="django.contrib.sessions.backends.cached_db")
+class TestCachedUser(AuthMixin, TestCase):
+
+    def setUp(self):
+        super().setUp()
+        forget_all_users()
+        self.user = self.create_user()
+        self.login_user(self.user)
+        self.url = reverse("password_change")
+
+    def test_second_request_should_not_query_the_session_or_the_user(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.context["user"], self.user)
+
+    def test_password_change_should_log_out_other_sessions(self):
+        other = self.client_class()
+        other.login(username=self.user.username, password="pass123")
+        self.assertEqual(other.get(self.url).status_code, 200)
+
+        self.client.post(self.url, {
+            "old_password": "pass123",
+            "new_password1": "newpass12345",
+            "new_password2": "newpass12345"
+        })
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+        self.assertEqual(other.get(self.url).status_code, 302)
+
+    def test_logout_should_forget_the_user(self):
+        self.client.get(self.url)
+        self.client.post(reverse("logout"))
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    @override_settings(CACHED_USER_TIMEOUT=0)
+    def test_zero_timeout_should_load_the_user_every_time(self):
+        self.client.get(self.url)
+        with self.assertNumQueries(1):
+            self.client.get(self.url)
+
+    @override_settings(SESSION_ENGINE="django.contrib.sessions.backends.signed_cookies")
+    def test_signed_cookie_sessions_should_work_with_the_cached_user(self):
+        self.login_user(self.user)
+        self.client.get(self.url)
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+
+class TestAuthBenchmark(TestCase):
+
+    def test_cached_setups_should_remove_the_session_and_user_queries(self):
+        out = StringIO()
+        call_command("auth_benchmark", "--requests", "2", stdout=out)
+        rows = {line[:32].strip(): line.split()[-1] for line in out.getvalue().splitlines()[1:]}
+        self.assertEqual(rows, {
+            "db sessions": "0.00",
+            "cached_db + cached user": "2.00",
+            "signed cookies + cached user": "2.00",
+        })
+        self.assertFalse(User.objects.filter(username="auth-benchmark").exists())
@@ -0,0 +1,166 @@
+"""
+Per-request query count, database time, template render time and wall time.
+
+RequestMetricsMiddleware measures every request, sends the numbers back in a
+Server-Timing header and keeps the last SAMPLES_PER_VIEW requests of each URL name
+in memory, from which request_metrics (staff only) reports p50/p95/p99. Queries are
+counted by a database execute wrapper that reports to the request in the current
+context, so the async views' queries, which run on a worker thread, are counted too.
+The numbers are per process.
+"""
+import contextvars
+import threading
+import time
+from collections import deque
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import JsonResponse
+
+SAMPLES_PER_VIEW = 1000
+PERCENTILES = (50, 95, 99)
+
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+class RequestMetrics:
+    __slots__ = ("started", "queries", "db_time", "render_time")
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+
+
+def _record_query(execute, sql, params, many, context):
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+def _instrument(connection, **kwargs):
+    if _record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_record_query)
+
+
+connection_created.connect(_instrument)
+
+
+class RequestStats:
+    """A rolling window of (wall, db, render, queries) samples per URL name."""
+
+    def __init__(self, size=SAMPLES_PER_VIEW):
+        self.size = size
+        self._lock = threading.Lock()
+        self._samples = {}
+
+    def add(self, name, sample):
+        with self._lock:
+            if name not in self._samples:
+                self._samples[name] = deque(maxlen=self.size)
+            self._samples[name].append(sample)
+
+    def clear(self):
+        with self._lock:
+            self._samples = {}
+
+    def summary(self):
+        with self._lock:
+            samples = {name: list(window) for name, window in self._samples.items()}
+        return {
+            name: {
+                "count": len(window),
+                **{
+                    metric: {f"p{pct}": percentile(values, pct) for pct in PERCENTILES}
+                    for metric, values in zip(("wall_ms", "db_ms", "render_ms", "queries"), zip(*window))
+                },
+            }
+            for name, window in samples.items()
+        }
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+request_stats = RequestStats()
+
+
+class RequestMetricsMiddleware:
+    """Put first in MIDDLEWARE, so the wall time covers the rest of the stack."""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+        # Connections opened before this module was imported; later ones go through connection_created.
+        for connection in connections.all(initialized_only=True):
+            _instrument(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        # The outermost middleware sees the response last, right before the handler renders it.
+        metrics = _current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_time = time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, metrics):
+        wall_ms = (time.perf_counter() - metrics.started) * 1000
+        db_ms = metrics.db_time * 1000
+        render_ms = metrics.render_time * 1000
+        match = request.resolver_match
+        request_stats.add(match.view_name if match else "<unresolved>", (wall_ms, db_ms, render_ms, metrics.queries))
+        if settings.SERVER_TIMING:
+            response["Server-Timing"] = (
+                f'db;dur={db_ms:.1f};desc="{metrics.queries} queries", '
+                f"render;dur={render_ms:.1f}, total;dur={wall_ms:.1f}"
+            )
+        return response
+
+
+@staff_member_required
+def request_metrics(request):
+    """Percentiles of the recent requests per URL name, slowest p99 first."""
+    summary = request_stats.summary()
+    ordered = sorted(summary.items(), key=lambda item: item[1]["wall_ms"]["p99"], reverse=True)
+    return JsonResponse({"samples_per_view": request_stats.size, "views": dict(ordered)})
@@ -17,6 +17,16 @@ import sys
 BASE_DIR = Path(__file__).resolve().parent.parent
 MEDIA_URL = '/media/'  
 MEDIA_ROOT = BASE_DIR / 'media'
+# Uploaded photos get resized JPEG/WebP derivatives on a background thread pool
+# (restaurants/thumbnails.py); THUMBNAILS_ASYNC=False builds them inline instead.
+THUMBNAILS_ASYNC = os.environ.get('THUMBNAILS_ASYNC', 'True') == 'True'
+THUMBNAIL_WORKERS = int(os.environ.get('THUMBNAIL_WORKERS', '2'))
+# Route the hot read views and the toggles to their async versions (restaurants/async_views.py).
+# homebite/asgi.py turns this on; under WSGI the sync views avoid the async-to-sync hop.
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS', 'False') == 'True'
+# Per-request query/DB/render/wall timings go out in a Server-Timing header unless this is off;
+# staff can see the per-view percentiles at /metrics/requests/ either way.
+SERVER_TIMING = os.environ.get('SERVER_TIMING', 'True') == 'True'
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.2/howto/deployment/checklist/
 
@@ -44,11 +54,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so its wall time covers everything below it (homebite/instrumentation.py).
+    'homebite.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # AuthenticationMiddleware plus an in-process cache of the logged-in users (accounts/middleware.py).
+    'accounts.middleware.CachedAuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -86,6 +99,53 @@ DATABASES = {
     'default': dj_database_url.parse(DATABASE_URL, conn_max_age=600)
 }
 
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# template_fragments backs the {% cache %} tag (restaurant cards). Swap it for the file or
+# Redis backend by setting FRAGMENT_CACHE_BACKEND / FRAGMENT_CACHE_LOCATION, e.g.
+# django.core.cache.backends.redis.RedisCache and redis://127.0.0.1:6379/1.
+# default holds the facet counts, the cached menu pages and the version keys that tell
+# every process to reload its cuisine registry or menus, so point CACHE_BACKEND /
+# CACHE_LOCATION at a shared cache when running more than one process.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    },
+    'template_fragments': {
+        'BACKEND': os.environ.get('FRAGMENT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('FRAGMENT_CACHE_LOCATION', 'template-fragments'),
+    },
+}
+
+# True when every process sees the same default cache (Redis, Memcached, a database or file
+# cache), unlike the per-process locmem default.
+SHARED_CACHE = CACHES['default']['BACKEND'] not in (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+# How long the cuisine registry and menu version keys live. With a shared cache a write
+# reaches every process at once and they never need to expire; with locmem a write only
+# reaches its own process, so the others reload after at most this many seconds.
+CACHE_VERSION_TIMEOUT = (
+    int(os.environ['CACHE_VERSION_TIMEOUT']) if os.environ.get('CACHE_VERSION_TIMEOUT')
+    else None if SHARED_CACHE else 30
+)
+
+# Sessions are read from the database, or from the default cache with the database behind it
+# (cached_db) when that cache is shared: with locmem, a logout in one process would only drop
+# that process's copy and the others would keep the session alive. Set
+# SESSION_ENGINE=django.contrib.sessions.backends.signed_cookies to keep them in the cookie.
+# Each process reuses a loaded user for CACHED_USER_TIMEOUT seconds; 0 loads it from the
+# database on every request.
+SESSION_ENGINE = os.environ.get(
+    'SESSION_ENGINE',
+    'django.contrib.sessions.backends.cached_db' if SHARED_CACHE else 'django.contrib.sessions.backends.db',
+)
+CACHED_USER_TIMEOUT = int(os.environ.get('CACHED_USER_TIMEOUT', '60'))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -19,11 +19,13 @@ from django.urls import path
 from django.urls import include 
 from django.conf import settings
 from django.conf.urls.static import static
+from homebite.instrumentation import request_metrics
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('accounts/', include('accounts.urls')),
     path('restaurants/', include('restaurants.urls', namespace="restaurants")),
+    path('metrics/requests/', request_metrics, name='request_metrics'),
 ]
 
 if settings.DEBUG:
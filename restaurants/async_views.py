@@ -0,0 +1,180 @@
+"""
+Async versions of the hot read views and the toggle endpoints, for ASGI deployments.
+
+They reuse the configuration of their counterparts in views.py but do their database
+work with the async ORM, gathering the queries that do not depend on each other, so
+that rendering the template afterwards runs no query at all. restaurants/urls.py
+routes to these instead of the sync views when ASYNC_VIEWS is on (the default under
+homebite/asgi.py).
+"""
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from django.core.paginator import InvalidPage, Page, Paginator
+from django.db import IntegrityError
+from django.http import Http404, JsonResponse
+from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
+
+from . import views
+from .menu import MENU_CACHE_TIMEOUT
+from .models import Bookmark, Restaurant, Visited
+from .pagination import InvalidCursor, KeysetPaginator
+from .registry import cuisine_registry
+
+
+async def _prepare(request):
+    # Resolve the lazy user and refresh the cuisine snapshot up front, so the sync filter
+    # and form code below (queryset annotations, choices validation) never touches the database.
+    request.user = await request.auser()
+    await sync_to_async(cuisine_registry.snapshot)()
+
+
+async def _offset_page(queryset, page_size, page_number):
+    """Page number page_number of queryset from a COUNT and a slice that run concurrently."""
+    try:
+        number = int(page_number)
+    except (TypeError, ValueError):
+        number = None
+    bottom = (number - 1) * page_size if number and number > 0 else 0
+
+    async def rows():
+        # Iterating fills the slice's result cache, so the page holds a queryset like Paginator's would.
+        page_rows = queryset[bottom:bottom + page_size]
+        async for _ in page_rows:
+            pass
+        return page_rows
+
+    count, object_list = await asyncio.gather(queryset.acount(), rows())
+    paginator = Paginator(range(count), page_size)
+    if page_number == "last":
+        number = paginator.num_pages
+        bottom = (number - 1) * page_size
+        object_list = await rows()
+    try:
+        number = paginator.validate_number(number)
+    except InvalidPage as e:
+        raise Http404(str(e))
+    return paginator, Page(object_list, number, paginator)
+
+
+class RestaurantListView(views.RestaurantListView):
+    async def get(self, request, *args, **kwargs):
+        await _prepare(request)
+        self.filterset = self.get_filterset(self.get_filterset_class())
+        if not self.filterset.is_bound or self.filterset.is_valid() or not self.get_strict():
+            self.object_list = self.filterset.qs
+        else:
+            self.object_list = self.filterset.queryset.none()
+
+        self.pagination, _ = await asyncio.gather(
+            self.apaginate_queryset(self.object_list, self.get_paginate_by(self.object_list)),
+            sync_to_async(lambda: self.filterset.facets)(),  # cached_property, so the template reuses it
+        )
+        context = self.get_context_data(filter=self.filterset, object_list=self.object_list)
+        return self.render_to_response(context)
+
+    def paginate_queryset(self, queryset, page_size):
+        return self.pagination
+
+    async def apaginate_queryset(self, queryset, page_size):
+        if self.cursor_kwarg in self.request.GET:
+            paginator = KeysetPaginator(queryset, page_size)
+            try:
+                page = await paginator.apage(self.request.GET.get(self.cursor_kwarg) or None)
+            except InvalidCursor as e:
+                raise Http404(str(e))
+            return (paginator, page, page.object_list, page.has_other_pages())
+
+        page_number = self.kwargs.get(self.page_kwarg) or self.request.GET.get(self.page_kwarg) or 1
+        paginator, page = await _offset_page(queryset, page_size, page_number)
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+
+async def _areview_page(restaurant_id, cursor=None):
+    return await views._review_paginator(restaurant_id).apage(cursor)
+
+
+class RestaurantDetailView(views.RestaurantDetailView):
+    async def get(self, request, *args, **kwargs):
+        request.user = await request.auser()
+        pk = self.kwargs[self.pk_url_kwarg]
+        # The restaurant and its first page of reviews only share the pk, so fetch them side by side.
+        try:
+            self.object, reviews = await asyncio.gather(self.get_queryset().aget(pk=pk), _areview_page(pk))
+        except Restaurant.DoesNotExist:
+            raise Http404("No restaurant found matching the query")
+
+        # Skip the sync get_context_data, which would query the reviews again.
+        context = super(views.RestaurantDetailView, self).get_context_data(object=self.object)
+        context["reviews"] = reviews
+        context["rating_stats"] = self.object.get_rating_stats()
+        return self.render_to_response(context)
+
+
+class FoodListView(views.FoodListView):
+    async def get(self, request, *args, **kwargs):
+        await sync_to_async(cuisine_registry.snapshot)()
+        key, foods = await sync_to_async(self.get_menu_key)()  # reads the menu version from the cache
+        menu = await cache.aget(key) if key else None
+        if menu is None:
+            menu = await self.aload_menu(foods)
+            if key:
+                await cache.aset(key, menu, MENU_CACHE_TIMEOUT)
+        return self.render_menu(menu)
+
+    async def aload_menu(self, foods):
+        restaurant_id = self.kwargs['restaurant_id']
+        page_number = str(self.page_number)
+        if not page_number.isdigit() or page_number == "0":
+            page_number = 1  # Paginator.get_page() shows the first page for junk numbers...
+
+        async def menu_page():
+            try:
+                return await _offset_page(foods, self.paginate_by, page_number)
+            except Http404:
+                return await _offset_page(foods, self.paginate_by, "last")  # ...and the last one past the end
+
+        restaurant, (paginator, page) = await asyncio.gather(
+            Restaurant.objects.only('name').filter(pk=restaurant_id).afirst(), menu_page()
+        )
+        if restaurant is None:
+            raise Http404("No restaurant found matching the query")
+        return {
+            'restaurant': restaurant,
+            'foods': list(page.object_list),
+            'number': page.number,
+            'count': paginator.count,
+        }
+
+
+async def _atoggle(model, user, restaurant_id):
+    # Same two statements as views._toggle.
+    deleted, _ = await model.objects.filter(user=user, restaurant_id=restaurant_id).adelete()
+    if deleted:
+        return False
+    await model.objects.abulk_create([model(user=user, restaurant_id=restaurant_id)], ignore_conflicts=True)
+    return True
+
+
+async def _atoggle_view(request, model, state_key):
+    user = await request.auser()
+    try:
+        restaurant_id = views._parse_restaurant_id(request.POST.get("restaurant_id"))
+        state = await _atoggle(model, user, restaurant_id)
+    except (TypeError, ValueError, IntegrityError):
+        return JsonResponse({"error": "Invalid restaurant ID"}, status=400)
+    return JsonResponse({state_key: state})
+
+
+@require_POST
+@login_required
+async def toggle_bookmark(request):
+    return await _atoggle_view(request, Bookmark, "bookmarked")
+
+
+@require_POST
+@login_required
+async def toggle_visited(request):
+    return await _atoggle_view(request, Visited, "visited")
@@ -0,0 +1,44 @@
+"""
+Cache bookkeeping for the filter dropdown counts (RestaurantFilter.facets).
+
+Entries are keyed by the normalized filters plus a version number that the signals
+bump on every catalogue change, so a write makes all cached counts unreachable at
+once. The short timeout bounds staleness for what the signals cannot see, such as
+open_now drifting with the clock or writes from another process when the cache is
+process-local.
+"""
+import hashlib
+import json
+import time
+
+from django.core.cache import cache
+
+FACET_CACHE_TIMEOUT = 60
+VERSION_KEY = "restaurant_facets:version"
+
+
+def facets_version():
+    return cache.get_or_set(VERSION_KEY, time.time_ns(), None)
+
+
+def invalidate_facets():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:  # evicted or never set; any fresh value orphans the old entries
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def facets_cache_key(filters):
+    return f"restaurant_facets:{facets_version()}:{filters_digest(filters)}"
+
+
+def filters_digest(filters):
+    """Digest of a {filter name: cleaned value} mapping, independent of order and empty values."""
+    normalized = {}
+    for name, value in filters.items():
+        if value in (None, "", [], ()):
+            continue
+        if isinstance(value, (list, tuple, set)) or hasattr(value, "model"):
+            value = sorted(str(getattr(item, "pk", item)) for item in value)
+        normalized[name] = value
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True, default=str).encode()).hexdigest()[:32]
@@ -1,8 +1,69 @@
+from decimal import Decimal
+
 import django_filters
 from django import forms
-from .models import Restaurant, DietType, Cuisine
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .models import Food, Restaurant, DietType
+from . import geo
+from .facets import FACET_CACHE_TIMEOUT, facets_cache_key
+from .registry import cuisine_choices
+
+
+def validate_point(value):
+    try:
+        geo.parse_point(value)
+    except ValueError:
+        raise ValidationError("Enter a location as latitude,longitude.")
+
+
+STARS = range(1, 6)
+
+
+class RatingBucketFilter(django_filters.MultipleChoiceFilter):
+    """
+    Star buckets over a rating field as half-open ranges, "4" meaning [4.0, 5.0) and the
+    top star open-ended. Adjacent stars merge into one range, so any selection is at most
+    a few range scans of the rating index rather than an OR of exact matches.
+    """
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("choices", [(star, star) for star in STARS])
+        super().__init__(*args, **kwargs)
+
+    def filter(self, qs, value):
+        if not value:
+            return qs
+        return qs.filter(self.bucket_q(value))
+
+    def bucket_q(self, values):
+        q = Q()
+        for low, high in self.ranges(values):
+            bounds = {f"{self.field_name}__gte": low}
+            if high is not None:
+                bounds[f"{self.field_name}__lt"] = high
+            q |= Q(**bounds)
+        return q
+
+    @staticmethod
+    def ranges(values):
+        """[(low, high)] covering the selected stars, high being None for an open-ended range."""
+        ranges = []
+        for star in sorted({int(value) for value in values}):
+            if ranges and ranges[-1][1] == star:
+                ranges[-1][1] = star + 1
+            else:
+                ranges.append([star, star + 1])
+        return [(Decimal(low), Decimal(high) if high <= max(STARS) else None) for low, high in ranges]
+
+
 class RestaurantFilter(django_filters.FilterSet):
 
+    q = django_filters.CharFilter(method="search", label="Search")
+
     cost_for_two_min = django_filters.NumberFilter(field_name="cost_for_two", lookup_expr="gte")
     cost_for_two_max = django_filters.NumberFilter(field_name="cost_for_two", lookup_expr="lte")
 
@@ -11,19 +72,32 @@ class RestaurantFilter(django_filters.FilterSet):
         widget=forms.CheckboxSelectMultiple
     )
 
-    cuisines = django_filters.ModelMultipleChoiceFilter(
-        queryset=Cuisine.objects.all(),
+    # Choices and validation come from the in-process cuisine registry rather than a query per request.
+    cuisines = django_filters.TypedMultipleChoiceFilter(
+        choices=cuisine_choices,
+        coerce=int,
         widget=forms.CheckboxSelectMultiple
     )
 
-    rating = django_filters.MultipleChoiceFilter(
-        field_name="average_rating",
-        choices=[(n, n) for n in range(1, 6)],  # 1 to 5 stars
-        lookup_expr="exact"
+    rating = RatingBucketFilter(field_name="average_rating")
+    min_rating = django_filters.NumberFilter(
+        field_name="average_rating", lookup_expr="gte", min_value=0, max_value=5, label="Minimum rating"
     )
 
     is_spotlight = django_filters.BooleanFilter(field_name="is_spotlight")
+
+    open_now = django_filters.BooleanFilter(method="filter_open_now")
+    open_at = django_filters.TimeFilter(method="filter_open_at", label="Open at (HH:MM)")
+
+    near = django_filters.CharFilter(method="filter_near", label="Near (lat,lng)", validators=[validate_point])
+    radius_km = django_filters.NumberFilter(
+        method="filter_radius_km", min_value=0.1, max_value=geo.MAX_RADIUS_KM, label="Within (km)"
+    )
     
+    # The request user's own bookmarks/visits; ?bookmarked=1 like a ticked checkbox.
+    bookmarked = django_filters.BooleanFilter(method="filter_saved", widget=forms.CheckboxInput, label="My bookmarks")
+    visited = django_filters.BooleanFilter(method="filter_saved", widget=forms.CheckboxInput, label="Visited")
+
     sort_by = django_filters.ChoiceFilter(
         method="sort_by_price",
         choices=[
@@ -44,7 +118,117 @@ class RestaurantFilter(django_filters.FilterSet):
 
     class Meta:
         model = Restaurant
-        fields = ['cost_for_two_min', 'cost_for_two_max', 'diet_type', 'cuisines', 'rating', 'is_spotlight']
+        fields = ['q', 'cost_for_two_min', 'cost_for_two_max', 'diet_type', 'cuisines', 'rating', 'min_rating', 'is_spotlight',
+                  'open_now', 'open_at', 'near', 'radius_km', 'bookmarked', 'visited']
+
+    FACETS = ("diet_type", "cuisines", "rating")
+    SORTS = ("sort_by", "sort_by_rating")
+    SAVED = {"bookmarked": "bookmarked_by", "visited": "visited_by"}
+
+    @cached_property
+    def facets(self):
+        """
+        {facet: [(value, label, count), ...]} for the diet type, cuisine and rating dropdowns.
+        Each facet is counted under all the other filters but not its own selection, so the
+        counts say what ticking one more box would add.
+        """
+        if not self.is_bound:
+            filters = {}
+        elif self.is_valid():
+            filters = {name: value for name, value in self.form.cleaned_data.items() if name not in self.SORTS}
+        else:
+            return {}
+        if any(filters.get(name) for name in self.SAVED):
+            return self.count_facets(filters)  # per user, so not worth sharing through the cache
+        key = facets_cache_key(filters)
+        facets = cache.get(key)
+        if facets is None:
+            facets = self.count_facets(filters)
+            cache.set(key, facets, FACET_CACHE_TIMEOUT)
+        return facets
+
+    def count_facets(self, filters):
+        # Two queries whatever the number of options: conditional aggregates over the restaurants
+        # for the diet types and ratings, and one grouped count for the cuisines.
+        base = Restaurant.objects.all()
+        for name, value in filters.items():
+            if name not in self.FACETS:
+                base = self.filters[name].filter(base, value)
+
+        def selected(name):
+            return self.facet_q(name, filters[name]) if filters.get(name) else Q()
+
+        diet_choices = list(DietType.choices)
+        rating_choices = self.filters["rating"].extra["choices"]
+        aggregates = {}
+        for value, _ in diet_choices:
+            condition = self.facet_q("diet_type", [value]) & selected("rating") & selected("cuisines")
+            aggregates[f"diet_type_{value}"] = Count("pk", filter=condition)
+        for value, _ in rating_choices:
+            condition = self.facet_q("rating", [value]) & selected("diet_type") & selected("cuisines")
+            aggregates[f"rating_{value}"] = Count("pk", filter=condition)
+        counts = base.order_by().aggregate(**aggregates)
+        matching = base.filter(selected("diet_type") & selected("rating")).values("pk")
+        cuisine_counts = dict(
+            Restaurant.cuisines.through.objects.filter(restaurant__in=matching)
+            .values_list("cuisine_id").annotate(count=Count("pk")).order_by()
+        )
+
+        return {
+            "diet_type": [(value, label, counts[f"diet_type_{value}"]) for value, label in diet_choices],
+            "cuisines": [(pk, name, cuisine_counts.get(pk, 0)) for pk, name in cuisine_choices()],
+            "rating": [(value, label, counts[f"rating_{value}"]) for value, label in rating_choices],
+        }
+
+    def facet_q(self, name, values):
+        """Q matching restaurants that pass the facet filter with any of values."""
+        if name == "cuisines":
+            through = Restaurant.cuisines.through.objects.filter(cuisine__in=values)
+            return Q(pk__in=through.values("restaurant_id"))
+        facet = self.filters[name]
+        if isinstance(facet, RatingBucketFilter):
+            return facet.bucket_q(values)
+        q = Q()
+        for value in values:
+            q |= Q(**{f"{facet.field_name}__{facet.lookup_expr}": value})
+        return q
+
+    def search(self, queryset, name, value):
+        # Ranked by relevance; the sort filters below are applied afterwards and win if chosen.
+        return queryset.search(value).order_by("-search_rank")
+
+    def filter_open_now(self, queryset, name, value):
+        if value is None:
+            return queryset
+        now = timezone.localtime().time()
+        open_now = queryset.open_at(now)
+        return open_now if value else queryset.exclude(pk__in=open_now.values("pk"))
+
+    def filter_open_at(self, queryset, name, value):
+        return queryset.open_at(value)
+
+    def filter_near(self, queryset, name, value):
+        # Nearest first, like search relevance; an explicit sort below still wins.
+        latitude, longitude = geo.parse_point(value)
+        radius_km = float(self.form.cleaned_data.get("radius_km") or geo.DEFAULT_RADIUS_KM)
+        return queryset.nearby(latitude, longitude, radius_km).order_by("distance_km")
+
+    def filter_radius_km(self, queryset, name, value):
+        return queryset  # only read by filter_near
+
+    def filter_saved(self, queryset, name, value):
+        # Most recently saved first, read through the (user, created_at) index; an explicit sort still wins.
+        if not value:
+            return queryset
+        user = getattr(self.request, "user", None)
+        if user is None or not user.is_authenticated:
+            return queryset.none()
+        relation = self.SAVED[name]
+        return (
+            queryset.filter(**{f"{relation}__user": user})
+            .annotate(**{f"{name}_at": F(f"{relation}__created_at")})
+            .order_by(f"-{name}_at")
+        )
 
     def sort_by_price(self, queryset, name, value):
         if value == "price_low":
@@ -60,3 +244,25 @@ class RestaurantFilter(django_filters.FilterSet):
             return queryset.order_by("average_rating")
         return queryset
 
+
+
+class FoodFilter(django_filters.FilterSet):
+    q = django_filters.CharFilter(field_name="name", lookup_expr="icontains", label="Search")
+
+    price_min = django_filters.NumberFilter(field_name="price", lookup_expr="gte")
+    price_max = django_filters.NumberFilter(field_name="price", lookup_expr="lte")
+
+    diet_type = django_filters.MultipleChoiceFilter(
+        choices=DietType.choices,
+        widget=forms.CheckboxSelectMultiple
+    )
+
+    cuisines = django_filters.TypedMultipleChoiceFilter(
+        choices=cuisine_choices,
+        coerce=int,
+        widget=forms.CheckboxSelectMultiple
+    )
+
+    class Meta:
+        model = Food
+        fields = ['q', 'price_min', 'price_max', 'diet_type', 'cuisines']
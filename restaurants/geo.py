@@ -0,0 +1,83 @@
+"""
+"Near me" lookups without a GIS extension.
+
+Every restaurant with coordinates is put in a cell of a fixed latitude/longitude grid,
+numbered row by row so that the cells of one grid row form a contiguous integer range.
+A radius search turns into a few indexed geo_cell ranges (one per grid row the search
+circle touches), and only those candidates get the exact haversine distance.
+"""
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+CELL_DEGREES = 0.05  # ~5.5 km of latitude
+GRID_ROWS = round(180 / CELL_DEGREES)
+GRID_COLUMNS = round(360 / CELL_DEGREES)
+
+DEFAULT_RADIUS_KM = 5
+MAX_RADIUS_KM = 50
+
+
+def _row(latitude):
+    return min(int((latitude + 90) // CELL_DEGREES), GRID_ROWS - 1)
+
+
+def _column(longitude):
+    return int(((longitude + 180) % 360) // CELL_DEGREES) % GRID_COLUMNS
+
+
+def check_point(latitude, longitude):
+    # Outside these the grid numbering breaks, e.g. a negative cell below -90.
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        raise ValueError(f"({latitude}, {longitude}) is not a valid coordinate.")
+
+
+def geo_cell(latitude, longitude):
+    if latitude is None or longitude is None:
+        return None
+    check_point(latitude, longitude)
+    return _row(latitude) * GRID_COLUMNS + _column(longitude)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(south, north, west, east) degrees around the circle; west > east when it wraps the antimeridian."""
+    lat_delta = radius_km / KM_PER_DEGREE
+    south, north = max(latitude - lat_delta, -90), min(latitude + lat_delta, 90)
+    # Longitude degrees shrink towards the poles; use the widest point of the box.
+    widest = math.cos(math.radians(min(max(abs(south), abs(north)), 89.9)))
+    lng_delta = radius_km / (KM_PER_DEGREE * widest)
+    if lng_delta >= 180:
+        return south, north, -180, 180
+    west, east = longitude - lng_delta, longitude + lng_delta
+    return south, north, (west + 180) % 360 - 180, (east + 180) % 360 - 180
+
+
+def cell_ranges(latitude, longitude, radius_km):
+    """Inclusive (first, last) geo_cell ranges covering the circle's bounding box."""
+    south, north, west, east = bounding_box(latitude, longitude, radius_km)
+    first, last = _column(west), _column(east)
+    if (west, east) == (-180, 180):
+        columns = [(0, GRID_COLUMNS - 1)]
+    elif first <= last:
+        columns = [(first, last)]
+    else:  # wraps around to the first grid columns
+        columns = [(first, GRID_COLUMNS - 1), (0, last)]
+
+    return [
+        (row * GRID_COLUMNS + first, row * GRID_COLUMNS + last)
+        for row in range(_row(south), _row(north) + 1)
+        for first, last in columns
+    ]
+
+
+def haversine_km(lat1, lng1, lat2, lng2):
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+def parse_point(value):
+    """Parse "lat,lng" into a (latitude, longitude) tuple of floats, or raise ValueError."""
+    latitude, longitude = (float(part) for part in str(value).split(","))
+    check_point(latitude, longitude)
+    return latitude, longitude
@@ -0,0 +1,72 @@
+import csv
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from restaurants.geo import check_point, geo_cell
+from restaurants.models import Restaurant
+
+
+def normalize(value):
+    return " ".join(str(value or "").lower().split())
+
+
+def read_gazetteer(path):
+    """
+    Map normalized (city, address) and (city, "") to (latitude, longitude) from a CSV with
+    city, latitude and longitude columns and an optional address column.
+    """
+    places = {}
+    try:
+        with open(path, newline="", encoding="utf-8") as f:
+            for line, row in enumerate(csv.DictReader(f), start=2):
+                try:
+                    point = (float(row["latitude"]), float(row["longitude"]))
+                    check_point(*point)
+                    key = (normalize(row["city"]), normalize(row.get("address")))
+                except (KeyError, TypeError, ValueError) as e:
+                    raise CommandError(f"{path}:{line}: invalid gazetteer row ({e}).")
+                places[key] = point
+    except OSError as e:
+        raise CommandError(str(e))
+    return places
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill in restaurant coordinates from a local CSV gazetteer (city, latitude, longitude and "
+        "an optional address column). Rows with an address win over the city-wide row."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="Gazetteer CSV file.")
+        parser.add_argument(
+            "--overwrite", action="store_true", help="Also replace coordinates that are already set."
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        places = read_gazetteer(options["path"])
+        restaurants = Restaurant.objects.only("id", "city", "address", "latitude", "longitude")
+        if not options["overwrite"]:
+            restaurants = restaurants.filter(latitude__isnull=True)
+
+        updated = unmatched = last_pk = 0
+        # Walk the table in pk order a batch at a time, so no cursor is open while rows are written.
+        while chunk := list(restaurants.filter(pk__gt=last_pk).order_by("pk")[:options["batch_size"]]):
+            last_pk = chunk[-1].pk
+            located = []
+            for restaurant in chunk:
+                city = normalize(restaurant.city)
+                point = places.get((city, normalize(restaurant.address))) or places.get((city, ""))
+                if point is None:
+                    unmatched += 1
+                    continue
+                restaurant.latitude, restaurant.longitude = point
+                restaurant.geo_cell = geo_cell(*point)
+                restaurant.updated_at = timezone.now()  # keeps the API's ETag honest
+                located.append(restaurant)
+            Restaurant.objects.bulk_update(located, ["latitude", "longitude", "geo_cell", "updated_at"])
+            updated += len(located)
+
+        self.stdout.write(self.style.SUCCESS(f"Located {updated} restaurants; {unmatched} had no gazetteer match."))
+
@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from restaurants.models import Restaurant, RATING_HISTOGRAM_FIELDS
+from .rebuild_rating_aggregates import find_rating_drift
+
+
+class Command(BaseCommand):
+    help = "Compare each restaurant's stored star histogram with the live reviews table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--fix",
+            action="store_true",
+            help="Overwrite mismatched histograms with the live counts instead of failing.",
+        )
+
+    def handle(self, *args, **options):
+        mismatched = []
+        for restaurant, expected in find_rating_drift(fields=RATING_HISTOGRAM_FIELDS):
+            stored = [getattr(restaurant, field) for field in RATING_HISTOGRAM_FIELDS]
+            live = [expected[field] for field in RATING_HISTOGRAM_FIELDS]
+            self.stdout.write(f"{restaurant.pk} {restaurant.name}: stored {stored}, live {live}")
+            for field in RATING_HISTOGRAM_FIELDS:
+                setattr(restaurant, field, expected[field])
+            mismatched.append(restaurant)
+
+        if not mismatched:
+            self.stdout.write(self.style.SUCCESS("All star histograms match the reviews table."))
+            return
+        if not options["fix"]:
+            raise CommandError(f"{len(mismatched)} restaurant(s) have a stale star histogram.")
+
+        Restaurant.objects.bulk_update(mismatched, RATING_HISTOGRAM_FIELDS, batch_size=500)
+        self.stdout.write(self.style.SUCCESS(f"Fixed the star histogram of {len(mismatched)} restaurant(s)."))
@@ -0,0 +1,223 @@
+import math
+import random
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import time as dt_time
+from multiprocessing import get_context
+
+import django
+import factory.random
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from restaurants.facets import invalidate_facets
+from restaurants.models import (
+    Bookmark, Cuisine, DietType, Food, Restaurant, RestaurantImage, Review, Visited, rating_aggregates,
+)
+from restaurants.registry import cuisine_registry
+from restaurants.test_restaurants.factories import (
+    CuisineFactory, FoodFactory, RestaurantFactory, RestaurantImageFactory, ReviewFactory, UserFactory,
+)
+
+CUISINE_NAMES = [
+    "North Indian", "South Indian", "Chinese", "Italian", "Mexican", "Thai", "Japanese", "Continental",
+    "Mughlai", "Street Food", "Biryani", "Desserts", "Cafe", "Bakery", "Seafood", "Korean",
+]
+# Cities the restaurants cluster around, so the "near me" search finds realistic neighbourhoods.
+CENTERS = [(12.97, 77.59), (19.08, 72.88), (28.61, 77.21), (13.08, 80.27), (17.39, 78.49), (22.57, 88.36)]
+TABLES = [Restaurant, Restaurant.cuisines.through, Food, Food.cuisines.through, RestaurantImage, Review, Bookmark, Visited]
+
+
+def around(rng, mean):
+    """A count that averages mean."""
+    return rng.randint(0, 2 * mean) if mean else 0
+
+
+def generate_shard(shard, plan):
+    """
+    Build one shard of restaurants, with their cuisines, menus, images, reviews, bookmarks
+    and visits, and bulk insert it. Everything random comes from the seed and the shard
+    number, so a shard holds the same rows whichever process generates it.
+    """
+    seed = f"{plan['seed']}:{shard}"
+    rng = random.Random(seed)
+    factory.random.reseed_random(seed)  # the factories' Faker fields
+    FoodFactory.reset_sequence(0)
+
+    users = [User(pk=pk) for pk in plan["user_ids"]]
+    start = shard * plan["shard_size"]
+    stop = min(start + plan["shard_size"], plan["restaurants"])
+
+    restaurants, restaurant_cuisines, foods, food_cuisines, images, reviews, bookmarks, visits = ([] for _ in range(8))
+    for index in range(start, stop):
+        opening = rng.choice([7, 8, 9, 11, 12, 17, 18])
+        latitude, longitude = rng.choice(CENTERS)
+        restaurant = RestaurantFactory.build(
+            name=f"Restaurant {plan['prefix']}-{index}",
+            cost_for_two=rng.randrange(100, 3001, 50),
+            diet_type=rng.choice(DietType.values),
+            opening_time=dt_time(opening),
+            closing_time=dt_time((opening + rng.choice([8, 10, 12, 14, 17])) % 24),
+            is_spotlight=rng.random() < 0.02,
+            latitude=round(latitude + rng.uniform(-0.15, 0.15), 6),
+            longitude=round(longitude + rng.uniform(-0.15, 0.15), 6),
+        )
+        # What save() and the review signals would have stored.
+        restaurant.derive_fields()
+        reviewers = rng.sample(users, min(around(rng, plan["reviews_per"]), len(users)))
+        quality = rng.gauss(3.8, 0.6)
+        ratings = [min(5, max(1, round(rng.gauss(quality, 1.0)))) for _ in reviewers]
+        for field, value in rating_aggregates(Counter(ratings)).items():
+            setattr(restaurant, field, value)
+        restaurants.append(restaurant)
+
+        cuisine_ids = rng.sample(plan["cuisine_ids"], min(rng.randint(1, 3), len(plan["cuisine_ids"])))
+        restaurant_cuisines += [(restaurant, cuisine_id) for cuisine_id in cuisine_ids]
+        for _ in range(around(rng, plan["foods_per"])):
+            food = FoodFactory.build(
+                restaurant=restaurant, price=rng.randrange(60, 801, 10), diet_type=rng.choice(DietType.values),
+            )
+            foods.append(food)
+            food_cuisines.append((food, rng.choice(cuisine_ids)))
+        # The files don't exist, so thumbnails_for stays empty like an image still waiting for rebuild_thumbnails.
+        images += [
+            RestaurantImageFactory.build(restaurant=restaurant, image=f"restaurant_images/{plan['prefix']}-{index}-{n}.jpg")
+            for n in range(plan["images_per"])
+        ]
+        reviews += [
+            ReviewFactory.build(user=user, restaurant=restaurant, rating=rating)
+            for user, rating in zip(reviewers, ratings)
+        ]
+        # Nothing but the two keys, so the factories would only add overhead.
+        bookmarks += [
+            Bookmark(user=user, restaurant=restaurant)
+            for user in rng.sample(users, min(around(rng, plan["bookmarks_per"]), len(users)))
+        ]
+        visits += [
+            Visited(user=user, restaurant=restaurant)
+            for user in rng.sample(users, min(around(rng, plan["bookmarks_per"]), len(users)))
+        ]
+
+    batch_size = plan["batch_size"]
+    with transaction.atomic():
+        # bulk_create fills in the restaurant and food ids the rows built above point at.
+        Restaurant.objects.bulk_create(restaurants, batch_size=batch_size)
+        Restaurant.cuisines.through.objects.bulk_create([
+            Restaurant.cuisines.through(restaurant_id=restaurant.pk, cuisine_id=cuisine_id)
+            for restaurant, cuisine_id in restaurant_cuisines
+        ], batch_size=batch_size)
+        Food.objects.bulk_create(foods, batch_size=batch_size)
+        Food.cuisines.through.objects.bulk_create([
+            Food.cuisines.through(food_id=food.pk, cuisine_id=cuisine_id) for food, cuisine_id in food_cuisines
+        ], batch_size=batch_size)
+        RestaurantImage.objects.bulk_create(images, batch_size=batch_size)
+        Review.objects.bulk_create(reviews, batch_size=batch_size)
+        Bookmark.objects.bulk_create(bookmarks, batch_size=batch_size)
+        Visited.objects.bulk_create(visits, batch_size=batch_size)
+        Restaurant.objects.filter(pk__in=[restaurant.pk for restaurant in restaurants]).refresh_search_documents()
+
+    return {
+        "restaurants": len(restaurants), "foods": len(foods), "images": len(images),
+        "reviews": len(reviews), "bookmarks": len(bookmarks), "visits": len(visits),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a synthetic catalogue for load testing from the test factories: cuisines, users and "
+        "restaurants with menus, images, reviews, bookmarks and visits, bulk inserted in shards of "
+        "restaurants that a process pool fills in parallel. The rating aggregates, opening minutes, geo "
+        "cells and search documents are stored as the models would store them. The same --seed gives "
+        "the same data. Image files are not created."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--restaurants", type=int, default=1000)
+        parser.add_argument("--reviews-per", type=int, default=50, help="Average reviews per restaurant.")
+        parser.add_argument("--foods-per", type=int, default=10, help="Average menu size.")
+        parser.add_argument("--images-per", type=int, default=2)
+        parser.add_argument("--bookmarks-per", type=int, default=5, help="Average bookmarks, and visits, per restaurant.")
+        parser.add_argument("--users", type=int, help="Default: enough for the busiest restaurant, at least 1000.")
+        parser.add_argument("--cuisines", type=int, default=len(CUISINE_NAMES))
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--prefix", default="gen", help="Makes the restaurant names and usernames unique per dataset.")
+        parser.add_argument("--shard-size", type=int, default=500, help="Restaurants per shard and transaction.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--workers", type=int, default=1, help="Processes generating shards (PostgreSQL only).")
+
+    def handle(self, *args, **options):
+        for name in ("restaurants", "shard_size", "batch_size", "workers", "cuisines"):
+            if options[name] < 1:
+                raise CommandError(f"--{name.replace('_', '-')} must be positive.")
+        for name in ("reviews_per", "foods_per", "images_per", "bookmarks_per"):
+            if options[name] < 0:
+                raise CommandError(f"--{name.replace('_', '-')} can't be negative.")
+        prefix = options["prefix"]
+        if (
+            Restaurant.objects.filter(name=f"Restaurant {prefix}-0").exists()
+            or User.objects.filter(username=f"{prefix}-user0").exists()
+        ):
+            raise CommandError(f"A dataset with the prefix {prefix!r} exists already; pick another --prefix.")
+        user_count = options["users"] or max(1000, 2 * options["reviews_per"], 2 * options["bookmarks_per"])
+
+        started = time.monotonic()
+        with transaction.atomic():
+            cuisine_ids = self.create_cuisines(options["cuisines"])
+            user_ids = self.create_users(prefix, user_count, options["batch_size"])
+        self.stdout.write(f"{len(cuisine_ids)} cuisines and {len(user_ids)} users ready.")
+
+        plan = {
+            "seed": options["seed"], "prefix": prefix, "restaurants": options["restaurants"],
+            "shard_size": options["shard_size"], "batch_size": options["batch_size"],
+            "reviews_per": options["reviews_per"], "foods_per": options["foods_per"],
+            "images_per": options["images_per"], "bookmarks_per": options["bookmarks_per"],
+            "cuisine_ids": cuisine_ids, "user_ids": user_ids,
+        }
+        shards = range(math.ceil(options["restaurants"] / options["shard_size"]))
+        totals = Counter()
+        for counts in self.run_shards(shards, plan, options["workers"]):
+            totals.update(counts)
+            rate = sum(totals.values()) / max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f"{totals['restaurants']} restaurants, {totals['reviews']} reviews ({rate:.0f} rows/s)")
+
+        invalidate_facets()
+        cuisine_registry.invalidate()  # bulk_create sends no post_save
+        if connection.vendor == "postgresql":
+            # Fresh planner statistics, also read by the admin's EstimatedCountPaginator.
+            with connection.cursor() as cursor:
+                for model in (User, *TABLES):
+                    cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+        summary = ", ".join(f"{count} {name}" for name, count in totals.items())
+        self.stdout.write(self.style.SUCCESS(f"Generated {summary} in {time.monotonic() - started:.1f}s."))
+
+    def create_cuisines(self, count):
+        names = CUISINE_NAMES[:count] + [f"Cuisine {n}" for n in range(len(CUISINE_NAMES), count)]
+        Cuisine.objects.bulk_create([CuisineFactory.build(name=name) for name in names], ignore_conflicts=True)
+        return list(Cuisine.objects.filter(name__in=names).order_by("name").values_list("id", flat=True))
+
+    def create_users(self, prefix, count, batch_size):
+        password = make_password("pass123")  # hashed once, not per user; the factories' password
+        users = []
+        for n in range(count):
+            user = UserFactory.build(username=f"{prefix}-user{n}", password=None)  # None skips the hashing
+            user.password = password
+            users.append(user)
+        return [user.pk for user in User.objects.bulk_create(users, batch_size=batch_size)]
+
+    def run_shards(self, shards, plan, workers):
+        if workers > 1 and connection.vendor == "sqlite":
+            self.stdout.write("SQLite allows a single writer; generating the shards in this process.")
+            workers = 1
+        if workers == 1:
+            for shard in shards:
+                yield generate_shard(shard, plan)
+            return
+
+        connections.close_all()  # the workers open their own
+        # spawn, not fork: a forked child would share this process's connections and locks.
+        with ProcessPoolExecutor(workers, mp_context=get_context("spawn"), initializer=django.setup) as pool:
+            futures = [pool.submit(generate_shard, shard, plan) for shard in shards]
+            for future in as_completed(futures):
+                yield future.result()
@@ -0,0 +1,257 @@
+import csv
+import json
+import time
+from datetime import time as dt_time
+from decimal import Decimal
+from itertools import islice
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+from restaurants.facets import invalidate_facets
+from restaurants.menu import invalidate_menus
+from restaurants.registry import cuisine_registry
+from restaurants.models import Cuisine, DietType, Food, ImportCheckpoint, Restaurant, RestaurantImage
+
+RESTAURANT_UPDATE_FIELDS = [
+    'city', 'address', 'cost_for_two', 'diet_type', 'opening_time', 'closing_time', 'opening_minute',
+    'closing_minute', 'latitude', 'longitude', 'geo_cell', 'is_spotlight', 'updated_at',
+]
+FOOD_UPDATE_FIELDS = ['price', 'diet_type', 'description', 'image', 'updated_at']
+DIET_TYPES_BY_LABEL = {label.lower(): value for value, label in DietType.choices}
+
+
+def read_records(path):
+    """Stream dicts from a .jsonl or .csv file; CSV list columns are '|' separated."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if Path(path).suffix.lower() == '.csv':
+            for row in csv.DictReader(f):
+                record = {key: value for key, value in row.items() if value not in ('', None)}
+                record['cuisines'] = [name for name in record.get('cuisines', '').split('|') if name]
+                yield record
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def parse_diet_type(value):
+    if value is None:
+        return DietType.VEG
+    if str(value).isdigit():
+        return DietType(int(value))
+    return DIET_TYPES_BY_LABEL[str(value).lower()]
+
+
+def parse_coordinate(value):
+    return float(value) if value not in (None, '') else None
+
+
+def parse_bool(value):
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+class CatalogueImporter:
+    """Upserts one batch of mixed catalogue records at a time with a handful of bulk queries."""
+
+    def __init__(self):
+        # Cuisine names are few, so they stay resolved for the whole run; restaurants are looked up per batch.
+        self.cuisine_ids = dict(Cuisine.objects.values_list('name', 'id'))
+
+    def resolve_cuisines(self, names):
+        missing = {name for name in names if name not in self.cuisine_ids}
+        if missing:
+            Cuisine.objects.bulk_create([Cuisine(name=name) for name in missing], ignore_conflicts=True)
+            self.cuisine_ids.update(Cuisine.objects.filter(name__in=missing).values_list('name', 'id'))
+            transaction.on_commit(cuisine_registry.invalidate)  # bulk_create sends no post_save
+
+    def import_batch(self, records):
+        """Import the records; returns how many of the foods and images have a photo."""
+        by_type = {'cuisine': [], 'restaurant': [], 'food': [], 'image': []}
+        for number, record in records:
+            kind = record.get('type')
+            if kind not in by_type:
+                raise CommandError(f"Record {number}: unknown type {kind!r}.")
+            by_type[kind].append((number, record))
+
+        self.resolve_cuisines(
+            [record['name'] for _, record in by_type['cuisine']]
+            + [name for kind in ('restaurant', 'food') for _, record in by_type[kind] for name in record.get('cuisines', [])]
+        )
+        touched = set(self.import_restaurants(by_type['restaurant']))
+        restaurant_ids = self.restaurant_ids(by_type['food'] + by_type['image'])
+        foods = self.import_foods(by_type['food'], restaurant_ids)
+        images = self.import_images(by_type['image'], restaurant_ids)
+        touched |= {row.restaurant_id for row in foods + images}
+
+        # bulk_create skips the model signals, so do their work once for the whole batch.
+        restaurants = Restaurant.objects.filter(pk__in=touched)
+        restaurants.touch()
+        restaurants.refresh_search_documents()
+        transaction.on_commit(lambda: invalidate_menus(touched))
+        # No thumbnails here: queueing them per batch would grow without bound on a large catalogue.
+        return sum(1 for row in foods + images if row.image)
+
+    def import_restaurants(self, records):
+        rows = {}
+        for number, record in records:
+            try:
+                restaurant = Restaurant(
+                    name=record['name'],
+                    city=record['city'],
+                    address=record.get('address', ''),
+                    cost_for_two=int(record.get('cost_for_two', 0)),
+                    diet_type=parse_diet_type(record.get('diet_type')),
+                    opening_time=dt_time.fromisoformat(record['opening_time']),
+                    closing_time=dt_time.fromisoformat(record['closing_time']),
+                    is_spotlight=parse_bool(record.get('is_spotlight', False)),
+                    latitude=parse_coordinate(record.get('latitude')),
+                    longitude=parse_coordinate(record.get('longitude')),
+                )
+                restaurant.derive_fields()  # save() and its pre_save signal are bypassed by bulk_create
+            except (KeyError, ValueError) as e:
+                raise CommandError(f"Record {number}: invalid restaurant ({e}).")
+            rows[record['name']] = (restaurant, record.get('cuisines', []))
+        if not rows:
+            return []
+
+        restaurants = Restaurant.objects.bulk_create(
+            [restaurant for restaurant, _ in rows.values()],
+            update_conflicts=True,
+            unique_fields=['name'],
+            update_fields=RESTAURANT_UPDATE_FIELDS,
+        )
+        ids = [restaurant.pk for restaurant in restaurants]
+
+        # Imported cuisines replace the existing ones, as .set() would.
+        Through = Restaurant.cuisines.through
+        Through.objects.filter(restaurant_id__in=ids).delete()
+        Through.objects.bulk_create(
+            [
+                Through(restaurant_id=restaurant.pk, cuisine_id=self.cuisine_ids[name])
+                for restaurant, (_, cuisine_names) in zip(restaurants, rows.values())
+                for name in set(cuisine_names)
+            ],
+            ignore_conflicts=True,
+        )
+        return ids
+
+    def restaurant_ids(self, records):
+        names = {record.get('restaurant') for _, record in records}
+        ids = dict(Restaurant.objects.filter(name__in=names).values_list('name', 'id'))
+        for number, record in records:
+            if record.get('restaurant') not in ids:
+                raise CommandError(f"Record {number}: unknown restaurant {record.get('restaurant')!r}.")
+        return ids
+
+    def import_foods(self, records, restaurant_ids):
+        # Upserted by restaurant and name (no unique constraint backs it), so a file imported
+        # again updates its dishes instead of adding them twice.
+        rows = {}
+        for number, record in records:
+            try:
+                food = Food(
+                    restaurant_id=restaurant_ids[record['restaurant']],
+                    name=record['name'],
+                    price=Decimal(str(record['price'])),
+                    diet_type=parse_diet_type(record.get('diet_type')),
+                    description=record.get('description', ''),
+                    image=record.get('image') or None,
+                )
+            except (KeyError, ValueError, ArithmeticError) as e:
+                raise CommandError(f"Record {number}: invalid food ({e}).")
+            rows[(food.restaurant_id, food.name)] = (food, record.get('cuisines', []))
+        if not rows:
+            return []
+
+        matches = Food.objects.filter(
+            restaurant_id__in={restaurant_id for restaurant_id, _ in rows}, name__in={name for _, name in rows},
+        ).order_by('-pk')  # so the oldest dish wins where a name is already repeated
+        existing = {(restaurant_id, name): pk for restaurant_id, name, pk in matches.values_list('restaurant_id', 'name', 'pk')}
+        now = timezone.now()
+        for key, (food, _) in rows.items():
+            if key in existing:
+                food.pk, food.updated_at = existing[key], now
+        updated = [food for food, _ in rows.values() if food.pk]
+        Food.objects.bulk_update(updated, FOOD_UPDATE_FIELDS)
+        Food.objects.bulk_create([food for food, _ in rows.values() if not food.pk])
+
+        # Imported cuisines replace the existing ones, as for restaurants.
+        Through = Food.cuisines.through
+        Through.objects.filter(food_id__in=[food.pk for food in updated]).delete()
+        Through.objects.bulk_create(
+            [
+                Through(food_id=food.pk, cuisine_id=self.cuisine_ids[name])
+                for food, names in rows.values()
+                for name in set(names)
+            ],
+            ignore_conflicts=True,
+        )
+        return [food for food, _ in rows.values()]
+
+    def import_images(self, records, restaurant_ids):
+        # A restaurant's image path is only added once, however often the file is imported.
+        images = dict.fromkeys((restaurant_ids[record['restaurant']], record['image']) for _, record in records)
+        existing = set(RestaurantImage.objects.filter(
+            restaurant_id__in={restaurant_id for restaurant_id, _ in images}, image__in={image for _, image in images},
+        ).values_list('restaurant_id', 'image'))
+        return RestaurantImage.objects.bulk_create([
+            RestaurantImage(restaurant_id=restaurant_id, image=image)
+            for restaurant_id, image in images if (restaurant_id, image) not in existing
+        ])
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream restaurants, foods, cuisines and images from a JSONL or CSV file into the catalogue. "
+        "Every record has a 'type' (restaurant, food, cuisine or image); foods and images name their "
+        "restaurant and must come after it. Restaurants are upserted by name, foods by restaurant and "
+        "name, and an image path is added to its restaurant once. Run rebuild_thumbnails afterwards to "
+        "build the thumbnails of the imported photos."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="A .jsonl or .csv catalogue file.")
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument(
+            "--checkpoint",
+            help="Name the committed record count is stored under in the database (default: the file's absolute path).",
+        )
+        parser.add_argument(
+            "--resume",
+            action="store_true",
+            help="Skip the records already committed according to the checkpoint.",
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        if not Path(path).exists():
+            raise CommandError(f"{path} does not exist.")
+        checkpoint = options["checkpoint"] or str(Path(path).resolve())
+        done = 0
+        if options["resume"]:
+            done = ImportCheckpoint.objects.filter(source=checkpoint).values_list("records", flat=True).first() or 0
+            self.stdout.write(f"Resuming after record {done}.")
+
+        importer = CatalogueImporter()
+        records = enumerate(read_records(path), start=1)
+        for _ in islice(records, done):
+            pass
+
+        started = time.monotonic()
+        imported = photos = 0
+        while batch := list(islice(records, options["batch_size"])):
+            done = batch[-1][0]
+            with transaction.atomic():
+                photos += importer.import_batch(batch)
+                # Committed together with the batch, so a resumed import never inserts a batch twice.
+                ImportCheckpoint.objects.update_or_create(source=checkpoint, defaults={"records": done})
+            invalidate_facets()
+            imported += len(batch)
+            rate = imported / max(time.monotonic() - started, 1e-9)
+            self.stdout.write(f"{done} records imported ({rate:.0f} rows/s)")
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} records."))
+        if photos:
+            self.stdout.write(f"{photos} photos need thumbnails; run rebuild_thumbnails.")
@@ -0,0 +1,167 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+DEFAULT_PATHS = ["/restaurants/", "/restaurants/?cursor=", "/restaurants/?diet_type=1"]
+
+
+def percentile(latencies, pct):
+    ordered = sorted(latencies)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure req/s and latency of GET requests through Django's own WSGI or ASGI handler, "
+        "in process and without a network server (over https, so SECURE_SSL_REDIRECT does not "
+        "turn them into redirects). --compare runs the sync views under WSGI and "
+        "the async views under ASGI (ASYNC_VIEWS) in two subprocesses and prints both."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--server", choices=["wsgi", "asgi"], default="asgi")
+        parser.add_argument("--compare", action="store_true", help="Run both servers, each with its own views.")
+        parser.add_argument("--path", action="append", dest="paths", help=f"URL to request (repeatable); default {DEFAULT_PATHS}")
+        parser.add_argument("--requests", type=int, default=500)
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--warmup", type=int, default=20, help="Untimed requests sent first.")
+        parser.add_argument("--host", default=settings.ALLOWED_HOSTS[0] if settings.ALLOWED_HOSTS else "localhost")
+        parser.add_argument("--json", action="store_true", help="Print the result as one JSON object.")
+
+    def handle(self, *args, **options):
+        if options["requests"] < 1 or options["concurrency"] < 1:
+            raise CommandError("--requests and --concurrency must be positive.")
+        options["paths"] = options["paths"] or DEFAULT_PATHS
+        if options["compare"]:
+            return self.compare(options)
+
+        run = self.run_asgi if options["server"] == "asgi" else self.run_wsgi
+        urls = [options["paths"][i % len(options["paths"])] for i in range(options["requests"])]
+        run(urls[:options["warmup"]], options)
+        started = time.perf_counter()
+        results = run(urls, options)
+        elapsed = time.perf_counter() - started
+
+        latencies = [latency for _, latency in results]
+        report = {
+            "server": options["server"],
+            "async_views": settings.ASYNC_VIEWS,
+            "requests": len(results),
+            "errors": sum(1 for status, _ in results if not 200 <= status < 300),
+            "req_per_s": round(len(results) / elapsed, 1),
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+        }
+        if options["json"]:
+            self.stdout.write(json.dumps(report))
+        else:
+            self.write_report([report])
+
+    def compare(self, options):
+        reports = []
+        for server, async_views in (("wsgi", "False"), ("asgi", "True")):
+            command = [
+                sys.executable, "-m", "django", "load_test", "--json", "--server", server,
+                "--requests", str(options["requests"]), "--concurrency", str(options["concurrency"]),
+                "--warmup", str(options["warmup"]), "--host", options["host"],
+                *[arg for path in options["paths"] for arg in ("--path", path)],
+            ]
+            env = {**os.environ, "ASYNC_VIEWS": async_views}
+            output = subprocess.run(command, env=env, cwd=settings.BASE_DIR, capture_output=True, text=True)
+            if output.returncode:
+                raise CommandError(f"The {server} run failed:\n{output.stderr}")
+            reports.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        self.write_report(reports)
+
+    def write_report(self, reports):
+        self.stdout.write(f"{'server':<8}{'views':<7}{'requests':>9}{'errors':>8}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}")
+        for r in reports:
+            self.stdout.write(
+                f"{r['server']:<8}{'async' if r['async_views'] else 'sync':<7}{r['requests']:>9}{r['errors']:>8}"
+                f"{r['req_per_s']:>9}{r['p50_ms']:>9}{r['p99_ms']:>9}"
+            )
+
+    def run_wsgi(self, urls, options):
+        handler = WSGIHandler()
+
+        def request(url):
+            parts = urlsplit(url)
+            environ = {
+                "REQUEST_METHOD": "GET", "PATH_INFO": parts.path, "QUERY_STRING": parts.query,
+                "SERVER_NAME": options["host"], "SERVER_PORT": "443", "HTTPS": "on", "HTTP_HOST": options["host"],
+                "SERVER_PROTOCOL": "HTTP/1.1", "REMOTE_ADDR": "127.0.0.1",
+                "wsgi.input": BytesIO(), "wsgi.errors": sys.stderr, "wsgi.url_scheme": "https",
+                "wsgi.version": (1, 0), "wsgi.multithread": True, "wsgi.multiprocess": False, "wsgi.run_once": False,
+            }
+            status = []
+            started = time.perf_counter()
+            response = handler(environ, lambda s, headers, exc_info=None: status.append(int(s.split()[0])))
+            for _ in response:
+                pass
+            response.close()
+            return status[0], time.perf_counter() - started
+
+        def worker(chunk):
+            try:
+                return [request(url) for url in chunk]
+            finally:
+                connections.close_all()  # the pool thread's own connections
+
+        # One thread per simulated client, like a threaded WSGI server.
+        chunks = [urls[i::options["concurrency"]] for i in range(options["concurrency"])]
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as pool:
+            return [result for chunk in pool.map(worker, chunks) for result in chunk]
+
+    def run_asgi(self, urls, options):
+        handler = ASGIHandler()
+
+        async def request(url):
+            parts = urlsplit(url)
+            scope = {
+                "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+                "scheme": "https", "path": parts.path, "raw_path": parts.path.encode(),
+                "query_string": parts.query.encode(), "headers": [(b"host", options["host"].encode())],
+                "server": (options["host"], 443), "client": ("127.0.0.1", 0),
+            }
+            done = asyncio.Event()
+            body_sent = False
+            status = []
+
+            async def receive():
+                nonlocal body_sent
+                if not body_sent:
+                    body_sent = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                await done.wait()  # the client stays connected until the response is complete
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                if message["type"] == "http.response.start":
+                    status.append(message["status"])
+                elif not message.get("more_body"):
+                    done.set()
+
+            started = time.perf_counter()
+            await handler(scope, receive, send)
+            return status[0], time.perf_counter() - started
+
+        async def client(chunk):
+            return [await request(url) for url in chunk]
+
+        async def main():
+            chunks = [urls[i::options["concurrency"]] for i in range(options["concurrency"])]
+            return [result for chunk in await asyncio.gather(*map(client, chunks)) for result in chunk]
+
+        return asyncio.run(main())
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+from restaurants.facets import invalidate_facets
+from restaurants.models import Restaurant, Review, RATING_AGGREGATE_FIELDS, rating_aggregates
+
+
+def live_rating_counts():
+    """Return {restaurant_id: {rating: count}} aggregated from the reviews table in one query."""
+    counts = {}
+    rows = Review.objects.values_list('restaurant_id', 'rating').annotate(count=Count('id')).order_by()
+    for restaurant_id, rating, count in rows:
+        counts.setdefault(restaurant_id, {})[rating] = count
+    return counts
+
+
+def find_rating_drift(fields=RATING_AGGREGATE_FIELDS):
+    """Yield (restaurant, expected values) for every restaurant whose stored aggregates are stale."""
+    counts = live_rating_counts()
+    for restaurant in Restaurant.objects.only('pk', 'name', *fields).iterator(chunk_size=2000):
+        expected = rating_aggregates(counts.get(restaurant.pk, {}))
+        if any(getattr(restaurant, field) != expected[field] for field in fields):
+            yield restaurant, expected
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored review count, rating sum, star counts and average rating from the reviews table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report restaurants whose stored aggregates differ; exit with an error if any do.",
+        )
+
+    def handle(self, *args, **options):
+        verify = options["verify"]
+        now = timezone.now()
+        with transaction.atomic():
+            stale = []
+            for restaurant, expected in find_rating_drift():
+                if verify:
+                    self.stdout.write(f"{restaurant.pk} {restaurant.name}: stored aggregates are out of date")
+                for field, value in expected.items():
+                    setattr(restaurant, field, value)
+                restaurant.updated_at = now
+                stale.append(restaurant)
+
+            if verify:
+                if stale:
+                    raise CommandError(f"{len(stale)} restaurant(s) have stale rating aggregates.")
+                self.stdout.write(self.style.SUCCESS("Rating aggregates are consistent."))
+                return
+
+            Restaurant.objects.bulk_update(stale, [*RATING_AGGREGATE_FIELDS, 'updated_at'], batch_size=500)
+        invalidate_facets()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt rating aggregates for {len(stale)} restaurant(s)."))
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from restaurants.models import DERIVED_FIELDS, Restaurant
+
+
+class Command(BaseCommand):
+    help = (
+        "Re-derive the stored columns that save() and loaddata compute from other restaurant fields "
+        f"({', '.join(DERIVED_FIELDS)}). Run it after bulk_create, bulk_update or update() writes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report restaurants whose derived columns differ; exit with an error if any do.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        fields = list(DERIVED_FIELDS)
+        sources = {source for field_sources in DERIVED_FIELDS.values() for source in field_sources}
+        restaurants = Restaurant.objects.only("pk", "name", *fields, *sources)
+        now = timezone.now()
+
+        stale_count = last_pk = 0
+        # Walk the table in pk order a batch at a time, so no cursor is open while rows are written.
+        while chunk := list(restaurants.filter(pk__gt=last_pk).order_by("pk")[:options["batch_size"]]):
+            last_pk = chunk[-1].pk
+            stale = []
+            for restaurant in chunk:
+                stored = [getattr(restaurant, field) for field in fields]
+                restaurant.derive_fields()
+                if [getattr(restaurant, field) for field in fields] != stored:
+                    if options["verify"]:
+                        self.stdout.write(f"{restaurant.pk} {restaurant.name}: derived columns are out of date")
+                    restaurant.updated_at = now
+                    stale.append(restaurant)
+            stale_count += len(stale)
+            if stale and not options["verify"]:
+                Restaurant.objects.bulk_update(stale, [*fields, "updated_at"])
+
+        if options["verify"]:
+            if stale_count:
+                raise CommandError(f"{stale_count} restaurant(s) have stale derived columns.")
+            self.stdout.write(self.style.SUCCESS("Derived columns are consistent."))
+            return
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt derived columns for {stale_count} restaurant(s)."))
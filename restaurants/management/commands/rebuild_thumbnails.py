@@ -0,0 +1,73 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import F
+from restaurants.models import Food, RestaurantImage
+from restaurants.thumbnails import generate_derivatives, mark_thumbnails_built
+
+MARK_BATCH_SIZE = 500
+
+
+def _generate(job):
+    # Runs in a worker process: only Pillow and the storage, no database access.
+    pk, name = job
+    try:
+        generate_derivatives(name)
+    except Exception as e:
+        return pk, name, str(e) or e.__class__.__name__
+    return pk, name, None
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the resized JPEG/WebP derivatives for food and restaurant photos that do not have "
+        "them yet (or for all photos with --force), spread over a pool of worker processes."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+        parser.add_argument("--force", action="store_true", help="Rebuild derivatives that are already up to date.")
+
+    def handle(self, *args, **options):
+        jobs = {}
+        for model in (RestaurantImage, Food):
+            rows = model.objects.exclude(image="").exclude(image__isnull=True)
+            if not options["force"]:
+                rows = rows.exclude(thumbnails_for=F("image"))
+            jobs[model] = list(rows.order_by("pk").values_list("pk", "image"))
+
+        total = sum(len(model_jobs) for model_jobs in jobs.values())
+        if not total:
+            self.stdout.write(self.style.SUCCESS("All thumbnails are up to date."))
+            return
+
+        pool = None
+        if options["workers"] > 1:
+            # Forked workers must not share the parent's database connections.
+            connections.close_all()
+            pool = ProcessPoolExecutor(max_workers=options["workers"], initializer=django.setup)
+        built = failed = 0
+        try:
+            for model, model_jobs in jobs.items():
+                results = pool.map(_generate, model_jobs, chunksize=8) if pool else map(_generate, model_jobs)
+                done = {}
+                for pk, name, error in results:
+                    if error:
+                        failed += 1
+                        self.stderr.write(f"{model.__name__} {pk} ({name}): {error}")
+                        continue
+                    done[pk] = name
+                    if len(done) >= MARK_BATCH_SIZE:
+                        built += mark_thumbnails_built(model, done)
+                        done = {}
+                        self.stdout.write(f"{built}/{total} images processed")
+                if done:
+                    built += mark_thumbnails_built(model, done)
+        finally:
+            if pool:
+                pool.shutdown()
+
+        self.stdout.write(self.style.SUCCESS(f"Built thumbnails for {built} images; {failed} failed."))
@@ -1,5 +1,8 @@
+from decimal import Decimal
 from django.db import models
-from django.db.models import Exists, OuterRef, Value, BooleanField 
+from django.db.models import Exists, OuterRef, Value, BooleanField, DecimalField, ExpressionWrapper, F, FloatField, Prefetch, Q
+from django.db.models.functions import ASin, Coalesce, Cos, NullIf, Power, Sin, Sqrt
+from django.utils import timezone
 
 class RestaurantQuerySet(models.QuerySet):
     def with_user_bookmarks(self, user):
@@ -29,3 +32,100 @@ class RestaurantQuerySet(models.QuerySet):
         return self.annotate(
             is_visited=Value(False, output_field=BooleanField())
         )
+
+    def with_cover_image(self):
+        from .models import RestaurantImage
+        # Ordered like images.first() so Restaurant.cover_image is served from the prefetch cache.
+        return self.prefetch_related(
+            Prefetch('images', queryset=RestaurantImage.objects.order_by('pk'))
+        )
+
+    def open_at(self, value):
+        """Restaurants open at the given time of day, as two index-friendly range checks."""
+        from .models import MINUTES_PER_DAY, minute_of_day
+        minute = minute_of_day(value)
+        return self.filter(
+            Q(opening_minute__lte=minute, closing_minute__gt=minute)
+            | Q(closing_minute__gt=minute + MINUTES_PER_DAY)  # still open from the previous day
+        )
+
+    def nearby(self, latitude, longitude, radius_km):
+        """
+        Restaurants within radius_km of the point, annotated with distance_km. The geo_cell
+        ranges and bounding box narrow the rows down through the index before the exact
+        haversine distance is computed for the remaining candidates.
+        """
+        import math
+        from .geo import EARTH_RADIUS_KM, bounding_box, cell_ranges
+        candidates = Q()
+        for first, last in cell_ranges(latitude, longitude, radius_km):
+            candidates |= Q(geo_cell__range=(first, last))
+        south, north, west, east = bounding_box(latitude, longitude, radius_km)
+        box = Q(latitude__range=(south, north))
+        if west <= east:  # skipped when the box wraps around the antimeridian
+            box &= Q(longitude__range=(west, east))
+
+        # haversine: a = sin²(Δlat/2) + cos(lat0)·cos(lat)·sin²(Δlng/2), distance = 2R·asin(√a).
+        # Everything about the origin is folded into constants, which matters on SQLite where
+        # the trigonometric functions are Python callbacks.
+        to_radians = math.pi / 180
+        lat, lng = F('latitude') * to_radians, F('longitude') * to_radians
+        a = ExpressionWrapper(
+            Power(Sin((lat - latitude * to_radians) / 2), 2)
+            + math.cos(latitude * to_radians) * Cos(lat) * Power(Sin((lng - longitude * to_radians) / 2), 2),
+            output_field=FloatField(),
+        )
+        max_a = math.sin(radius_km / (2 * EARTH_RADIUS_KM)) ** 2
+        return self.filter(candidates, box).alias(haversine=a).filter(haversine__lte=max_a).annotate(
+            distance_km=Value(2 * EARTH_RADIUS_KM) * ASin(Sqrt(F('haversine'))),
+        )
+
+    def search(self, text):
+        from .search import search_queryset
+        return search_queryset(self, text)
+
+    def refresh_search_documents(self):
+        from .search import index_documents
+        documents = {}
+        restaurants = []
+        for restaurant in self.prefetch_related('cuisines', 'menu'):
+            restaurant.search_document = restaurant.build_search_document()
+            documents[restaurant.pk] = restaurant.search_document
+            restaurants.append(restaurant)
+        self.model.objects.bulk_update(restaurants, ['search_document'], batch_size=500)
+        index_documents(documents, using=self.db)
+        return len(restaurants)
+
+    def touch(self):
+        """Bump updated_at, which keys the card cache, without loading or saving the rows."""
+        return self.update(updated_at=timezone.now())
+
+    def apply_rating_change(self, restaurant_id, added=None, removed=None):
+        """
+        Adjust the stored rating aggregates for one added and/or removed review rating
+        with a single UPDATE, whatever the number of reviews the restaurant has.
+        """
+        if added == removed:
+            return 0
+        count_delta = (added is not None) - (removed is not None)
+        sum_delta = (added or 0) - (removed or 0)
+        review_count = F('review_count') + count_delta
+        rating_sum = F('rating_sum') + sum_delta
+
+        # Half-up rounding to one decimal in integer arithmetic, so SQLite and PostgreSQL agree.
+        tenths = (rating_sum * 20 + review_count) / NullIf(review_count * 2, 0)
+        updates = {
+            'updated_at': timezone.now(),
+            'review_count': review_count,
+            'rating_sum': rating_sum,
+            'average_rating': Coalesce(
+                tenths * Value(Decimal('0.1')),
+                Value(Decimal('0.0')),
+                output_field=DecimalField(max_digits=2, decimal_places=1),
+            ),
+        }
+        if added in range(1, 6):
+            updates[f'rating_{added}_count'] = F(f'rating_{added}_count') + 1
+        if removed in range(1, 6):
+            updates[f'rating_{removed}_count'] = F(f'rating_{removed}_count') - 1
+        return self.filter(pk=restaurant_id).update(**updates)
@@ -0,0 +1,35 @@
+"""
+Cached menu pages for FoodListView.
+
+Each restaurant has a menu version in the default cache, moved forward by the signals
+whenever one of its foods (or their cuisines) or the restaurant itself changes. Pages
+are cached under the restaurant, its version, the filters and the page number, so a
+repeated menu view is answered from the cache alone and a write orphans every page of
+that restaurant's menu at once. The versions expire after CACHE_VERSION_TIMEOUT, which
+bounds how long processes that cannot see each other's cache serve an old menu.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .facets import filters_digest
+
+MENU_CACHE_TIMEOUT = 60 * 60
+
+
+def _version_key(restaurant_id):
+    return f"menu:version:{restaurant_id}"
+
+
+def menu_version(restaurant_id):
+    return cache.get_or_set(_version_key(restaurant_id), time.time_ns, settings.CACHE_VERSION_TIMEOUT)
+
+
+def invalidate_menus(restaurant_ids):
+    version = time.time_ns()
+    cache.set_many({_version_key(restaurant_id): version for restaurant_id in restaurant_ids}, settings.CACHE_VERSION_TIMEOUT)
+
+
+def menu_cache_key(restaurant_id, filters, page):
+    return f"menu:{restaurant_id}:{menu_version(restaurant_id)}:{filters_digest(filters)}:{page}"
@@ -0,0 +1,82 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:50
+
+from decimal import Decimal
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def rating_aggregates(counts):
+    # Frozen copy of restaurants.models.rating_aggregates, so later model changes leave this migration alone.
+    review_count = sum(counts.values())
+    rating_sum = sum(rating * count for rating, count in counts.items())
+    values = {
+        'review_count': review_count,
+        'rating_sum': rating_sum,
+        'average_rating': (
+            Decimal((rating_sum * 20 + review_count) // (review_count * 2)).scaleb(-1)
+            if review_count else Decimal('0.0')
+        ),
+    }
+    for star in range(1, 6):
+        values[f'rating_{star}_count'] = counts.get(star, 0)
+    return values
+
+
+def backfill_rating_aggregates(apps, schema_editor):
+    Restaurant = apps.get_model('restaurants', 'Restaurant')
+    Review = apps.get_model('restaurants', 'Review')
+    counts = {}
+    rows = Review.objects.values_list('restaurant_id', 'rating').annotate(count=Count('id')).order_by()
+    for restaurant_id, rating, count in rows:
+        counts.setdefault(restaurant_id, {})[rating] = count
+    for restaurant_id, by_rating in counts.items():
+        Restaurant.objects.filter(pk=restaurant_id).update(**rating_aggregates(by_rating))
+    # Restaurants without reviews keep no stale average either.
+    Restaurant.objects.exclude(pk__in=list(counts)).update(**rating_aggregates({}))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0003_alter_food_diet_type_alter_restaurant_diet_type'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_1_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_2_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_3_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_4_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_5_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='review_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_rating_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:53
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0004_restaurant_rating_aggregates'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['-average_rating', 'id'], name='restaurant_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['cost_for_two', 'id'], name='restaurant_cost_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(condition=models.Q(('is_spotlight', True)), fields=['-average_rating', 'id'], name='restaurant_spotlight_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['diet_type', '-average_rating', 'id'], name='restaurant_diet_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['cost_for_two', 'average_rating'], name='restaurant_cost_rating_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['restaurant', 'rating'], name='review_restaurant_rating_idx'),
+        ),
+    ]
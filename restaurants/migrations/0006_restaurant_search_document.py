@@ -0,0 +1,42 @@
+# Generated by Django 5.2.8 on 2026-10-18 03:57
+
+from django.db import migrations, models
+
+from restaurants.search import create_search_index, drop_search_index
+
+
+def backfill_search_documents(apps, schema_editor):
+    Restaurant = apps.get_model('restaurants', 'Restaurant')
+    restaurants = list(Restaurant.objects.prefetch_related('cuisines', 'menu'))
+    for restaurant in restaurants:
+        parts = [restaurant.name, restaurant.city, restaurant.address]
+        parts += [cuisine.name for cuisine in restaurant.cuisines.all()]
+        for food in restaurant.menu.all():
+            parts += [food.name, food.description]
+        restaurant.search_document = ' '.join(part for part in parts if part)
+    Restaurant.objects.bulk_update(restaurants, ['search_document'], batch_size=500)
+
+
+def create_index(apps, schema_editor):
+    create_search_index(schema_editor.connection)
+
+
+def drop_index(apps, schema_editor):
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0005_list_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(backfill_search_documents, migrations.RunPython.noop),
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:03
+
+from django.db import migrations, models
+
+
+def backfill_opening_minutes(apps, schema_editor):
+    Restaurant = apps.get_model('restaurants', 'Restaurant')
+    restaurants = list(Restaurant.objects.only('opening_time', 'closing_time'))
+    for restaurant in restaurants:
+        restaurant.opening_minute = restaurant.opening_time.hour * 60 + restaurant.opening_time.minute
+        restaurant.closing_minute = restaurant.closing_time.hour * 60 + restaurant.closing_time.minute
+        if restaurant.closing_minute <= restaurant.opening_minute:
+            restaurant.closing_minute += 24 * 60
+    Restaurant.objects.bulk_update(restaurants, ['opening_minute', 'closing_minute'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0006_restaurant_search_document'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='restaurant',
+            name='closing_minute',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='opening_minute',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_opening_minutes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['opening_minute', 'closing_minute'], name='restaurant_open_window_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='restaurant',
+            index=models.Index(fields=['closing_minute'], name='restaurant_closing_idx'),
+        ),
+    ]
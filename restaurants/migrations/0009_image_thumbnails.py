@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0008_restaurant_coordinates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='food',
+            name='thumbnails_for',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='restaurantimage',
+            name='thumbnails_for',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.8 on 2026-10-18 04:36
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('restaurants', '0009_image_thumbnails'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='bookmark',
+            index=models.Index(fields=['user', 'created_at'], name='bookmark_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='visited',
+            index=models.Index(fields=['user', 'created_at'], name='visited_user_created_idx'),
+        ),
+    ]
@@ -1,8 +1,13 @@
 from django.contrib.auth.models import User
-from django.db import models
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import models, router, transaction
 from django.urls import reverse
+from django.utils import timezone
 from .managers import RestaurantQuerySet
+from . import geo, search
 from django.db.models import Count, Avg
+from decimal import Decimal
+import datetime
 
 class TimeStampedModel(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)  
@@ -12,6 +17,18 @@ class TimeStampedModel(models.Model):
         abstract = True
 
 
+class ThumbnailedImageMixin(models.Model):
+    # Name of the upload the resized derivatives were built from, see thumbnails.py.
+    thumbnails_for = models.CharField(max_length=255, blank=True, default='', editable=False)
+
+    class Meta:
+        abstract = True
+
+    @property
+    def has_thumbnails(self):
+        return bool(self.image) and self.thumbnails_for == self.image.name
+
+
 class Cuisine(models.Model):
     name = models.CharField(max_length=100, unique=True)  
 
@@ -25,6 +42,48 @@ class DietType(models.IntegerChoices):
     VEGAN = 3, 'Vegan'
 
 
+RATING_HISTOGRAM_FIELDS = [f'rating_{star}_count' for star in range(1, 6)]
+RATING_AGGREGATE_FIELDS = [
+    'review_count', 'rating_sum', 'average_rating', *RATING_HISTOGRAM_FIELDS,
+]
+
+
+MINUTES_PER_DAY = 24 * 60
+
+# Restaurant columns derived from others by Restaurant.derive_fields(), mapped to their sources.
+DERIVED_FIELDS = {
+    'opening_minute': ('opening_time', 'closing_time'),
+    'closing_minute': ('opening_time', 'closing_time'),
+    'geo_cell': ('latitude', 'longitude'),
+}
+# Restaurant columns build_search_document() reads; its cuisines and menu are refreshed by the signals.
+SEARCH_DOCUMENT_SOURCES = ('name', 'city', 'address')
+
+
+def minute_of_day(value):
+    if isinstance(value, str):
+        value = datetime.time.fromisoformat(value)
+    return value.hour * 60 + value.minute
+
+
+def rating_aggregates(counts):
+    """Build the stored rating aggregate values from a {rating: review count} mapping."""
+    review_count = sum(counts.values())
+    rating_sum = sum(rating * count for rating, count in counts.items())
+    values = {
+        'review_count': review_count,
+        'rating_sum': rating_sum,
+        # Same integer half-up rounding as RestaurantQuerySet.apply_rating_change uses in SQL.
+        'average_rating': (
+            Decimal((rating_sum * 20 + review_count) // (review_count * 2)).scaleb(-1)
+            if review_count else Decimal('0.0')
+        ),
+    }
+    for star in range(1, 6):
+        values[f'rating_{star}_count'] = counts.get(star, 0)
+    return values
+
+
 class Restaurant(TimeStampedModel):
     name = models.CharField(max_length=200, unique=True)  
     city = models.CharField(max_length=100)
@@ -34,35 +93,111 @@ class Restaurant(TimeStampedModel):
     average_rating = models.DecimalField(max_digits=2, decimal_places=1, default=0.0)
     opening_time = models.TimeField()
     closing_time = models.TimeField()
+    # Minute-of-day copies of the opening hours for the open_now/open_at filters. closing_minute is
+    # pushed past 1440 when the window crosses midnight (or spans the whole day), see set_opening_minutes().
+    opening_minute = models.PositiveSmallIntegerField(default=0, editable=False)
+    closing_minute = models.PositiveSmallIntegerField(default=0, editable=False)
     is_spotlight = models.BooleanField(default=False)
+    latitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-90), MaxValueValidator(90)])
+    longitude = models.FloatField(null=True, blank=True, validators=[MinValueValidator(-180), MaxValueValidator(180)])
+    # Grid cell of the coordinates for the "near me" search, see geo.py.
+    geo_cell = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    # Rating aggregates maintained incrementally by the Review signals (see signals.py).
+    review_count = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveIntegerField(default=0)
+    rating_1_count = models.PositiveIntegerField(default=0)
+    rating_2_count = models.PositiveIntegerField(default=0)
+    rating_3_count = models.PositiveIntegerField(default=0)
+    rating_4_count = models.PositiveIntegerField(default=0)
+    rating_5_count = models.PositiveIntegerField(default=0)
+    # Name, location, cuisines and menu text; the full-text index is built over it (see search.py).
+    search_document = models.TextField(blank=True, default='', editable=False)
     cuisines = models.ManyToManyField(Cuisine, related_name='restaurants', blank=True)  # A restaurant may start without cuisines
 
     objects = RestaurantQuerySet.as_manager()
 
+    class Meta:
+        # Shaped after RestaurantFilter: every sort ends in a pk tie-break for keyset pagination.
+        indexes = [
+            models.Index(fields=['-average_rating', 'id'], name='restaurant_rating_idx'),
+            models.Index(fields=['cost_for_two', 'id'], name='restaurant_cost_idx'),
+            models.Index(
+                fields=['-average_rating', 'id'],
+                condition=models.Q(is_spotlight=True),
+                name='restaurant_spotlight_idx',
+            ),
+            models.Index(fields=['diet_type', '-average_rating', 'id'], name='restaurant_diet_rating_idx'),
+            models.Index(fields=['cost_for_two', 'average_rating'], name='restaurant_cost_rating_idx'),
+            models.Index(fields=['opening_minute', 'closing_minute'], name='restaurant_open_window_idx'),
+            models.Index(fields=['closing_minute'], name='restaurant_closing_idx'),
+            models.Index(fields=['geo_cell', 'latitude', 'longitude'], name='restaurant_geo_cell_idx'),
+        ]
+
     def __str__(self):
         return self.name
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # The pre_save receiver rederives these (signals.py); store them with their sources.
+            update_fields = {*update_fields, *(
+                field for field, sources in DERIVED_FIELDS.items() if not set(sources).isdisjoint(update_fields)
+            )}
+            # Likewise the search document, which the index must keep matching.
+            if not update_fields.isdisjoint(SEARCH_DOCUMENT_SOURCES):
+                update_fields.add('search_document')
+            kwargs['update_fields'] = update_fields
+        reindex = update_fields is None or 'search_document' in update_fields
+        if reindex:
+            self.search_document = self.build_search_document()
+        super().save(*args, **kwargs)
+        if reindex:
+            search.index_documents({self.pk: self.search_document}, using=self._state.db)
+
+    def derive_fields(self):
+        self.set_opening_minutes()
+        self.geo_cell = geo.geo_cell(self.latitude, self.longitude)
+
+    def set_opening_minutes(self):
+        self.opening_minute = minute_of_day(self.opening_time)
+        self.closing_minute = minute_of_day(self.closing_time)
+        if self.closing_minute <= self.opening_minute:
+            self.closing_minute += MINUTES_PER_DAY
+
+    def build_search_document(self):
+        parts = [self.name, self.city, self.address]
+        if self.pk:
+            # .all() so prefetched cuisines and menu are reused by refresh_search_documents()
+            parts += [cuisine.name for cuisine in self.cuisines.all()]
+            for food in self.menu.all():
+                parts += [food.name, food.description]
+        return ' '.join(part for part in parts if part)
     
     def get_absolute_url(self):
         return reverse("restaurants:restaurant_detail", kwargs={"pk": self.pk})
     
+    @property
+    def cover_image(self):
+        # images[0] reuses prefetched images instead of issuing a query like images.first().
+        images = self.images.all()
+        return images[0] if images else None
+
     def get_foods_url(self):
         return reverse("restaurants:restaurant_foods", kwargs={"restaurant_id": self.pk})
     
     def update_average_rating(self):
-        reviews = self.reviews.all()
-        if reviews.exists():
-            avg = reviews.aggregate(models.Avg('rating'))['rating__avg']
-            self.average_rating = round(avg, 1)
-        else:
-            self.average_rating = 0.0
-        self.save()
+        # Full re-aggregation; only used to repair drift, reviews keep the counters in sync.
+        counts = dict(self.reviews.values_list('rating').annotate(count=Count('id')))
+        Restaurant.objects.filter(pk=self.pk).update(updated_at=timezone.now(), **rating_aggregates(counts))
+        self.refresh_from_db(fields=[*RATING_AGGREGATE_FIELDS, 'updated_at'])
 
-    def get_rating_stats(self):
-        rating_counts = self.reviews.values('rating').annotate(count=Count('rating'))
+    @property
+    def rating_histogram(self):
+        return {star: getattr(self, f'rating_{star}_count') for star in range(1, 6)}
 
-        rating_data = {str(i): 0 for i in range(1, 6)}
-        for item in rating_counts:
-            rating_data[str(item['rating'])] = item['count']
+    def get_rating_stats(self):
+        # Reads the stored star counts, so rendering the breakdown costs no query.
+        rating_data = self.rating_histogram
 
         total_reviews = sum(rating_data.values()) or 1  # avoid divide by zero
         rating_percentage = {
@@ -71,13 +206,13 @@ class Restaurant(TimeStampedModel):
         }
 
         rating_stats = [
-            {"star": star, "percentage": rating_percentage[star], "count": rating_data[star]}
-            for star in ["5", "4", "3", "2", "1"]
+            {"star": str(star), "percentage": rating_percentage[star], "count": rating_data[star]}
+            for star in [5, 4, 3, 2, 1]
         ]
         return rating_stats
 
 
-class Food(TimeStampedModel):
+class Food(ThumbnailedImageMixin, TimeStampedModel):
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name='menu')
     name = models.CharField(max_length=200)  
     price = models.DecimalField(max_digits=8, decimal_places=2)
@@ -89,7 +224,7 @@ class Food(TimeStampedModel):
         return f"{self.name} - {self.restaurant.name}"
 
 
-class RestaurantImage(models.Model):
+class RestaurantImage(ThumbnailedImageMixin, models.Model):
     restaurant = models.ForeignKey(Restaurant, on_delete=models.CASCADE, related_name="images")
     image = models.ImageField(upload_to="restaurant_images/")  
 
@@ -102,6 +237,24 @@ class Review(TimeStampedModel):
 
     class Meta:
         unique_together = ('user', 'restaurant')  
+        indexes = [
+            models.Index(fields=['restaurant', 'rating'], name='review_restaurant_rating_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored values so an edit can adjust the aggregates without re-reading the row.
+        instance._loaded_rating = instance.__dict__.get('rating')
+        instance._loaded_restaurant_id = instance.__dict__.get('restaurant_id')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Keep the review write and the restaurant aggregate update in one transaction.
+        with transaction.atomic(using=kwargs.get('using') or router.db_for_write(Review, instance=self)):
+            super().save(*args, **kwargs)
+        self._loaded_rating = self.rating
+        self._loaded_restaurant_id = self.restaurant_id
 
     def __str__(self):
         return f"{self.user.username} - {self.restaurant.name} - {self.rating}"
@@ -113,6 +266,8 @@ class Bookmark(TimeStampedModel):
 
     class Meta:
         unique_together = ('user', 'restaurant')  
+        # The user's list, newest first (the bookmarked/visited filters).
+        indexes = [models.Index(fields=['user', 'created_at'], name='bookmark_user_created_idx')]
 
     def __str__(self):
         return f"{self.user.username} bookmarked {self.restaurant.name}"
@@ -124,6 +279,18 @@ class Visited(TimeStampedModel):
 
     class Meta:
         unique_together = ('user', 'restaurant')  
+        # The user's list, newest first (the bookmarked/visited filters).
+        indexes = [models.Index(fields=['user', 'created_at'], name='visited_user_created_idx')]
 
     def __str__(self):
         return f"{self.user.username} visited {self.restaurant.name}"
+
+
+class ImportCheckpoint(models.Model):
+    # How many records of a catalogue file import_catalogue has committed; written with each batch.
+    source = models.CharField(max_length=255, unique=True)
+    records = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.source}: {self.records} records"
@@ -0,0 +1,166 @@
+from django.core import signing
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    """A page of a KeysetPaginator; quacks like django.core.paginator.Page for the templates."""
+
+    cursor_based = True
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+def cursor_value(value):
+    # repr() keeps every digit of a float (a search rank), so the seek filter gets the exact value back.
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class KeysetPaginator:
+    """
+    Seek pagination over the queryset's own ordering (plus a pk tie-break).
+
+    Pages are addressed by signed, opaque cursors holding the ordering values of
+    the row next to the page boundary, so no OFFSET or COUNT(*) is ever issued.
+    """
+
+    salt = "restaurants.pagination.cursor"
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.ordering = self.get_ordering(queryset)
+
+    @staticmethod
+    def get_ordering(queryset):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if any(not isinstance(field, str) or field == "?" for field in ordering):
+            raise ValueError("Keyset pagination needs an ordering made of field names.")
+        if not any(field.lstrip("-") in ("pk", "id") for field in ordering):
+            ordering.append("pk")
+        return ordering
+
+    def encode_cursor(self, obj, backwards):
+        # obj is a model instance, or a dict when paginating a .values() queryset
+        names = [field.lstrip("-") for field in self.ordering]
+        position = [cursor_value(obj[name] if isinstance(obj, dict) else getattr(obj, name)) for name in names]
+        return signing.dumps({"o": self.ordering, "p": position, "b": backwards}, salt=self.salt, compress=True)
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = signing.loads(cursor, salt=self.salt)
+        except signing.BadSignature:
+            raise InvalidCursor("Invalid cursor.")
+        if payload.get("o") != self.ordering:
+            raise InvalidCursor("Cursor does not match the current ordering.")
+        return payload["p"], payload["b"]
+
+    def _seek_filter(self, position, backwards):
+        # (a, b, pk) after (x, y, z) == a > x OR (a = x AND b > y) OR (a = x AND b = y AND pk > z)
+        condition = Q()
+        equal_so_far = Q()
+        for field, value in zip(self.ordering, position):
+            name = field.lstrip("-")
+            descending = field.startswith("-") != backwards
+            condition |= equal_so_far & Q(**{f"{name}__{'lt' if descending else 'gt'}": value})
+            equal_so_far &= Q(**{name: value})
+        return condition
+
+    def page(self, cursor=None):
+        queryset, position, backwards = self._page_queryset(cursor)
+        return self._build_page(list(queryset), position, backwards)
+
+    async def apage(self, cursor=None):
+        queryset, position, backwards = self._page_queryset(cursor)
+        return self._build_page([row async for row in queryset], position, backwards)
+
+    def _page_queryset(self, cursor):
+        position, backwards = self.decode_cursor(cursor) if cursor else (None, False)
+
+        ordering = self.ordering
+        if backwards:
+            ordering = [field[1:] if field.startswith("-") else f"-{field}" for field in ordering]
+        queryset = self.queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(self._seek_filter(position, backwards))
+        return queryset[:self.per_page + 1], position, backwards
+
+    def _build_page(self, rows, position, backwards):
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+
+        has_next = position is not None if backwards else has_more
+        has_previous = has_more if backwards else position is not None
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1], backwards=False) if rows and has_next else None,
+            previous_cursor=self.encode_cursor(rows[0], backwards=True) if rows and has_previous else None,
+        )
+
+
+def estimated_row_count(queryset):
+    """
+    PostgreSQL's row estimate for the table of an unfiltered queryset, kept fresh by
+    (auto)vacuum and ANALYZE. None on other databases, for filtered querysets and for
+    tables that were never analyzed.
+    """
+    query = queryset.query
+    if query.where or query.distinct or query.combinator or query.is_sliced:
+        return None
+    connection = connections[queryset.db]
+    if connection.vendor != "postgresql":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    return row[0] if row and row[0] >= 0 else None
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for the admin changelists of big tables. Above ESTIMATE_ABOVE rows an
+    unfiltered list is counted from the planner's estimate instead of a COUNT(*) over
+    the whole table, so the page count is approximate and the last pages may be short.
+    Filtered lists and smaller tables are counted exactly.
+    """
+
+    ESTIMATE_ABOVE = 100_000
+
+    @cached_property
+    def count(self):
+        estimate = estimated_row_count(self.object_list)
+        if estimate is not None and estimate > self.ESTIMATE_ABOVE:
+            return estimate
+        return super().count
@@ -0,0 +1,50 @@
+"""
+In-process snapshot of the cuisine table for the filter form's choices and validation.
+
+Cuisines are few and rarely change, so every process keeps an immutable id -> name
+mapping and only checks a version number in the shared cache per use. Saving or
+deleting a cuisine bumps that version (see signals.py), and each process reloads its
+snapshot the next time it looks. Without a shared cache a bump only reaches its own
+process, so the version expires after CACHE_VERSION_TIMEOUT to bound the others' staleness.
+"""
+import threading
+import time
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.cache import cache
+
+VERSION_KEY = "cuisine_registry:version"
+
+
+class CuisineRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._snapshot = MappingProxyType({})
+
+    def snapshot(self):
+        """Read-only {cuisine id: name} mapping, ordered by name."""
+        version = cache.get_or_set(VERSION_KEY, time.time_ns, settings.CACHE_VERSION_TIMEOUT)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    from .models import Cuisine
+                    names = Cuisine.objects.order_by("name").values_list("id", "name")
+                    self._snapshot = MappingProxyType(dict(names))
+                    self._version = version
+        return self._snapshot
+
+    def invalidate(self):
+        try:
+            cache.incr(VERSION_KEY)
+        except ValueError:
+            cache.set(VERSION_KEY, time.time_ns(), settings.CACHE_VERSION_TIMEOUT)
+
+
+cuisine_registry = CuisineRegistry()
+
+
+def cuisine_choices():
+    # A plain function, so form fields can deep-copy it as a callable choices argument.
+    return list(cuisine_registry.snapshot().items())
@@ -0,0 +1,109 @@
+"""
+Full-text search over Restaurant.search_document.
+
+PostgreSQL matches the column through a GIN index on its english tsvector; SQLite
+keeps a separate FTS5 table keyed by restaurant id, written from Python rather
+than triggers so it survives the table rebuilds SQLite migrations perform. On both
+every search term has to match, as a prefix, so "pizz" finds "pizza" while typing.
+"""
+import re
+
+from django.db import connections
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "restaurants_restaurant_fts"
+SEARCH_CONFIG = "english"
+
+
+def create_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            # Same expression SearchVector("search_document", config="english") compiles to.
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS restaurant_search_idx ON restaurants_restaurant "
+                "USING gin (to_tsvector('english'::regconfig, COALESCE(search_document, '')))"
+            )
+        elif connection.vendor == "sqlite":
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                "USING fts5(search_document, tokenize='porter unicode61')"
+            )
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, search_document) "
+                "SELECT id, search_document FROM restaurants_restaurant"
+            )
+
+
+def drop_search_index(connection):
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute("DROP INDEX IF EXISTS restaurant_search_idx")
+        elif connection.vendor == "sqlite":
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def index_documents(documents, using="default"):
+    """Mirror {restaurant pk: search document} into the FTS5 table; a no-op on PostgreSQL."""
+    connection = connections[using]
+    if connection.vendor != "sqlite" or not documents:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in documents])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE}(rowid, search_document) VALUES (%s, %s)",
+            list(documents.items()),
+        )
+
+
+def unindex_documents(pks, using="default"):
+    connection = connections[using]
+    if connection.vendor != "sqlite" or not pks:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(pk,) for pk in pks])
+
+
+def fts5_query(text):
+    # Quote every term so user input can't form FTS5 syntax; the trailing * matches prefixes.
+    terms = ['"{}"*'.format(term.replace('"', '""')) for term in text.split()]
+    return " ".join(terms)
+
+
+def tsquery(text):
+    # Word characters only, so user input can't form tsquery syntax; :* matches prefixes.
+    return " & ".join(f"{term}:*" for term in re.findall(r"\w+", text))
+
+
+def search_queryset(queryset, text):
+    """Filter to restaurants matching text, annotated with search_rank (higher is better)."""
+    connection = connections[queryset.db]
+    if connection.vendor == "postgresql":
+        from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+        raw = tsquery(text)
+        if not raw:
+            return queryset.none()
+        vector = SearchVector("search_document", config=SEARCH_CONFIG)
+        query = SearchQuery(raw, config=SEARCH_CONFIG, search_type="raw")
+        # ts_rank() returns a float4; as a double the rank survives the round trip through a
+        # pagination cursor exactly and compares equal to the value the seek filter recomputes.
+        return queryset.annotate(search_vector=vector).filter(search_vector=query).annotate(
+            search_rank=Cast(SearchRank(vector, query), FloatField())
+        )
+
+    match = fts5_query(text)
+    if not match:
+        return queryset.none()
+    table = queryset.model._meta.db_table
+    # bm25() is lower-is-better, so negate it to sort like SearchRank.
+    rank = RawSQL(
+        f"SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = {table}.id",
+        [match],
+        output_field=FloatField(),
+    )
+    matches = RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+    return queryset.filter(pk__in=matches).annotate(search_rank=rank)
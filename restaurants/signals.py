@@ -0,0 +1,174 @@
+from django.db import transaction
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from .models import Cuisine, Food, Restaurant, RestaurantImage, Review
+from .facets import invalidate_facets
+from .menu import invalidate_menus
+from .registry import cuisine_registry
+from .search import unindex_documents
+from .thumbnails import schedule_thumbnails
+
+
+def _deleted_with_restaurant(origin):
+    return isinstance(origin, Restaurant) or (isinstance(origin, QuerySet) and origin.model is Restaurant)
+
+
+@receiver(pre_save, sender=Restaurant)
+def derive_restaurant_fields(sender, instance, raw, **kwargs):
+    # Also for loaddata (raw). bulk_create, bulk_update and update() skip it; run
+    # rebuild_restaurant_fields after those.
+    instance.derive_fields()
+
+
+@receiver(post_save, sender=Review)
+def apply_review_save_to_ratings(sender, instance, created, raw, **kwargs):
+    if raw:  # loaddata; run rebuild_rating_aggregates afterwards
+        return
+    if created:
+        Restaurant.objects.apply_rating_change(instance.restaurant_id, added=instance.rating)
+        return
+    if not hasattr(instance, '_loaded_rating'):
+        # Saved without being loaded first, so the previous rating is unknown.
+        instance.restaurant.update_average_rating()
+        return
+    if instance._loaded_restaurant_id != instance.restaurant_id:
+        Restaurant.objects.apply_rating_change(instance._loaded_restaurant_id, removed=instance._loaded_rating)
+        Restaurant.objects.apply_rating_change(instance.restaurant_id, added=instance.rating)
+    else:
+        Restaurant.objects.apply_rating_change(
+            instance.restaurant_id, added=instance.rating, removed=instance._loaded_rating
+        )
+
+
+@receiver(post_delete, sender=Review)
+def apply_review_delete_to_ratings(sender, instance, origin=None, **kwargs):
+    # Reviews cascading from a deleted restaurant have no aggregates left to maintain.
+    if _deleted_with_restaurant(origin):
+        return
+    Restaurant.objects.apply_rating_change(
+        getattr(instance, '_loaded_restaurant_id', instance.restaurant_id),
+        removed=getattr(instance, '_loaded_rating', instance.rating),
+    )
+
+
+@receiver(post_save, sender=RestaurantImage)
+@receiver(post_delete, sender=RestaurantImage)
+def touch_restaurant_on_image_change(sender, instance, raw=False, origin=None, **kwargs):
+    # Bumping updated_at changes the restaurant card cache key.
+    if raw or _deleted_with_restaurant(origin):
+        return
+    Restaurant.objects.filter(pk=instance.restaurant_id).touch()
+
+
+@receiver(m2m_changed, sender=Restaurant.cuisines.through)
+def refresh_restaurant_on_cuisine_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # The restaurants losing this cuisine are only known before the rows go away.
+        instance._cleared_restaurant_pks = list(instance.restaurants.values_list('pk', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        pks = [instance.pk]
+    elif action == 'post_clear':
+        pks = instance.__dict__.pop('_cleared_restaurant_pks', [])
+    else:
+        pks = pk_set
+    restaurants = Restaurant.objects.filter(pk__in=pks)
+    restaurants.touch()
+    restaurants.refresh_search_documents()
+
+
+@receiver(post_delete, sender=Restaurant)
+def remove_restaurant_from_search(sender, instance, **kwargs):
+    unindex_documents([instance.pk], using=kwargs.get('using') or 'default')
+
+
+@receiver(post_save, sender=Food)
+@receiver(post_delete, sender=Food)
+def refresh_search_on_menu_change(sender, instance, raw=False, origin=None, **kwargs):
+    if raw or _deleted_with_restaurant(origin):
+        return
+    Restaurant.objects.filter(pk=instance.restaurant_id).refresh_search_documents()
+
+
+@receiver(post_save, sender=Cuisine)
+def refresh_search_on_cuisine_rename(sender, instance, created, raw, **kwargs):
+    if raw or created:
+        return
+    # The cards and the API show cuisine names, and both are keyed on updated_at.
+    restaurants = instance.restaurants.all()
+    restaurants.touch()
+    restaurants.refresh_search_documents()
+
+
+@receiver(pre_delete, sender=Cuisine)
+def remember_restaurants_of_deleted_cuisine(sender, instance, **kwargs):
+    # The through rows cascade without m2m_changed, and are gone by post_delete.
+    instance._restaurant_pks = list(instance.restaurants.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Cuisine)
+def refresh_restaurants_of_deleted_cuisine(sender, instance, **kwargs):
+    restaurants = Restaurant.objects.filter(pk__in=instance.__dict__.pop('_restaurant_pks', []))
+    restaurants.touch()
+    restaurants.refresh_search_documents()
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+@receiver(post_save, sender=Food)
+@receiver(post_delete, sender=Food)
+@receiver(post_save, sender=Cuisine)
+@receiver(post_delete, sender=Cuisine)
+@receiver(m2m_changed, sender=Restaurant.cuisines.through)
+def invalidate_facets_on_change(sender, action='post_save', origin=None, **kwargs):
+    # One bump per restaurant delete is enough, not one per cascaded row. Bumping on commit
+    # keeps a concurrent request from caching counts that miss the uncommitted write.
+    if action.startswith('post_') and (sender is Restaurant or not _deleted_with_restaurant(origin)):
+        transaction.on_commit(invalidate_facets, using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Cuisine)
+@receiver(post_delete, sender=Cuisine)
+def invalidate_cuisine_registry(sender, **kwargs):
+    transaction.on_commit(cuisine_registry.invalidate, using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Food)
+@receiver(post_delete, sender=Food)
+def invalidate_menu_on_food_change(sender, instance, raw=False, origin=None, **kwargs):
+    if raw or _deleted_with_restaurant(origin):
+        return
+    transaction.on_commit(lambda: invalidate_menus([instance.restaurant_id]), using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_menu_on_restaurant_change(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidate_menus([instance.pk]), using=kwargs.get('using'))
+
+
+@receiver(m2m_changed, sender=Food.cuisines.through)
+def invalidate_menu_on_food_cuisine_change(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        instance._cleared_menu_restaurant_ids = set(instance.foods.values_list('restaurant_id', flat=True))
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        restaurant_ids = {instance.restaurant_id}
+    elif action == 'post_clear':
+        restaurant_ids = instance.__dict__.pop('_cleared_menu_restaurant_ids', set())
+    else:
+        restaurant_ids = set(Food.objects.filter(pk__in=pk_set).values_list('restaurant_id', flat=True))
+    transaction.on_commit(lambda: invalidate_menus(restaurant_ids), using=kwargs.get('using'))
+
+
+@receiver(post_save, sender=Food)
+@receiver(post_save, sender=RestaurantImage)
+def build_thumbnails_on_upload(sender, instance, raw, **kwargs):
+    if raw or not instance.image or instance.has_thumbnails:
+        return
+    transaction.on_commit(lambda: schedule_thumbnails(instance), using=kwargs.get('using'))
@@ -0,0 +1,14 @@
+from django import template
+
+from restaurants.thumbnails import THUMBNAIL_FORMATS, srcset
+
+register = template.Library()
+
+
+@register.inclusion_tag("responsive_image.html")
+def responsive_image(obj, alt, sizes, css_class=""):
+    """<picture> for a Food or RestaurantImage, offering its WebP/JPEG derivatives once they are built."""
+    sources = []
+    if obj.has_thumbnails:
+        sources = [(mime, srcset(obj.image.name, fmt)) for fmt, (_, mime) in THUMBNAIL_FORMATS.items()]
+    return {"url": obj.image.url, "sources": sources, "alt": alt, "sizes": sizes, "css_class": css_class}
@@ -1,5 +1,7 @@
 from django.test import TestCase
+from django.core.cache import cache
 from django.contrib.auth import get_user_model
+from accounts.middleware import forget_all_users
 from .factories import (
     UserFactory,
     RestaurantFactory,
@@ -29,7 +31,9 @@ class AuthMixin(TestCase):
 class RestaurantTestSetupMixin(AuthMixin):
     def setUp(self):
         super().setUp()
-        
+        cache.clear()  # facet counts would otherwise leak between tests
+        forget_all_users()
+
         self.user = self.create_user()
         self.login_user(self.user)
 
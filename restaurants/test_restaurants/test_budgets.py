@@ -0,0 +1,200 @@
+"""
+Query budgets and timing baselines for every named URL in restaurants/urls.py.
+
+Each URL is requested anonymously and logged in against a catalogue of a few
+thousand restaurants, reviews and bookmarks, with a cold cache, and must stay within
+its fixed number of queries.
+
+The timing check is opt-in, since wall times depend on the machine: it compares the
+median time of each request with timing_baseline.json and fails beyond TIMING_TOLERANCE.
+The baseline is local to the machine and ignored by git. The first CHECK_TIMINGS run
+records it, so run it before the change under test and again after:
+
+    CHECK_TIMINGS=1 python manage.py test restaurants.test_restaurants.test_budgets
+
+UPDATE_TIMING_BASELINE=1 records a new baseline over an existing one.
+"""
+import json
+import os
+import statistics
+import time
+from io import StringIO
+from pathlib import Path
+from unittest import skipUnless
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import get_resolver, reverse
+
+from restaurants.models import Bookmark, Food, Restaurant, RestaurantImage, Review, Visited
+from restaurants.test_restaurants.factories import (
+    BookmarkFactory, CuisineFactory, FoodFactory, RestaurantFactory, ReviewFactory, UserFactory, VisitedFactory,
+)
+
+RESTAURANTS = 2000
+USERS = 60
+REVIEWS_PER_USER = 50
+MENU_SIZE = 60
+
+BASELINE_PATH = Path(__file__).with_name("timing_baseline.json")
+TIMING_RUNS = 5
+# Allowed slowdown against the baseline, relative and absolute (timings are noisy on small numbers).
+TIMING_TOLERANCE = float(os.environ.get("TIMING_TOLERANCE", "1.0"))
+TIMING_SLACK_MS = 5.0
+UPDATE_TIMING_BASELINE = bool(os.environ.get("UPDATE_TIMING_BASELINE"))
+CHECK_TIMINGS = bool(os.environ.get("CHECK_TIMINGS")) or UPDATE_TIMING_BASELINE
+RECORD_BASELINE = UPDATE_TIMING_BASELINE or not BASELINE_PATH.exists()
+
+
+class QueryBudgetTests(TestCase):
+    # url name -> (anonymous, logged-in) query budget, cold cache. Login-required views redirect anonymous users.
+    BUDGETS = {
+        "restaurant_list": (6, 8),  # cuisines, count, 2 facet counts, rows, cover images (+ session, user)
+        "restaurant_detail": (4, 6),  # restaurant, images, cuisines, reviews
+        "restaurant_reviews": (1, 3),
+        "restaurant_foods": (4, 6),  # cuisines, restaurant, count, rows
+        "toggle_bookmark": (0, 4),  # DELETE, and INSERT when nothing was deleted
+        "toggle_visited": (0, 4),
+        "restaurant_list_api": (4, 4),  # version aggregate, rows, cuisines, images
+        "toggle_batch": (0, 10),  # per type a SELECT, DELETE and INSERT, in a savepoint
+        "add_review": (0, 10),  # a savepoint around the save, to turn a double submit into an update
+        "delete_review": (0, 8),
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cuisines = [CuisineFactory() for _ in range(12)]
+        cls.cuisine = cuisines[0]
+        restaurants = RestaurantFactory.build_batch(RESTAURANTS)
+        for i, restaurant in enumerate(restaurants):
+            restaurant.cost_for_two = 100 * (i % 20 + 1)
+            restaurant.diet_type = i % 3 + 1
+            restaurant.is_spotlight = i % 25 == 0
+            restaurant.latitude, restaurant.longitude = 12.9 + i % 40 / 100, 77.5 + i // 40 / 100
+            # What save() would derive; the search documents follow once the menus exist.
+            restaurant.derive_fields()
+        restaurants = Restaurant.objects.bulk_create(restaurants, batch_size=500)
+        Restaurant.cuisines.through.objects.bulk_create([
+            Restaurant.cuisines.through(restaurant=restaurant, cuisine=cuisines[j])
+            for i, restaurant in enumerate(restaurants) for j in {i % 12, (i * 7) % 12}
+        ])
+        RestaurantImage.objects.bulk_create([
+            RestaurantImage(restaurant=restaurant, image=f"restaurant_images/{restaurant.pk}-{n}.jpg")
+            for restaurant in restaurants for n in range(2)
+        ])
+
+        cls.restaurant = restaurants[0]
+        Food.objects.bulk_create(
+            FoodFactory.build_batch(MENU_SIZE, restaurant=cls.restaurant)
+            + [FoodFactory.build(restaurant=restaurant) for restaurant in restaurants[1:]]
+        )
+
+        users = [UserFactory() for _ in range(USERS)]
+        cls.user = users[0]
+        Review.objects.bulk_create([
+            ReviewFactory.build(user=user, restaurant=restaurants[1 + (u * REVIEWS_PER_USER + n) % (RESTAURANTS - 1)])
+            for u, user in enumerate(users[1:]) for n in range(REVIEWS_PER_USER)
+        ] + [ReviewFactory.build(user=user, restaurant=cls.restaurant) for user in users[1:] if user.pk % 2])
+        Bookmark.objects.bulk_create([
+            BookmarkFactory.build(user=user, restaurant=restaurants[(u * 31 + n) % RESTAURANTS])
+            for u, user in enumerate(users) for n in range(20)
+        ], ignore_conflicts=True)
+        Visited.objects.bulk_create([
+            VisitedFactory.build(user=user, restaurant=restaurants[(u * 17 + n) % RESTAURANTS])
+            for u, user in enumerate(users) for n in range(20)
+        ], ignore_conflicts=True)
+
+        Restaurant.objects.all().refresh_search_documents()
+        call_command("rebuild_rating_aggregates", stdout=StringIO())
+
+        cls.timings = {}
+
+    @classmethod
+    def tearDownClass(cls):
+        if RECORD_BASELINE and cls.timings:
+            BASELINE_PATH.write_text(json.dumps(dict(sorted(cls.timings.items())), indent=2) + "\n")
+        super().tearDownClass()
+
+    def requests(self, name):
+        """(method, url, data) of a typical request to the named URL."""
+        restaurant = self.restaurant
+        if name == "restaurant_list":
+            return "get", reverse("restaurants:restaurant_list"), {"cuisines": self.cuisine.pk, "sort_by": "price_low"}
+        if name == "restaurant_detail":
+            return "get", reverse("restaurants:restaurant_detail", kwargs={"pk": restaurant.pk}), {}
+        if name == "restaurant_reviews":
+            first_page = self.client.get(reverse("restaurants:restaurant_detail", kwargs={"pk": restaurant.pk}))
+            cursor = first_page.context["reviews"].next_cursor
+            return "get", reverse("restaurants:restaurant_reviews", kwargs={"pk": restaurant.pk}), {"cursor": cursor}
+        if name == "restaurant_foods":
+            return "get", reverse("restaurants:restaurant_foods", kwargs={"restaurant_id": restaurant.pk}), {"page": 2}
+        if name in ("toggle_bookmark", "toggle_visited"):
+            return "post", reverse(f"restaurants:{name}"), {"restaurant_id": restaurant.pk}
+        if name == "restaurant_list_api":
+            return "get", reverse("restaurants:restaurant_list_api"), {"near": "12.95,77.55", "radius_km": 10}
+        if name == "toggle_batch":
+            toggles = [{"type": kind, "restaurant_id": pk} for kind in ("bookmark", "visited") for pk in range(1, 21)]
+            return "post", reverse("restaurants:toggle_batch"), json.dumps({"toggles": toggles})
+        if name == "add_review":
+            url = reverse("restaurants:add_review", kwargs={"restaurant_id": restaurant.pk})
+            return "post", url, {"rating": 4, "comment": "Good"}
+        if name == "delete_review":
+            review = Review.objects.filter(user=self.user).first() or ReviewFactory(user=self.user, restaurant=restaurant)
+            return "post", reverse("restaurants:delete_review", kwargs={"pk": review.pk}), {}
+        raise AssertionError(f"No request defined for {name}")
+
+    def send(self, method, url, data):
+        cache.clear()
+        if isinstance(data, str):
+            return self.client.post(url, data, content_type="application/json")
+        return getattr(self.client, method)(url, data)
+
+    def measure(self, name):
+        request = self.requests(name)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.send(*request)
+        self.assertLess(response.status_code, 400, f"{name}: {response.status_code}")
+        return len(queries.captured_queries), queries, request
+
+    def test_every_named_url_has_a_budget(self):
+        names = {
+            name for name, _ in get_resolver().namespace_dict["restaurants"][1].reverse_dict.items()
+            if isinstance(name, str)
+        }
+        self.assertEqual(names, set(self.BUDGETS))
+
+    def test_anonymous_requests_should_stay_within_budget(self):
+        for name, (budget, _) in self.BUDGETS.items():
+            with self.subTest(name):
+                count, queries, _ = self.measure(name)
+                self.assertLessEqual(count, budget, "\n".join(q["sql"] for q in queries.captured_queries))
+
+    def test_logged_in_requests_should_stay_within_budget(self):
+        self.client.force_login(self.user)
+        for name, (_, budget) in self.BUDGETS.items():
+            with self.subTest(name):
+                count, queries, _ = self.measure(name)
+                self.assertLessEqual(count, budget, "\n".join(q["sql"] for q in queries.captured_queries))
+
+    @skipUnless(CHECK_TIMINGS, "set CHECK_TIMINGS=1 to compare timings with timing_baseline.json")
+    def test_timings_should_not_regress_past_the_baseline(self):
+        baseline = json.loads(BASELINE_PATH.read_text()) if BASELINE_PATH.exists() else {}
+        self.client.force_login(self.user)
+        for name in self.BUDGETS:
+            self.send(*self.requests(name))  # warm up templates and connections
+            samples = []
+            for _ in range(TIMING_RUNS):
+                request = self.requests(name)  # e.g. a fresh review to delete
+                started = time.perf_counter()
+                self.send(*request)
+                samples.append((time.perf_counter() - started) * 1000)
+            median = round(statistics.median(samples), 2)
+            type(self).timings[name] = median
+
+            if name in baseline and not RECORD_BASELINE:
+                with self.subTest(name):
+                    limit = baseline[name] * (1 + TIMING_TOLERANCE) + TIMING_SLACK_MS
+                    self.assertLessEqual(median, limit, f"{name} took {median} ms, baseline {baseline[name]} ms")
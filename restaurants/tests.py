@@ -1,9 +1,48 @@
-from django.urls import reverse
-from django.test import TestCase
-from .models import Bookmark, Visited, Review, Restaurant
+from django.urls import reverse, reverse_lazy
+from django.test import TestCase, TransactionTestCase
+from .models import Bookmark, Cuisine, Visited, Review, Restaurant, RestaurantImage, Food, DietType, ImportCheckpoint
 from restaurants.test_restaurants.mixins import RestaurantTestSetupMixin
 from django.contrib.auth.models import User
-from restaurants.filters import RestaurantFilter
+from restaurants.filters import RatingBucketFilter, RestaurantFilter
+from restaurants import geo, search
+from restaurants.registry import CuisineRegistry, cuisine_choices
+from restaurants.test_restaurants.factories import CuisineFactory, FoodFactory, RestaurantFactory, ReviewFactory, UserFactory
+from django.core import serializers
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.exceptions import ValidationError
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock
+from django.utils import timezone
+import datetime
+import time
+from importlib import import_module
+from django.apps import apps
+from pathlib import Path
+import json
+import tempfile
+from django.db import connection
+from django.db.models import Count, FloatField
+from django.db.models.functions import Cast
+from django.test.utils import CaptureQueriesContext
+from django.core.cache import cache, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import override_settings
+from PIL import Image
+from restaurants.thumbnails import derivative_name
+from restaurants.pagination import EstimatedCountPaginator, cursor_value, estimated_row_count
+from restaurants.management.commands.rebuild_rating_aggregates import find_rating_drift
+from restaurants import async_views
+from restaurants.views import AddReviewView
+from restaurants.management.commands.load_test import DEFAULT_PATHS
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, QueryDict
+from django.test import AsyncRequestFactory, RequestFactory
+from homebite.instrumentation import RequestStats, request_stats
+import re
 
 class TestRestaurantListView(RestaurantTestSetupMixin, TestCase):
     def test_list_page_should_load_restaurants(self):
@@ -224,6 +263,23 @@ class TestAddReviewView(RestaurantTestSetupMixin):
         self.assertEqual(review.rating, 4)
         self.assertEqual(review.comment, "Better now")
 
+    def test_double_submit_should_update_the_review_created_meanwhile(self):
+        Review.objects.create(user=self.user, restaurant=self.restaurant, rating=3, comment="Good")
+
+        def stale_get_object(view, queryset=None):
+            # As if the first submit had not committed when the second one looked.
+            view.restaurant = self.restaurant
+            return Review(user=self.user, restaurant=self.restaurant)
+
+        url = reverse("restaurants:add_review", kwargs={"restaurant_id": self.restaurant.id})
+        with mock.patch.object(AddReviewView, "get_object", stale_get_object):
+            response = self.client.post(url, {"rating": 1, "comment": "Changed my mind"})
+        self.assertEqual(response.status_code, 302)
+        review = Review.objects.get(user=self.user, restaurant=self.restaurant)
+        self.assertEqual((review.rating, review.comment), (1, "Changed my mind"))
+        self.restaurant.refresh_from_db()
+        self.assertEqual((self.restaurant.review_count, self.restaurant.average_rating), (1, Decimal("1.0")))
+
 
     def test_should_require_login(self):
         self.client.logout()
@@ -253,3 +309,1487 @@ class TestDeleteReviewView(RestaurantTestSetupMixin):
         response = self.client.post(url)
         self.assertEqual(response.status_code, 403)
         self.assertTrue(Review.objects.filter(id=review_by_other.id).exists())
+
+
+class TestRatingAggregates(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.restaurant = RestaurantFactory(average_rating=0)
+
+    def test_new_reviews_should_update_stored_aggregates(self):
+        ReviewFactory(restaurant=self.restaurant, rating=5)
+        ReviewFactory(restaurant=self.restaurant, rating=4)
+        self.restaurant.refresh_from_db()
+
+        self.assertEqual(self.restaurant.review_count, 2)
+        self.assertEqual(self.restaurant.rating_sum, 9)
+        self.assertEqual(self.restaurant.rating_5_count, 1)
+        self.assertEqual(self.restaurant.rating_4_count, 1)
+        self.assertEqual(self.restaurant.average_rating, Decimal("4.5"))
+
+    def test_editing_a_review_should_move_it_between_star_counts(self):
+        review = ReviewFactory(restaurant=self.restaurant, rating=2)
+        review = Review.objects.get(pk=review.pk)
+        review.rating = 5
+        review.save()
+        self.restaurant.refresh_from_db()
+
+        self.assertEqual(self.restaurant.review_count, 1)
+        self.assertEqual(self.restaurant.rating_2_count, 0)
+        self.assertEqual(self.restaurant.rating_5_count, 1)
+        self.assertEqual(self.restaurant.average_rating, Decimal("5.0"))
+
+    def test_deleting_a_review_should_update_stored_aggregates(self):
+        ReviewFactory(restaurant=self.restaurant, rating=3)
+        review = ReviewFactory(restaurant=self.restaurant, rating=4)
+        review.delete()
+        self.restaurant.refresh_from_db()
+
+        self.assertEqual(self.restaurant.review_count, 1)
+        self.assertEqual(self.restaurant.rating_4_count, 0)
+        self.assertEqual(self.restaurant.average_rating, Decimal("3.0"))
+
+    def test_migration_backfill_should_store_half_up_averages(self):
+        backfill = import_module("restaurants.migrations.0004_restaurant_rating_aggregates").backfill_rating_aggregates
+        for rating in (5, 4, 4, 4):  # 4.25 -> 4.3
+            ReviewFactory(restaurant=self.restaurant, rating=rating)
+        Restaurant.objects.update(average_rating=Decimal("1.0"), review_count=0)
+
+        backfill(apps, None)
+        self.restaurant.refresh_from_db()
+        self.assertEqual((self.restaurant.review_count, self.restaurant.average_rating), (4, Decimal("4.3")))
+        self.assertEqual(Restaurant.objects.get(pk=self.restaurants[0].pk).average_rating, Decimal("0.0"))
+
+    def test_review_write_cost_should_not_grow_with_review_count(self):
+        ReviewFactory.create_batch(20, restaurant=self.restaurant)
+        user = UserFactory()
+        # INSERT + one aggregate UPDATE, wrapped in a savepoint by the atomic block
+        with self.assertNumQueries(4):
+            Review.objects.create(user=user, restaurant=self.restaurant, rating=5)
+
+    def test_rebuild_command_should_repair_drifted_aggregates(self):
+        ReviewFactory(restaurant=self.restaurant, rating=4)
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(review_count=7, average_rating=1)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_rating_aggregates", "--verify", stdout=StringIO())
+        call_command("rebuild_rating_aggregates", stdout=StringIO())
+        call_command("rebuild_rating_aggregates", "--verify", stdout=StringIO())
+
+        self.restaurant.refresh_from_db()
+        self.assertEqual(self.restaurant.review_count, 1)
+        self.assertEqual(self.restaurant.average_rating, Decimal("4.0"))
+
+    def test_rating_stats_should_be_read_without_queries(self):
+        ReviewFactory(restaurant=self.restaurant, rating=5)
+        ReviewFactory(restaurant=self.restaurant, rating=5)
+        ReviewFactory(restaurant=self.restaurant, rating=2)
+        self.restaurant.refresh_from_db()
+
+        with self.assertNumQueries(0):
+            stats = self.restaurant.get_rating_stats()
+
+        self.assertEqual(stats[0], {"star": "5", "percentage": 67, "count": 2})
+        self.assertEqual(stats[3], {"star": "2", "percentage": 33, "count": 1})
+
+    def test_histogram_check_command_should_report_and_fix_mismatches(self):
+        ReviewFactory(restaurant=self.restaurant, rating=3)
+        Restaurant.objects.filter(pk=self.restaurant.pk).update(rating_3_count=0, rating_1_count=2)
+
+        with self.assertRaises(CommandError):
+            call_command("check_rating_histogram", stdout=StringIO())
+        call_command("check_rating_histogram", "--fix", stdout=StringIO())
+
+        self.restaurant.refresh_from_db()
+        self.assertEqual(self.restaurant.rating_histogram, {1: 0, 2: 0, 3: 1, 4: 0, 5: 0})
+
+
+class TestKeysetPagination(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        for i in range(20):
+            # Repeated ratings and prices exercise the pk tie-break.
+            RestaurantFactory(average_rating=i % 4 + 1, cost_for_two=100 * (i % 3), cuisines=[self.cuisine])
+        self.url = reverse("restaurants:restaurant_list")
+
+    def walk_pages(self, params):
+        names, cursor, pages = [], "", []
+        while cursor is not None:
+            response = self.client.get(self.url, {**params, "cursor": cursor})
+            self.assertEqual(response.status_code, 200)
+            page = response.context["page_obj"]
+            names += [r.name for r in page]
+            pages.append(page)
+            cursor = page.next_cursor
+        return names, pages
+
+    def test_cursor_pages_should_match_every_sort_order(self):
+        for params, ordering in [
+            ({}, ["-average_rating"]),
+            ({"sort_by_rating": "rating_high"}, ["-average_rating"]),
+            ({"sort_by_rating": "rating_low"}, ["average_rating"]),
+            ({"sort_by": "price_low"}, ["cost_for_two"]),
+            ({"sort_by": "price_high"}, ["-cost_for_two"]),
+        ]:
+            with self.subTest(params=params):
+                expected = list(Restaurant.objects.order_by(*ordering, "pk").values_list("name", flat=True))
+                names, _ = self.walk_pages(params)
+                self.assertEqual(names, expected)
+
+    def test_cursor_pages_should_walk_ranked_search_results(self):
+        for i in range(14):
+            # Ranks that differ in their last digits, and ties.
+            RestaurantFactory(name=f"Dosa Corner {i}", address=" ".join(["dosa"] * (i % 5)) or "Main Road")
+        expected = list(Restaurant.objects.search("dosa").order_by("-search_rank", "pk").values_list("name", flat=True))
+
+        names, pages = self.walk_pages({"q": "dosa"})
+        self.assertEqual(names, expected)
+        self.assertEqual(len(pages), 2)
+
+    def test_postgres_search_rank_should_be_a_double(self):
+        # A float4 rank would not survive the cursor's round trip exactly and could repeat or skip rows.
+        with mock.patch("restaurants.search.connections") as connections:
+            connections.__getitem__.return_value.vendor = "postgresql"
+            rank = Restaurant.objects.search("dosa").query.annotations["search_rank"]
+        self.assertIsInstance(rank, Cast)
+        self.assertIsInstance(rank.output_field, FloatField)
+        self.assertEqual(cursor_value(0.1 + 0.2), "0.30000000000000004")
+
+    def test_previous_cursor_should_return_the_preceding_page(self):
+        _, pages = self.walk_pages({"sort_by": "price_high"})
+        response = self.client.get(self.url, {"sort_by": "price_high", "cursor": pages[2].previous_cursor})
+
+        self.assertEqual(list(response.context["page_obj"]), list(pages[1]))
+
+    def test_cursor_mode_should_not_count_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(self.url, {"cursor": ""})
+
+        restaurant_counts = [
+            q["sql"] for q in queries.captured_queries
+            if "COUNT(*)" in q["sql"] and 'FROM "restaurants_restaurant"' in q["sql"]
+        ]
+        self.assertEqual(restaurant_counts, [])
+
+    def test_tampered_cursor_should_404(self):
+        response = self.client.get(self.url, {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 404)
+
+
+class TestListQueryIndexes(RestaurantTestSetupMixin, TestCase):
+    def assertUsesIndex(self, queryset, table):
+        if connection.vendor == "postgresql":
+            with connection.cursor() as cursor:
+                # Tiny test tables always favour a seq scan; only check that an index can serve the query.
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+            self.assertNotIn(f"Seq Scan on {table}", plan)
+        else:
+            plan = queryset.explain()
+            table_steps = [line for line in plan.splitlines() if f" {table}" in line]
+            self.assertTrue(table_steps, plan)
+            for line in table_steps:
+                self.assertIn("INDEX", line, plan)
+
+    def list_queryset(self, data):
+        queryset = Restaurant.objects.order_by("-average_rating").with_user_bookmarks(self.user).with_user_visited(self.user)
+        return RestaurantFilter(data=data, queryset=queryset).qs
+
+    def test_list_page_query_shapes_should_use_an_index(self):
+        for data in [
+            {},
+            {"is_spotlight": "true"},
+            {"diet_type": ["1"]},
+            {"cost_for_two_min": 100, "cost_for_two_max": 300},
+            {"sort_by": "price_low"},
+            {"sort_by": "price_high"},
+            {"sort_by_rating": "rating_low"},
+            {"open_at": "23:30"},
+        ]:
+            with self.subTest(data=data):
+                self.assertUsesIndex(self.list_queryset(data), "restaurants_restaurant")
+
+    def test_user_state_subqueries_should_use_an_index(self):
+        for model in (Bookmark, Visited):
+            with self.subTest(model=model.__name__):
+                queryset = model.objects.filter(user=self.user, restaurant=self.restaurant)
+                self.assertUsesIndex(queryset, model._meta.db_table)
+
+    def test_review_breakdown_should_use_an_index(self):
+        queryset = Review.objects.filter(restaurant=self.restaurant).values("rating").annotate(count=Count("id"))
+        self.assertUsesIndex(queryset, "restaurants_review")
+
+
+class TestRestaurantListQueryCount(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        cuisine_choices()  # the registry loads once per process, not per request
+
+    def add_restaurants_with_images(self, count):
+        # Run the on-commit facet cache invalidation, so every page view counts them afresh.
+        # The image paths are fake, so there is nothing to build thumbnails from.
+        with mock.patch("restaurants.signals.schedule_thumbnails"), self.captureOnCommitCallbacks(execute=True):
+            for restaurant in RestaurantFactory.create_batch(count, cuisines=[self.cuisine]):
+                RestaurantImage.objects.create(restaurant=restaurant, image=f"restaurant_images/{restaurant.pk}.jpg")
+                RestaurantImage.objects.create(restaurant=restaurant, image=f"restaurant_images/{restaurant.pk}-2.jpg")
+
+    def test_list_page_query_count_should_not_depend_on_cards(self):
+        self.client.get(reverse("restaurants:restaurant_list"))  # loads the user into the process cache
+        self.add_restaurants_with_images(2)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(reverse("restaurants:restaurant_list"))
+
+        self.add_restaurants_with_images(8)
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(reverse("restaurants:restaurant_list"))
+
+        self.assertEqual(len(few), len(many))
+
+    def test_list_page_should_render_with_fixed_query_count(self):
+        self.client.get(reverse("restaurants:restaurant_list"))  # loads the user into the process cache
+        self.add_restaurants_with_images(10)
+        # session, page count, facet counts (restaurants + cuisines), page rows, images prefetch
+        with self.assertNumQueries(6):
+            response = self.client.get(reverse("restaurants:restaurant_list"))
+        self.assertContains(response, "restaurant_images/")
+
+    def test_card_should_show_first_image_as_cover(self):
+        self.add_restaurants_with_images(1)
+        restaurant = Restaurant.objects.with_cover_image().filter(images__isnull=False).distinct().get()
+
+        with self.assertNumQueries(0):
+            cover = restaurant.cover_image
+        self.assertEqual(cover, restaurant.images.order_by("pk").first())
+
+
+class TestRestaurantCardCache(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        caches["template_fragments"].clear()
+
+    def card_key(self, restaurant):
+        restaurant = Restaurant.objects.with_cover_image().get(pk=restaurant.pk)
+        cover = restaurant.cover_image
+        return make_template_fragment_key(
+            "restaurant_card", [restaurant.pk, restaurant.updated_at.isoformat(), cover.pk if cover else ""]
+        )
+
+    def test_list_page_should_cache_each_card(self):
+        self.client.get(reverse("restaurants:restaurant_list"))
+        self.assertIn(self.restaurant.name, caches["template_fragments"].get(self.card_key(self.restaurant)))
+
+    def test_cached_cards_should_keep_per_user_bookmark_state(self):
+        Bookmark.objects.create(user=self.user, restaurant=self.restaurant)
+        response = self.client.get(reverse("restaurants:restaurant_list"))
+        self.assertEqual(response.content.decode().count("bi-bookmark-fill text-yellow-400"), 1)
+
+        self.login_user(UserFactory())
+        response = self.client.get(reverse("restaurants:restaurant_list"))
+        self.assertNotContains(response, "bi-bookmark-fill text-yellow-400")
+
+    def test_image_and_cuisine_changes_should_change_the_card_key(self):
+        key = self.card_key(self.restaurant)
+        RestaurantImage.objects.create(restaurant=self.restaurant, image="restaurant_images/new.jpg")
+        after_image = self.card_key(self.restaurant)
+        self.assertNotEqual(key, after_image)
+
+        self.restaurant.cuisines.add(self.cuisines[0])
+        self.assertNotEqual(after_image, self.card_key(self.restaurant))
+
+
+class TestRestaurantSearch(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.thai = CuisineFactory(name="Thai")
+        self.noodle_bar = RestaurantFactory(name="Noodle Bar", city="Chennai", cuisines=[self.thai])
+        self.pizzeria = RestaurantFactory(name="Luigi's", city="Pune")
+        FoodFactory(restaurant=self.pizzeria, name="Margherita Pizza", description="Wood fired")
+
+    def search(self, text):
+        return list(RestaurantFilter(data={"q": text}, queryset=Restaurant.objects.all()).qs)
+
+    def test_search_should_match_name_city_cuisine_and_menu(self):
+        self.assertEqual(self.search("noodle"), [self.noodle_bar])
+        self.assertEqual(self.search("chennai"), [self.noodle_bar])
+        self.assertEqual(self.search("thai"), [self.noodle_bar])
+        self.assertEqual(self.search("pizza"), [self.pizzeria])
+        self.assertEqual(self.search("wood fired"), [self.pizzeria])
+
+    def test_search_should_match_every_term_as_a_prefix(self):
+        self.assertEqual(self.search("pizz"), [self.pizzeria])
+        self.assertEqual(self.search("marg wood"), [self.pizzeria])
+        self.assertEqual(self.search("marg noodle"), [])
+        # The PostgreSQL query has the same shape, with tsquery syntax stripped from the input.
+        self.assertEqual(search.tsquery("marg  wood"), "marg:* & wood:*")
+        self.assertEqual(search.tsquery("pizz|a & !(x)"), "pizz:* & a:* & x:*")
+        self.assertEqual(search.tsquery(" :* "), "")
+
+    def test_partial_save_should_refresh_the_document_and_index(self):
+        self.noodle_bar.name = "Ramen House"
+        self.noodle_bar.save(update_fields=["name"])
+        self.noodle_bar.refresh_from_db()
+        self.assertIn("Ramen House", self.noodle_bar.search_document)
+        self.assertEqual(self.search("ramen"), [self.noodle_bar])
+        self.assertEqual(self.search("noodle"), [])
+
+        # Fields the document does not read leave it and the index alone.
+        with mock.patch("restaurants.search.index_documents") as index_documents:
+            self.noodle_bar.save(update_fields=["cost_for_two"])
+        index_documents.assert_not_called()
+
+    def test_search_should_follow_menu_and_cuisine_changes(self):
+        FoodFactory(restaurant=self.noodle_bar, name="Pad See Ew")
+        self.assertEqual(self.search("ew"), [self.noodle_bar])
+
+        self.noodle_bar.cuisines.remove(self.thai)
+        self.assertEqual(self.search("thai"), [])
+
+        self.thai.name = "Siamese"
+        self.thai.save()
+        self.pizzeria.cuisines.add(self.thai)
+        self.assertEqual(self.search("siamese"), [self.pizzeria])
+
+    def test_search_should_rank_better_matches_first(self):
+        pizza_place = RestaurantFactory(name="Pizza Pizza", city="Pune")
+        results = self.search("pizza")
+        self.assertEqual(results[0], pizza_place)
+        self.assertIn(self.pizzeria, results)
+
+    def test_search_should_ignore_query_syntax_and_deleted_restaurants(self):
+        self.assertEqual(self.search('noodle" OR *'), [])
+        self.noodle_bar.delete()
+        self.assertEqual(self.search("noodle"), [])
+
+    def test_list_view_should_search_with_q(self):
+        response = self.client.get(reverse("restaurants:restaurant_list"), {"q": "pizza"})
+        self.assertContains(response, "Luigi&#x27;s")
+        self.assertNotContains(response, "Noodle Bar")
+
+
+class TestImportCatalogue(RestaurantTestSetupMixin, TestCase):
+    def write_file(self, suffix, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = Path(directory.name) / f"catalogue{suffix}"
+        path.write_text(content)
+        return path
+
+    def jsonl(self, *records):
+        return self.write_file(".jsonl", "".join(json.dumps(record) + "\n" for record in records))
+
+    def restaurant_record(self, name, **fields):
+        return {
+            "type": "restaurant", "name": name, "city": "Mysuru", "address": "1 Palace Rd",
+            "cost_for_two": 500, "diet_type": "Vegan", "opening_time": "08:00", "closing_time": "23:30",
+            "cuisines": ["South Indian"], **fields,
+        }
+
+    def test_import_should_create_restaurants_menus_and_images(self):
+        path = self.jsonl(
+            {"type": "cuisine", "name": "Chettinad"},
+            self.restaurant_record("Mylari", cuisines=["South Indian", "Chettinad"]),
+            {"type": "food", "restaurant": "Mylari", "name": "Butter Dosa", "price": "80.50", "cuisines": ["South Indian"]},
+            {"type": "image", "restaurant": "Mylari", "image": "restaurant_images/mylari.jpg"},
+        )
+        call_command("import_catalogue", str(path), stdout=StringIO())
+
+        restaurant = Restaurant.objects.get(name="Mylari")
+        self.assertEqual(restaurant.diet_type, DietType.VEGAN)
+        self.assertCountEqual(restaurant.cuisines.values_list("name", flat=True), ["South Indian", "Chettinad"])
+        food = restaurant.menu.get()
+        self.assertEqual(food.price, Decimal("80.50"))
+        self.assertEqual(list(food.cuisines.values_list("name", flat=True)), ["South Indian"])
+        self.assertEqual(restaurant.images.get().image.name, "restaurant_images/mylari.jpg")
+        self.assertEqual(list(Restaurant.objects.search("dosa")), [restaurant])
+
+    def test_import_should_upsert_restaurants_by_name(self):
+        call_command("import_catalogue", str(self.jsonl(self.restaurant_record("Mylari"))), stdout=StringIO())
+        path = self.jsonl(self.restaurant_record("Mylari", city="Bengaluru", cuisines=["Cafe"]))
+        call_command("import_catalogue", str(path), stdout=StringIO())
+
+        restaurant = Restaurant.objects.get(name="Mylari")
+        self.assertEqual(restaurant.city, "Bengaluru")
+        self.assertEqual(list(restaurant.cuisines.values_list("name", flat=True)), ["Cafe"])
+
+    def test_import_should_reject_out_of_range_coordinates(self):
+        path = self.jsonl(self.restaurant_record("Mylari", latitude=95, longitude=76.6))
+        with self.assertRaisesMessage(CommandError, "Record 1: invalid restaurant"):
+            call_command("import_catalogue", str(path), stdout=StringIO())
+
+    def test_import_should_read_csv(self):
+        path = self.write_file(
+            ".csv",
+            "type,name,city,address,cost_for_two,diet_type,opening_time,closing_time,cuisines,restaurant,price\n"
+            "restaurant,Mylari,Mysuru,1 Palace Rd,300,1,08:00,22:00,South Indian|Cafe,,\n"
+            "food,Set Dosa,,,,,,,,Mylari,60\n",
+        )
+        call_command("import_catalogue", str(path), stdout=StringIO())
+
+        restaurant = Restaurant.objects.get(name="Mylari")
+        self.assertEqual(restaurant.cuisines.count(), 2)
+        self.assertEqual(restaurant.menu.get().name, "Set Dosa")
+
+    def test_import_should_resume_from_checkpoint(self):
+        path = self.jsonl(
+            self.restaurant_record("Mylari"),
+            {"type": "food", "restaurant": "Mylari", "name": "Butter Dosa", "price": 80},
+            {"type": "food", "restaurant": "Nowhere", "name": "Idli", "price": 40},
+        )
+        with self.assertRaises(CommandError):
+            call_command("import_catalogue", str(path), "--batch-size=1", stdout=StringIO())
+        self.assertEqual(ImportCheckpoint.objects.get(source=str(path.resolve())).records, 2)
+
+        lines = path.read_text().splitlines()
+        lines[2] = json.dumps({"type": "food", "restaurant": "Mylari", "name": "Idli", "price": 40})
+        path.write_text("\n".join(lines) + "\n")
+        call_command("import_catalogue", str(path), "--resume", stdout=StringIO())
+
+        self.assertCountEqual(
+            Food.objects.filter(restaurant__name="Mylari").values_list("name", flat=True), ["Butter Dosa", "Idli"]
+        )
+
+    def test_checkpoint_should_commit_with_its_batch(self):
+        path = self.jsonl(
+            self.restaurant_record("Mylari"),
+            {"type": "food", "restaurant": "Mylari", "name": "Butter Dosa", "price": 80},
+        )
+        call_command("import_catalogue", str(path), "--batch-size=1", stdout=StringIO())
+        failing = mock.patch.object(ImportCheckpoint.objects, "update_or_create", side_effect=RuntimeError)
+        with failing, self.assertRaises(RuntimeError):
+            call_command("import_catalogue", str(path), stdout=StringIO())
+        self.assertEqual(Food.objects.filter(name="Butter Dosa").count(), 1)
+
+        # A crash right after a commit resumes after that batch instead of inserting it again.
+        call_command("import_catalogue", str(path), "--resume", stdout=StringIO())
+        self.assertEqual(Food.objects.filter(name="Butter Dosa").count(), 1)
+
+    def test_imported_photos_should_wait_for_rebuild_thumbnails(self):
+        path = self.jsonl(
+            self.restaurant_record("Mylari"),
+            {"type": "food", "restaurant": "Mylari", "name": "Butter Dosa", "price": 80, "image": "food_images/dosa.jpg"},
+            {"type": "food", "restaurant": "Mylari", "name": "Idli", "price": 40},
+            {"type": "image", "restaurant": "Mylari", "image": "restaurant_images/mylari.jpg"},
+        )
+        out = StringIO()
+        with mock.patch("restaurants.thumbnails.schedule_thumbnails") as schedule:
+            with self.captureOnCommitCallbacks(execute=True):
+                call_command("import_catalogue", str(path), stdout=out)
+        schedule.assert_not_called()
+        self.assertIn("2 photos need thumbnails; run rebuild_thumbnails.", out.getvalue())
+        self.assertEqual(Food.objects.get(name="Butter Dosa").thumbnails_for, "")
+
+    def test_importing_a_file_again_should_not_duplicate_foods_or_images(self):
+        records = [
+            self.restaurant_record("Mylari"),
+            {"type": "food", "restaurant": "Mylari", "name": "Butter Dosa", "price": 80, "cuisines": ["South Indian"]},
+            {"type": "image", "restaurant": "Mylari", "image": "restaurant_images/mylari.jpg"},
+        ]
+        call_command("import_catalogue", str(self.jsonl(*records)), stdout=StringIO())
+        records[1] = {**records[1], "price": 90, "cuisines": ["Cafe"]}
+        call_command("import_catalogue", str(self.jsonl(*records)), stdout=StringIO())
+
+        food = Food.objects.get(restaurant__name="Mylari")
+        self.assertEqual(food.price, Decimal("90"))
+        self.assertEqual(list(food.cuisines.values_list("name", flat=True)), ["Cafe"])
+        self.assertEqual(RestaurantImage.objects.filter(restaurant__name="Mylari").count(), 1)
+
+class TestToggleQueryCounts(RestaurantTestSetupMixin, TestCase):
+    # The session, then the toggle itself: DELETE, plus INSERT when switching on. After the
+    # first request the user comes from the process's user cache.
+    def setUp(self):
+        super().setUp()
+        self.client.post(reverse("restaurants:toggle_bookmark"), {"restaurant_id": self.restaurants[0].id})
+
+    def test_toggle_on_should_cost_a_delete_and_an_insert(self):
+        for name in ("restaurants:toggle_bookmark", "restaurants:toggle_visited"):
+            with self.subTest(name=name), self.assertNumQueries(3):
+                self.client.post(reverse(name), {"restaurant_id": self.restaurant.id})
+
+    def test_toggle_off_should_cost_a_single_delete(self):
+        Bookmark.objects.create(user=self.user, restaurant=self.restaurant)
+        Visited.objects.create(user=self.user, restaurant=self.restaurant)
+        for name in ("restaurants:toggle_bookmark", "restaurants:toggle_visited"):
+            with self.subTest(name=name), self.assertNumQueries(2):
+                self.client.post(reverse(name), {"restaurant_id": self.restaurant.id})
+
+    def test_malformed_restaurant_id_should_be_rejected(self):
+        response = self.client.post(reverse("restaurants:toggle_bookmark"), {"restaurant_id": "abc"})
+        self.assertEqual(response.status_code, 400)
+
+
+class TestToggleBatch(RestaurantTestSetupMixin, TestCase):
+    def post(self, toggles):
+        return self.client.post(
+            reverse("restaurants:toggle_batch"), json.dumps({"toggles": toggles}), content_type="application/json"
+        )
+
+    def test_batch_should_apply_toggles_and_explicit_states_in_order(self):
+        other = self.restaurants[0]
+        Bookmark.objects.create(user=self.user, restaurant=other)
+        response = self.post([
+            {"type": "bookmark", "restaurant_id": self.restaurant.id},
+            {"type": "bookmark", "restaurant_id": other.id},
+            {"type": "visited", "restaurant_id": other.id, "state": True},
+            {"type": "visited", "restaurant_id": other.id, "state": True},
+        ])
+
+        self.assertJSONEqual(response.content, {
+            "bookmark": {str(self.restaurant.id): True, str(other.id): False},
+            "visited": {str(other.id): True},
+        })
+        self.assertEqual(list(Bookmark.objects.filter(user=self.user).values_list("restaurant_id", flat=True)), [self.restaurant.id])
+        self.assertTrue(Visited.objects.filter(user=self.user, restaurant=other).exists())
+
+    def test_batch_query_count_should_not_grow_with_toggles(self):
+        toggles = [{"type": "bookmark", "restaurant_id": r.id} for r in self.restaurants]
+        self.post([{"type": "visited", "restaurant_id": self.restaurant.id}])  # loads the user
+        # session, SAVEPOINT, SELECT existing, INSERT, RELEASE
+        with self.assertNumQueries(5):
+            self.post(toggles)
+
+    def test_malformed_batch_should_be_rejected(self):
+        self.assertEqual(self.post([{"type": "like", "restaurant_id": 1}]).status_code, 400)
+        self.assertEqual(self.post(["bookmark"]).status_code, 400)
+
+    def test_state_should_only_accept_json_booleans(self):
+        Bookmark.objects.create(user=self.user, restaurant=self.restaurant)
+        for state in ("false", "0", 0, 1, "", []):
+            with self.subTest(state=state):
+                response = self.post([{"type": "bookmark", "restaurant_id": self.restaurant.id, "state": state}])
+                self.assertEqual(response.status_code, 400)
+        self.assertTrue(Bookmark.objects.filter(user=self.user, restaurant=self.restaurant).exists())
+
+        response = self.post([{"type": "bookmark", "restaurant_id": self.restaurant.id, "state": None}])
+        self.assertJSONEqual(response.content, {"bookmark": {str(self.restaurant.id): False}})
+
+
+class TestToggleForeignKeyValidation(TransactionTestCase):
+    # Foreign keys are checked at commit, so this needs real transactions.
+    def setUp(self):
+        self.user = UserFactory()
+        self.client.force_login(self.user)
+
+    def test_toggle_unknown_restaurant_should_be_rejected(self):
+        response = self.client.post(reverse("restaurants:toggle_bookmark"), {"restaurant_id": 999999})
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Bookmark.objects.exists())
+
+    def test_batch_with_unknown_restaurant_should_apply_nothing(self):
+        restaurant = RestaurantFactory()
+        response = self.client.post(
+            reverse("restaurants:toggle_batch"),
+            json.dumps({"toggles": [
+                {"type": "bookmark", "restaurant_id": restaurant.id},
+                {"type": "bookmark", "restaurant_id": 999999},
+            ]}),
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Bookmark.objects.exists())
+
+
+class TestRestaurantListApi(RestaurantTestSetupMixin, TestCase):
+    url = reverse_lazy("restaurants:restaurant_list_api")
+
+    def test_api_should_list_filtered_restaurants_as_json(self):
+        RestaurantImage.objects.create(restaurant=self.restaurant, image="restaurant_images/cover.jpg")
+        response = self.client.get(self.url, {"sort_by": "price_low"})
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(len(results), Restaurant.objects.count())
+        self.assertEqual([r["cost_for_two"] for r in results], sorted(r["cost_for_two"] for r in results))
+        entry = next(r for r in results if r["id"] == self.restaurant.id)
+        self.assertEqual(entry["cuisines"], [self.cuisine.name])
+        self.assertEqual(entry["images"], ["/media/restaurant_images/cover.jpg"])
+
+    def test_api_should_page_with_cursors(self):
+        RestaurantFactory.create_batch(25)
+        first = self.client.get(self.url).json()
+        second = self.client.get(self.url, {"cursor": first["next"]}).json()
+
+        ids = [r["id"] for r in first["results"] + second["results"]]
+        self.assertEqual(len(ids), Restaurant.objects.count())
+        self.assertEqual(len(set(ids)), len(ids))
+        self.assertIsNone(second["next"])
+
+    def test_unchanged_list_should_be_answered_with_304_from_one_query(self):
+        response = self.client.get(self.url)
+        self.assertTrue(response.has_header("Last-Modified"))
+
+        with self.assertNumQueries(1):
+            revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_etag_should_change_when_a_listed_restaurant_changes(self):
+        etag = self.client.get(self.url)["ETag"]
+        ReviewFactory(restaurant=self.restaurant, rating=1)
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+    def test_etag_should_change_when_a_listed_cuisine_is_renamed_or_deleted(self):
+        etag = self.client.get(self.url)["ETag"]
+        self.cuisine.name = "Chettinad"
+        self.cuisine.save()
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        entry = next(r for r in response.json()["results"] if r["id"] == self.restaurant.id)
+        self.assertEqual(entry["cuisines"], ["Chettinad"])
+
+        self.cuisine.delete()
+        revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 200)
+        self.assertNotIn("chettinad", Restaurant.objects.get(pk=self.restaurant.pk).search_document.lower())
+
+    def test_etag_should_change_when_a_listed_restaurant_is_deleted(self):
+        etag = self.client.get(self.url)["ETag"]
+        Restaurant.objects.filter(pk=self.restaurants[0].pk).delete()
+        self.assertNotEqual(self.client.get(self.url)["ETag"], etag)
+
+
+    def test_saved_filters_should_list_the_session_users_restaurants(self):
+        Bookmark.objects.create(user=self.user, restaurant=self.restaurants[0])
+        Visited.objects.create(user=self.user, restaurant=self.restaurants[1])
+
+        for params, expected in [({"bookmarked": 1}, self.restaurants[0]), ({"visited": 1}, self.restaurants[1])]:
+            with self.subTest(params=params):
+                response = self.client.get(self.url, params)
+                self.assertEqual([r["id"] for r in response.json()["results"]], [expected.id])
+                self.assertIn("Cookie", response["Vary"])
+
+    def test_saved_filters_should_not_share_etags_between_users(self):
+        Bookmark.objects.create(user=self.user, restaurant=self.restaurant)
+        etag = self.client.get(self.url, {"bookmarked": 1})["ETag"]
+
+        self.login_user(UserFactory())
+        response = self.client.get(self.url, {"bookmarked": 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [])
+
+    def test_etag_should_change_when_the_saved_list_changes(self):
+        old = Bookmark.objects.create(user=self.user, restaurant=self.restaurants[0])
+        etag = self.client.get(self.url, {"bookmarked": 1})["ETag"]
+        # One bookmark out and another in: the count stays, the restaurants are untouched.
+        old.delete()
+        Bookmark.objects.create(user=self.user, restaurant=self.restaurants[1])
+
+        response = self.client.get(self.url, {"bookmarked": 1}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([r["id"] for r in response.json()["results"]], [self.restaurants[1].id])
+
+class TestRestaurantDetailReviews(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.reviews = ReviewFactory.create_batch(25, restaurant=self.restaurant)
+        self.url = reverse("restaurants:restaurant_detail", kwargs={"pk": self.restaurant.pk})
+
+    def test_detail_page_should_show_only_the_newest_reviews(self):
+        response = self.client.get(self.url)
+        newest = sorted(self.reviews, key=lambda r: (r.created_at, r.id), reverse=True)
+
+        self.assertEqual(list(response.context["reviews"]), newest[:10])
+        self.assertContains(response, "Load more reviews")
+
+    def test_detail_page_query_count_should_not_depend_on_review_count(self):
+        self.client.get(self.url)  # loads the user; later requests take it from the process cache
+        # session, restaurant, images, cuisines, one page of reviews with users
+        with self.assertNumQueries(5):
+            self.client.get(self.url)
+        ReviewFactory.create_batch(10, restaurant=self.restaurant)
+        with self.assertNumQueries(5):
+            self.client.get(self.url)
+
+    def test_review_fragment_should_continue_from_the_cursor(self):
+        seen = list(self.client.get(self.url).context["reviews"])
+        page = self.client.get(self.url).context["reviews"]
+        while page.has_next():
+            response = self.client.get(
+                reverse("restaurants:restaurant_reviews", kwargs={"pk": self.restaurant.pk}),
+                {"cursor": page.next_cursor},
+            )
+            page = response.context["reviews"]
+            seen += list(page)
+
+        self.assertCountEqual(seen, self.reviews)
+        self.assertNotContains(response, "Load more reviews")
+
+    def test_only_own_review_should_get_edit_and_delete_controls(self):
+        own = ReviewFactory(restaurant=self.restaurant, user=self.user)
+        response = self.client.get(self.url)
+
+        self.assertContains(response, 'id="deleteConfirmPopup"', count=1)
+        self.assertContains(response, reverse("restaurants:delete_review", kwargs={"pk": own.pk}))
+
+
+class TestOpeningHoursFilter(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Restaurant.objects.all().delete()
+        self.lunch = RestaurantFactory(opening_time="11:00", closing_time="15:00")
+        self.late_night = RestaurantFactory(opening_time="20:00", closing_time="02:00")
+        self.all_day = RestaurantFactory(opening_time="00:00", closing_time="00:00")
+
+    def open_at(self, value):
+        return set(RestaurantFilter(data={"open_at": value}, queryset=Restaurant.objects.all()).qs)
+
+    def test_open_at_should_respect_windows_crossing_midnight(self):
+        self.assertEqual(self.open_at("12:00"), {self.lunch, self.all_day})
+        self.assertEqual(self.open_at("15:00"), {self.all_day})
+        self.assertEqual(self.open_at("23:59"), {self.late_night, self.all_day})
+        self.assertEqual(self.open_at("01:30"), {self.late_night, self.all_day})
+        self.assertEqual(self.open_at("02:00"), {self.all_day})
+
+    def test_open_now_should_use_the_current_local_time(self):
+        now = timezone.make_aware(datetime.datetime(2026, 1, 1, 21, 15))
+        with mock.patch("restaurants.filters.timezone.localtime", return_value=now):
+            open_now = RestaurantFilter(data={"open_now": "true"}, queryset=Restaurant.objects.all()).qs
+            closed_now = RestaurantFilter(data={"open_now": "false"}, queryset=Restaurant.objects.all()).qs
+
+            self.assertEqual(set(open_now), {self.late_night, self.all_day})
+            self.assertEqual(set(closed_now), {self.lunch})
+
+    def test_changing_hours_should_update_the_minute_columns(self):
+        self.lunch.closing_time = datetime.time(23, 0)
+        self.lunch.save()
+        self.assertIn(self.lunch, self.open_at("22:00"))
+
+    def test_partial_save_should_store_the_minute_columns_too(self):
+        self.lunch.closing_time = datetime.time(23, 0)
+        self.lunch.save(update_fields=["closing_time"])
+        self.assertIn(self.lunch, self.open_at("22:00"))
+
+    def test_raw_saves_should_derive_the_minute_columns(self):
+        # A fixture without the derived columns, like sample_data.json, saved the way loaddata saves it.
+        fixture = json.loads(serializers.serialize("json", Restaurant.objects.filter(pk=self.lunch.pk)))
+        for field in ("opening_minute", "closing_minute"):
+            del fixture[0]["fields"][field]
+        self.lunch.delete()
+        for obj in serializers.deserialize("json", json.dumps(fixture)):
+            obj.save()
+        self.assertEqual({r.name for r in self.open_at("12:00")}, {self.lunch.name, self.all_day.name})
+
+    def test_rebuild_command_should_repair_bulk_writes(self):
+        Restaurant.objects.filter(pk=self.lunch.pk).update(closing_time=datetime.time(23, 0))
+        with self.assertRaises(CommandError):
+            call_command("rebuild_restaurant_fields", "--verify", stdout=StringIO())
+
+        call_command("rebuild_restaurant_fields", stdout=StringIO())
+        self.assertIn(self.lunch, self.open_at("22:00"))
+        call_command("rebuild_restaurant_fields", "--verify", stdout=StringIO())
+
+
+class TestNearbyRestaurants(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Restaurant.objects.all().delete()
+        # Around Connaught Place, New Delhi
+        self.here = (28.6315, 77.2167)
+        self.next_door = RestaurantFactory(latitude=28.6330, longitude=77.2190)
+        self.across_town = RestaurantFactory(latitude=28.5562, longitude=77.1000)
+        self.other_city = RestaurantFactory(latitude=19.0760, longitude=72.8777)
+        self.unlocated = RestaurantFactory()
+
+    def near(self, **data):
+        data = {"near": "{},{}".format(*self.here), **data}
+        return RestaurantFilter(data=data, queryset=Restaurant.objects.order_by("-average_rating")).qs
+
+    def test_near_should_keep_restaurants_within_the_radius_nearest_first(self):
+        self.assertEqual(list(self.near()), [self.next_door])
+        self.assertEqual(list(self.near(radius_km=20)), [self.next_door, self.across_town])
+
+    def test_distance_should_match_the_haversine(self):
+        restaurant = self.near(radius_km=20).get(pk=self.across_town.pk)
+        expected = geo.haversine_km(*self.here, self.across_town.latitude, self.across_town.longitude)
+        self.assertAlmostEqual(restaurant.distance_km, expected, places=6)
+
+    def test_raw_and_bulk_writes_should_keep_the_geo_cell(self):
+        fixture = json.loads(serializers.serialize("json", Restaurant.objects.filter(pk=self.next_door.pk)))
+        del fixture[0]["fields"]["geo_cell"]
+        self.next_door.delete()
+        for obj in serializers.deserialize("json", json.dumps(fixture)):
+            obj.save()  # as loaddata does
+        self.assertEqual([r.name for r in self.near()], [self.next_door.name])
+
+        Restaurant.objects.filter(pk=self.other_city.pk).update(latitude=28.6320, longitude=77.2170)
+        call_command("rebuild_restaurant_fields", stdout=StringIO())
+        self.assertIn(self.other_city, self.near())
+
+    def test_out_of_range_coordinates_should_be_rejected(self):
+        for latitude, longitude in [(-91, 10), (91, 10), (10, 181), (10, -180.5)]:
+            with self.subTest(point=(latitude, longitude)):
+                with self.assertRaises(ValueError):
+                    RestaurantFactory(latitude=latitude, longitude=longitude)
+                restaurant = RestaurantFactory.build(latitude=latitude, longitude=longitude)
+                with self.assertRaises(ValidationError):
+                    restaurant.clean_fields(exclude=["opening_time", "closing_time"])
+
+    def test_invalid_location_should_not_validate(self):
+        for value in ["", "28.6", "north,east", "91,10", "10,181"]:
+            with self.subTest(value=value):
+                filterset = RestaurantFilter(data={"near": value}, queryset=Restaurant.objects.all())
+                if value:
+                    self.assertFalse(filterset.is_valid())
+                else:
+                    self.assertTrue(filterset.is_valid())
+        self.assertFalse(RestaurantFilter(data={"near": "1,1", "radius_km": 500}, queryset=Restaurant.objects.all()).is_valid())
+
+    def test_cells_should_cover_the_antimeridian(self):
+        fiji = RestaurantFactory(latitude=-17.0, longitude=179.99)
+        self.here = (-17.0, -179.99)
+        self.assertEqual(list(self.near()), [fiji])
+
+    def test_near_query_should_use_the_geo_cell_index(self):
+        plan = self.near(radius_km=50).explain()
+        self.assertIn("restaurant_geo_cell_idx", plan)
+
+    def test_list_page_should_support_near_with_cursor_pages(self):
+        response = self.client.get(reverse("restaurants:restaurant_list"), {"near": "28.6315,77.2167", "radius_km": 20, "cursor": ""})
+        self.assertEqual(list(response.context["restaurants"]), [self.next_door, self.across_town])
+
+    def test_backfill_should_fill_coordinates_from_the_gazetteer(self):
+        self.unlocated.city = "Pune"
+        self.unlocated.save()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "gazetteer.csv"
+            path.write_text("city,address,latitude,longitude\npune,,18.5204,73.8567\n")
+            call_command("backfill_coordinates", str(path), stdout=StringIO())
+
+        self.unlocated.refresh_from_db()
+        self.assertEqual((self.unlocated.latitude, self.unlocated.longitude), (18.5204, 73.8567))
+        self.assertEqual(list(self.near(near="18.52,73.85")), [self.unlocated])
+
+    def test_api_should_return_the_distance(self):
+        response = self.client.get(reverse("restaurants:restaurant_list_api"), {"near": "28.6315,77.2167"})
+        [result] = response.json()["results"]
+        self.assertEqual(result["id"], self.next_door.pk)
+        self.assertLess(result["distance_km"], 1)
+
+
+class TestFacetCounts(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Restaurant.objects.all().delete()
+        self.italian, self.chinese = self.cuisines
+        self.veg_italian = RestaurantFactory(diet_type=DietType.VEG, average_rating=4, cuisines=[self.italian])
+        self.veg_chinese = RestaurantFactory(diet_type=DietType.VEG, average_rating=5, cuisines=[self.chinese])
+        self.vegan_italian = RestaurantFactory(
+            diet_type=DietType.VEGAN, average_rating=4, cost_for_two=900, cuisines=[self.italian, self.chinese]
+        )
+
+    def facets(self, **data):
+        facets = RestaurantFilter(data=data, queryset=Restaurant.objects.all()).facets
+        return {name: {value: count for value, _, count in options} for name, options in facets.items()}
+
+    def test_facets_should_count_each_option(self):
+        facets = self.facets()
+        self.assertEqual(facets["diet_type"], {DietType.VEG: 2, DietType.NON_VEG: 0, DietType.VEGAN: 1})
+        self.assertEqual(facets["rating"], {1: 0, 2: 0, 3: 0, 4: 2, 5: 1})
+        self.assertEqual(facets["cuisines"][self.italian.pk], 2)
+        self.assertEqual(facets["cuisines"][self.chinese.pk], 2)
+
+    def test_facets_should_apply_the_other_filters_but_not_their_own(self):
+        facets = self.facets(diet_type=[DietType.VEG], cost_for_two_max=500)
+        self.assertEqual(facets["diet_type"], {DietType.VEG: 2, DietType.NON_VEG: 0, DietType.VEGAN: 0})
+        self.assertEqual(facets["rating"], {1: 0, 2: 0, 3: 0, 4: 1, 5: 1})
+        self.assertEqual(facets["cuisines"][self.italian.pk], 1)
+
+        facets = self.facets(cuisines=[self.chinese.pk])
+        self.assertEqual(facets["diet_type"], {DietType.VEG: 1, DietType.NON_VEG: 0, DietType.VEGAN: 1})
+        self.assertEqual(facets["cuisines"][self.italian.pk], 2)
+
+    def test_facets_should_take_two_queries_and_then_come_from_the_cache(self):
+        cuisine_choices()
+        with self.assertNumQueries(2):
+            self.facets(rating=["4"], q="")
+        # Same filters in another order and with empty values share the cache entry.
+        with self.assertNumQueries(0):
+            self.facets(q="", rating=["4"], sort_by="price_low")
+
+    def test_catalogue_changes_should_invalidate_cached_facets(self):
+        self.assertEqual(self.facets()["diet_type"][DietType.NON_VEG], 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantFactory(diet_type=DietType.NON_VEG)
+        self.assertEqual(self.facets()["diet_type"][DietType.NON_VEG], 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.veg_chinese.cuisines.clear()
+        self.assertEqual(self.facets()["cuisines"][self.chinese.pk], 1)
+
+    def test_list_page_should_show_facet_counts(self):
+        response = self.client.get(reverse("restaurants:restaurant_list"))
+        self.assertContains(response, "Vegan <span class=\"text-gray-400 text-xs\">(1)</span>", html=False)
+
+
+class TestCuisineRegistry(RestaurantTestSetupMixin, TestCase):
+    def test_cuisine_filter_should_validate_without_queries(self):
+        cuisine_choices()
+        with self.assertNumQueries(0):
+            filterset = RestaurantFilter(data={"cuisines": [str(self.cuisine.pk)]}, queryset=Restaurant.objects.all())
+            self.assertTrue(filterset.is_valid())
+        self.assertEqual(filterset.form.cleaned_data["cuisines"], [self.cuisine.pk])
+        self.assertIn(self.restaurant, filterset.qs)
+
+    def test_unknown_cuisine_should_not_validate(self):
+        filterset = RestaurantFilter(data={"cuisines": ["999999"]}, queryset=Restaurant.objects.all())
+        self.assertFalse(filterset.is_valid())
+
+    def test_cuisine_changes_should_reload_every_registry(self):
+        other_process = CuisineRegistry()
+        self.assertNotIn("Thai", other_process.snapshot().values())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            thai = CuisineFactory(name="Thai")
+        self.assertEqual(other_process.snapshot()[thai.pk], "Thai")
+        self.assertIn((thai.pk, "Thai"), cuisine_choices())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            thai.delete()
+        self.assertNotIn(thai.pk, other_process.snapshot())
+
+    @override_settings(CACHE_VERSION_TIMEOUT=30)
+    def test_registry_should_reload_after_the_version_timeout(self):
+        registry = CuisineRegistry()
+        registry.snapshot()
+        # Added by another process, whose version bump a per-process cache never sees.
+        Cuisine.objects.bulk_create([Cuisine(name="Thai")])
+        self.assertNotIn("Thai", registry.snapshot().values())
+        with mock.patch("time.time", return_value=time.time() + 31):
+            self.assertIn("Thai", registry.snapshot().values())
+
+    def test_snapshot_should_be_read_only(self):
+        with self.assertRaises(TypeError):
+            CuisineRegistry().snapshot()[self.cuisine.pk] = "Changed"
+
+
+class TestFoodMenu(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.client.logout()  # keep the session lookup out of the query counts
+        self.url = reverse("restaurants:restaurant_foods", kwargs={"restaurant_id": self.restaurant.pk})
+        self.italian = self.cuisines[0]
+        self.pasta = FoodFactory(restaurant=self.restaurant, name="Truffle Pasta", price=450, cuisines=[self.italian])
+        self.wings = FoodFactory(restaurant=self.restaurant, name="Chicken Wings", price=300, diet_type=DietType.NON_VEG)
+        FoodFactory.create_batch(30, restaurant=self.restaurant)
+        cuisine_choices()
+
+    def foods(self, **params):
+        return list(self.client.get(self.url, params).context["foods"])
+
+    def test_menu_should_be_paginated(self):
+        response = self.client.get(self.url)
+        self.assertEqual(len(response.context["foods"]), 24)
+        self.assertTrue(response.context["is_paginated"])
+        self.assertEqual(len(self.foods(page=2)), 33 - 24)
+
+    def test_menu_should_filter_by_name_price_diet_and_cuisine(self):
+        self.assertEqual(self.foods(q="pasta"), [self.pasta])
+        self.assertEqual(self.foods(price_min=250, price_max=400), [self.wings])
+        self.assertEqual(self.foods(diet_type=DietType.NON_VEG), [self.wings])
+        self.assertEqual(self.foods(cuisines=self.italian.pk), [self.pasta])
+
+    def test_repeated_menu_views_should_not_query(self):
+        with self.assertNumQueries(3):  # restaurant, count, page rows
+            self.client.get(self.url, {"q": "pasta"})
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, {"q": "pasta"})
+        self.assertContains(response, "Truffle Pasta")
+
+    def test_food_changes_should_invalidate_the_menu(self):
+        self.foods(q="pasta")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.pasta.name = "Truffle Risotto"
+            self.pasta.save()
+        self.assertEqual(self.foods(q="pasta"), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.wings.cuisines.add(self.italian)
+        self.assertEqual(self.foods(cuisines=self.italian.pk), [self.pasta, self.wings])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.italian.foods.clear()
+        self.assertEqual(self.foods(cuisines=self.italian.pk), [])
+
+    @override_settings(CACHE_VERSION_TIMEOUT=30)
+    def test_menu_version_should_expire_after_the_version_timeout(self):
+        self.assertEqual(self.foods(q="pasta"), [self.pasta])
+        # Renamed by another process, whose version bump a per-process cache never sees.
+        Food.objects.filter(pk=self.pasta.pk).update(name="Truffle Risotto")
+        self.assertEqual(self.foods(q="pasta"), [self.pasta])
+        with mock.patch("time.time", return_value=time.time() + 31):
+            self.assertEqual(self.foods(q="pasta"), [])
+
+    def test_other_restaurants_menus_should_stay_cached(self):
+        other = reverse("restaurants:restaurant_foods", kwargs={"restaurant_id": self.restaurants[0].pk})
+        self.client.get(other)
+        with self.captureOnCommitCallbacks(execute=True):
+            FoodFactory(restaurant=self.restaurant)
+        with self.assertNumQueries(0):
+            self.client.get(other)
+
+    def test_missing_restaurant_should_404(self):
+        response = self.client.get(reverse("restaurants:restaurant_foods", kwargs={"restaurant_id": 999999}))
+        self.assertEqual(response.status_code, 404)
+
+
+class TestThumbnails(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name, THUMBNAILS_ASYNC=False)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def upload(self, name="cover.jpg", size=(1600, 900)):
+        buffer = BytesIO()
+        Image.new("RGB", size, "orange").save(buffer, "JPEG")
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type="image/jpeg")
+
+    def test_upload_should_build_resized_jpeg_and_webp_derivatives(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = RestaurantImage.objects.create(restaurant=self.restaurant, image=self.upload())
+
+        image.refresh_from_db()
+        self.assertTrue(image.has_thumbnails)
+        for width in (320, 640, 960):
+            for fmt, pil_format in (("webp", "WEBP"), ("jpeg", "JPEG")):
+                with default_storage.open(derivative_name(image.image.name, width, fmt)) as f:
+                    with Image.open(f) as derivative:
+                        self.assertEqual((derivative.format, derivative.width), (pil_format, width))
+
+    def test_small_images_should_not_be_upscaled(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            food = FoodFactory(restaurant=self.restaurant, image=self.upload("dish.jpg", size=(200, 100)))
+
+        with default_storage.open(derivative_name(food.image.name, 960, "webp")) as f:
+            with Image.open(f) as derivative:
+                self.assertEqual(derivative.size, (200, 100))
+
+    def test_card_should_offer_a_srcset_once_thumbnails_are_built(self):
+        image = RestaurantImage.objects.create(restaurant=self.restaurant, image=self.upload())
+        response = self.client.get(reverse("restaurants:restaurant_list"))
+        self.assertNotContains(response, "srcset=")
+
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        response = self.client.get(reverse("restaurants:restaurant_list"))
+        self.assertContains(response, 'type="image/webp"')
+        self.assertContains(response, derivative_name(image.image.name, 640, "webp") + " 640w")
+
+    def test_rebuild_thumbnails_should_process_existing_media(self):
+        image = RestaurantImage.objects.create(restaurant=self.restaurant, image=self.upload())
+        food = FoodFactory(restaurant=self.restaurant, image=self.upload("dish.jpg"))
+        missing = FoodFactory(restaurant=self.restaurant, image="food_images/missing.jpg")
+
+        out, err = StringIO(), StringIO()
+        call_command("rebuild_thumbnails", workers=1, stdout=out, stderr=err)
+
+        self.assertIn("Built thumbnails for 2 images; 1 failed.", out.getvalue())
+        self.assertIn(str(missing.pk), err.getvalue())
+        image.refresh_from_db()
+        food.refresh_from_db()
+        self.assertTrue(image.has_thumbnails and food.has_thumbnails)
+
+        out = StringIO()
+        call_command("rebuild_thumbnails", workers=1, stdout=out, stderr=StringIO())
+        self.assertIn("Built thumbnails for 0 images; 1 failed.", out.getvalue())
+
+
+class TestAsyncViews(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        RestaurantFactory.create_batch(12, cuisines=[self.cuisines[0]])
+        self.reviews = ReviewFactory.create_batch(12, restaurant=self.restaurant)
+        FoodFactory.create_batch(30, restaurant=self.restaurant)
+        Bookmark.objects.create(user=self.user, restaurant=self.restaurants[0])
+        cuisine_choices()
+        self.async_client.force_login(self.user)  # the sync views the async ones are compared with
+
+    def request(self, path, data=None, method="get", user=None):
+        request = getattr(AsyncRequestFactory(), method)(path, data or {})
+        request.user = user or self.user
+
+        async def auser():
+            return request.user
+
+        request.auser = auser
+        return request
+
+    async def get(self, view, path, data=None, **kwargs):
+        response = await view.as_view()(self.request(path, data), **kwargs)
+        response.render()  # raises SynchronousOnlyOperation if the template still needed a query
+        return response
+
+    async def test_list_should_match_the_sync_view(self):
+        url = reverse("restaurants:restaurant_list")
+        for params in [{}, {"page": 2}, {"page": "last"}, {"cursor": ""}, {"cuisines": self.cuisines[0].pk}]:
+            with self.subTest(params=params):
+                expected = (await self.async_client.get(url, params)).context
+                response = await self.get(async_views.RestaurantListView, url, params)
+                self.assertEqual(response.status_code, 200)
+                # The same type too: a queryset for offset pages, a list for cursor pages.
+                self.assertIs(type(response.context_data["restaurants"]), type(expected["restaurants"]))
+                self.assertEqual(list(response.context_data["restaurants"]), list(expected["restaurants"]))
+                self.assertEqual(response.context_data["filter"].facets, expected["filter"].facets)
+                self.assertEqual(
+                    [r.is_bookmarked for r in response.context_data["restaurants"]],
+                    [r.is_bookmarked for r in expected["restaurants"]],
+                )
+
+    async def test_load_test_default_paths_should_be_valid_listings(self):
+        for path in DEFAULT_PATHS:
+            with self.subTest(path=path):
+                url, _, query = path.partition("?")
+                response = await self.get(async_views.RestaurantListView, url, QueryDict(query).dict())
+                self.assertEqual(response.context_data["filter"].errors, {})
+                self.assertTrue(response.context_data["restaurants"])
+
+    async def test_list_should_404_on_bad_pages_and_cursors(self):
+        url = reverse("restaurants:restaurant_list")
+        for params in [{"page": 99}, {"page": "x"}, {"cursor": "not-a-cursor"}]:
+            with self.subTest(params=params), self.assertRaises(Http404):
+                await self.get(async_views.RestaurantListView, url, params)
+
+    async def test_detail_should_show_the_restaurant_and_newest_reviews(self):
+        url = reverse("restaurants:restaurant_detail", kwargs={"pk": self.restaurant.pk})
+        response = await self.get(async_views.RestaurantDetailView, url, pk=self.restaurant.pk)
+        newest = sorted(self.reviews, key=lambda r: (r.created_at, r.id), reverse=True)
+
+        self.assertEqual(response.context_data["restaurant"], self.restaurant)
+        self.assertEqual(list(response.context_data["reviews"]), newest[:10])
+        self.assertContains(response, self.restaurant.name)
+        self.assertContains(response, "Load more reviews")
+        with self.assertRaises(Http404):
+            await self.get(async_views.RestaurantDetailView, url, pk=999999)
+
+    async def test_menu_should_match_the_sync_view_and_come_from_the_cache(self):
+        kwargs = {"restaurant_id": self.restaurant.pk}
+        url = reverse("restaurants:restaurant_foods", kwargs=kwargs)
+        for params in [{}, {"page": 2}, {"page": 99}, {"page": "x"}]:
+            with self.subTest(params=params):
+                expected = (await self.async_client.get(url, params)).context
+                await cache.aclear()
+                response = await self.get(async_views.FoodListView, url, params, **kwargs)
+                self.assertEqual(list(response.context_data["foods"]), list(expected["foods"]))
+                self.assertEqual(response.context_data["page_obj"].number, expected["page_obj"].number)
+
+        with mock.patch.object(async_views.FoodListView, "aload_menu") as load:
+            await self.get(async_views.FoodListView, url, {"page": "x"}, **kwargs)
+        load.assert_not_called()
+        with self.assertRaises(Http404):
+            await self.get(async_views.FoodListView, url, restaurant_id=999999)
+
+    async def test_toggles_should_flip_state(self):
+        for view, model, key in [
+            (async_views.toggle_bookmark, Bookmark, "bookmarked"),
+            (async_views.toggle_visited, Visited, "visited"),
+        ]:
+            with self.subTest(key=key):
+                for state in (True, False):
+                    response = await view(self.request("/", {"restaurant_id": self.restaurant.pk}, "post"))
+                    self.assertJSONEqual(response.content, {key: state})
+                    self.assertEqual(
+                        await model.objects.filter(user=self.user, restaurant=self.restaurant).aexists(), state
+                    )
+
+    async def test_toggles_should_reject_bad_ids_and_anonymous_users(self):
+        response = await async_views.toggle_bookmark(self.request("/", {"restaurant_id": "abc"}, "post"))
+        self.assertEqual(response.status_code, 400)
+
+        response = await async_views.toggle_bookmark(
+            self.request("/", {"restaurant_id": self.restaurant.pk}, "post", user=AnonymousUser())
+        )
+        self.assertEqual(response.status_code, 302)
+
+
+class TestRequestMetrics(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        request_stats.clear()
+        self.url = reverse("restaurants:restaurant_list")
+
+    def timing(self, response):
+        match = re.fullmatch(
+            r'db;dur=([\d.]+);desc="(\d+) queries", render;dur=([\d.]+), total;dur=([\d.]+)',
+            response["Server-Timing"],
+        )
+        self.assertIsNotNone(match, response["Server-Timing"])
+        db, queries, render, total = match.groups()
+        return float(db), int(queries), float(render), float(total)
+
+    def test_server_timing_should_report_the_request_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url)
+        db, count, render, total = self.timing(response)
+
+        self.assertEqual(count, len(queries.captured_queries))
+        self.assertGreater(render, 0)
+        self.assertGreaterEqual(total, db + render)
+
+    async def test_queries_on_the_async_path_should_be_counted(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(self.url)
+        self.assertGreater(self.timing(response)[1], 0)
+
+    def test_stats_should_keep_a_rolling_window_per_url_name(self):
+        for _ in range(3):
+            self.client.get(self.url)
+        self.client.get(reverse("restaurants:restaurant_detail", kwargs={"pk": self.restaurant.pk}))
+
+        summary = request_stats.summary()
+        self.assertEqual(summary["restaurants:restaurant_list"]["count"], 3)
+        self.assertEqual(summary["restaurants:restaurant_detail"]["count"], 1)
+        self.assertEqual(set(summary["restaurants:restaurant_list"]["wall_ms"]), {"p50", "p95", "p99"})
+
+        stats = RequestStats(size=2)
+        for wall in (30, 10, 20):
+            stats.add("view", (wall, 0, 0, 1))
+        self.assertEqual(stats.summary()["view"]["wall_ms"], {"p50": 10, "p95": 20, "p99": 20})  # 30 rolled out
+
+    def test_metrics_endpoint_should_be_staff_only(self):
+        self.client.get(self.url)
+        url = reverse("request_metrics")
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+        self.user.is_staff = True
+        self.user.save()
+        data = self.client.get(url).json()
+        self.assertIn("restaurants:restaurant_list", data["views"])
+        self.assertEqual(data["views"]["restaurants:restaurant_list"]["count"], 1)
+
+
+class TestSavedLists(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.url = reverse("restaurants:restaurant_list")
+        self.saved = RestaurantFactory.create_batch(25, cuisines=[self.cuisine])
+        now = timezone.now()
+        for restaurant in self.saved:
+            Bookmark.objects.create(user=self.user, restaurant=restaurant)
+        for i, bookmark in enumerate(Bookmark.objects.filter(user=self.user).order_by("pk")):
+            # Saved in a shuffled order, unrelated to the pks and ratings.
+            Bookmark.objects.filter(pk=bookmark.pk).update(created_at=now - datetime.timedelta(minutes=(i * 7) % 25))
+        self.newest_first = [
+            bookmark.restaurant for bookmark in Bookmark.objects.filter(user=self.user).order_by("-created_at")
+        ]
+        Visited.objects.create(user=self.user, restaurant=self.restaurant)
+        other = UserFactory()
+        Bookmark.objects.create(user=other, restaurant=self.restaurants[0])
+        Visited.objects.create(user=other, restaurant=self.restaurants[1])
+
+    def walk(self, params):
+        restaurants, cursor = [], ""
+        while cursor is not None:
+            page = self.client.get(self.url, {**params, "cursor": cursor}).context["page_obj"]
+            restaurants += list(page)
+            cursor = page.next_cursor
+        return restaurants
+
+    def test_bookmarked_should_list_the_users_bookmarks_newest_first(self):
+        self.assertEqual(self.walk({"bookmarked": 1}), self.newest_first)
+
+    def test_visited_should_list_only_the_users_visits(self):
+        response = self.client.get(self.url, {"visited": 1})
+        self.assertEqual(list(response.context["restaurants"]), [self.restaurant])
+
+    def test_saved_lists_should_combine_with_filters_and_sorts(self):
+        cheap = self.saved[3]
+        Restaurant.objects.filter(pk=cheap.pk).update(cost_for_two=50)
+        response = self.client.get(self.url, {"bookmarked": 1, "cost_for_two_max": 100})
+        self.assertEqual(list(response.context["restaurants"]), [cheap])
+
+        response = self.client.get(self.url, {"bookmarked": 1, "sort_by": "price_low", "cursor": ""})
+        self.assertEqual(response.context["restaurants"][0], cheap)
+
+    def test_anonymous_users_should_get_an_empty_list(self):
+        self.client.logout()
+        response = self.client.get(self.url, {"bookmarked": 1})
+        self.assertEqual(list(response.context["restaurants"]), [])
+        self.assertNotContains(response, 'id="bookmarkFilterBtn"')
+
+    def test_facet_counts_should_be_per_user(self):
+        facets = self.client.get(self.url, {"bookmarked": 1}).context["filter"].facets
+        self.assertEqual(dict((pk, count) for pk, _, count in facets["cuisines"])[self.cuisine.pk], 25)
+
+        self.client.force_login(UserFactory())
+        facets = self.client.get(self.url, {"bookmarked": 1}).context["filter"].facets
+        self.assertEqual(dict((pk, count) for pk, _, count in facets["cuisines"])[self.cuisine.pk], 0)
+
+    def test_saved_list_should_be_read_through_the_user_created_index(self):
+        request = RequestFactory().get(self.url)
+        request.user = self.user
+        for name, index in [("bookmarked", "bookmark_user_created_idx"), ("visited", "visited_user_created_idx")]:
+            with self.subTest(name):
+                queryset = RestaurantFilter({name: "1"}, queryset=Restaurant.objects.all(), request=request).qs
+                if connection.vendor == "sqlite":
+                    self.assertIn(index, queryset.explain())
+
+
+class TestRatingBuckets(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Restaurant.objects.all().delete()
+        self.by_rating = {
+            rating: RestaurantFactory(average_rating=Decimal(rating))
+            for rating in ["0.0", "2.0", "3.9", "4.0", "4.5", "4.9", "5.0"]
+        }
+
+    def ratings(self, **data):
+        qs = RestaurantFilter(data=data, queryset=Restaurant.objects.order_by("average_rating")).qs
+        return [str(r.average_rating) for r in qs]
+
+    def test_stars_should_match_half_open_ranges(self):
+        self.assertEqual(self.ratings(rating=["4"]), ["4.0", "4.5", "4.9"])
+        self.assertEqual(self.ratings(rating=["5"]), ["5.0"])
+        self.assertEqual(self.ratings(rating=["3"]), ["3.9"])
+        self.assertEqual(self.ratings(rating=["2", "4"]), ["2.0", "4.0", "4.5", "4.9"])
+        self.assertEqual(self.ratings(rating=["3", "4", "5"]), ["3.9", "4.0", "4.5", "4.9", "5.0"])
+
+    def test_adjacent_stars_should_merge_into_one_range(self):
+        self.assertEqual(
+            RatingBucketFilter.ranges(["5", "1", "2", "4"]),
+            [(Decimal(1), Decimal(3)), (Decimal(4), None)],
+        )
+        qs = RestaurantFilter(data={"rating": ["3", "4", "5"]}, queryset=Restaurant.objects.all()).qs
+        self.assertNotIn(" OR ", str(qs.query))
+
+    def test_minimum_rating_should_include_everything_above(self):
+        self.assertEqual(self.ratings(min_rating="4.5"), ["4.5", "4.9", "5.0"])
+        self.assertEqual(self.ratings(min_rating="4", rating=["4"]), ["4.0", "4.5", "4.9"])
+        self.assertFalse(RestaurantFilter(data={"min_rating": "6"}, queryset=Restaurant.objects.all()).is_valid())
+
+    def test_facet_counts_should_use_the_same_buckets(self):
+        facets = RestaurantFilter(data={}, queryset=Restaurant.objects.all()).facets
+        self.assertEqual({value: count for value, _, count in facets["rating"]}, {1: 0, 2: 1, 3: 1, 4: 3, 5: 1})
+
+    def test_rating_filters_should_use_the_rating_index(self):
+        for data in [{"rating": ["4", "5"]}, {"rating": ["2"]}, {"min_rating": "4.5"}]:
+            with self.subTest(data=data):
+                qs = RestaurantFilter(data=data, queryset=Restaurant.objects.order_by("-average_rating")).qs
+                if connection.vendor == "sqlite":
+                    self.assertIn("USING INDEX restaurant_rating_idx (average_rating", qs.explain())
+
+
+class TestAdminChangelists(RestaurantTestSetupMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user.is_staff = self.user.is_superuser = True
+        self.user.save()
+        self.client.force_login(self.user)
+
+    def changelist(self, model, **params):
+        return self.client.get(reverse(f"admin:restaurants_{model}_changelist"), params)
+
+    def add_rows(self, count):
+        for restaurant in RestaurantFactory.create_batch(count):
+            user = UserFactory()
+            ReviewFactory(user=user, restaurant=restaurant)
+            Bookmark.objects.create(user=user, restaurant=restaurant)
+            Visited.objects.create(user=user, restaurant=restaurant)
+            FoodFactory(restaurant=restaurant)
+
+    def test_changelist_query_count_should_not_depend_on_rows(self):
+        self.add_rows(2)
+        for model in ("review", "bookmark", "visited", "food", "restaurant", "restaurantimage"):
+            self.changelist(model)  # warm up
+            with CaptureQueriesContext(connection) as few:
+                self.assertEqual(self.changelist(model).status_code, 200)
+            self.add_rows(3)
+            with self.subTest(model=model), CaptureQueriesContext(connection) as many:
+                self.changelist(model)
+            self.assertEqual(len(few), len(many), "\n".join(q["sql"] for q in many.captured_queries))
+
+    def test_search_should_use_the_restaurant_index_and_exact_usernames(self):
+        restaurant = RestaurantFactory(name="Zanzibar Grill")
+        ReviewFactory(user=self.user, restaurant=restaurant)
+        other = ReviewFactory(restaurant=self.restaurant)
+
+        response = self.changelist("review", q="zanzibar")
+        self.assertEqual([r.restaurant_id for r in response.context["cl"].result_list], [restaurant.pk])
+        response = self.changelist("review", q=other.user.username)
+        self.assertEqual(list(response.context["cl"].result_list), [other])
+        response = self.changelist("restaurant", q="zanzibar")
+        self.assertEqual(list(response.context["cl"].result_list), [restaurant])
+
+    def test_food_search_should_match_the_dish_not_its_restaurant(self):
+        dosa = FoodFactory(restaurant=self.restaurant, name="Masala Dosa")
+        FoodFactory(restaurant=self.restaurant, name="Filter Coffee")
+
+        response = self.changelist("food", q="dosa")
+        self.assertEqual(list(response.context["cl"].result_list), [dosa])
+
+    def test_restaurant_autocomplete_should_match_partial_names(self):
+        restaurant = RestaurantFactory(name="Zanzibar Grill")
+        response = self.client.get(reverse("admin:autocomplete"), {
+            "term": "zanz", "app_label": "restaurants", "model_name": "food", "field_name": "restaurant",
+        })
+        self.assertEqual([result["id"] for result in response.json()["results"]], [str(restaurant.pk)])
+
+    def test_form_should_not_list_every_restaurant(self):
+        review = ReviewFactory(user=self.user, restaurant=self.restaurant)
+        response = self.client.get(reverse("admin:restaurants_review_change", args=[review.pk]))
+        self.assertNotContains(response, self.restaurants[0].name)
+
+
+class TestEstimatedCountPaginator(TestCase):
+    def test_estimate_should_only_apply_to_big_unfiltered_tables(self):
+        RestaurantFactory.create_batch(3)
+        queryset = Restaurant.objects.order_by("pk")
+        self.assertIsNone(estimated_row_count(queryset))  # SQLite has no estimate
+        self.assertEqual(EstimatedCountPaginator(queryset, 2).count, 3)
+
+        with mock.patch("restaurants.pagination.estimated_row_count", return_value=5_000_000):
+            paginator = EstimatedCountPaginator(queryset, 100)
+            with self.assertNumQueries(0):
+                self.assertEqual(paginator.num_pages, 50_000)
+        with mock.patch("restaurants.pagination.estimated_row_count", return_value=10):
+            self.assertEqual(EstimatedCountPaginator(queryset, 2).count, 3)
+
+    def test_filtered_querysets_should_not_be_estimated(self):
+        with mock.patch("restaurants.pagination.connections") as connections:
+            connections.__getitem__.return_value.vendor = "postgresql"
+            self.assertIsNone(estimated_row_count(Restaurant.objects.filter(is_spotlight=True)))
+            self.assertIsNone(estimated_row_count(Restaurant.objects.all()[:10]))
+
+
+class TestGenerateDataset(TestCase):
+    def generate(self, **options):
+        options = {"restaurants": 12, "reviews_per": 6, "foods_per": 2, "users": 20, "shard_size": 5, "seed": 3, **options}
+        call_command("generate_dataset", stdout=StringIO(), **options)
+        return Restaurant.objects.filter(name__startswith=f"Restaurant {options.get('prefix', 'gen')}-")
+
+    def test_generated_rows_should_match_what_the_models_would_store(self):
+        restaurants = self.generate()
+        self.assertEqual(restaurants.count(), 12)
+        self.assertEqual(Review.objects.count(), sum(restaurants.values_list("review_count", flat=True)))
+        self.assertEqual(list(find_rating_drift()), [])
+
+        for restaurant in restaurants.prefetch_related("cuisines", "menu"):
+            self.assertTrue(restaurant.cuisines.all())
+            self.assertEqual(restaurant.search_document, restaurant.build_search_document())
+            self.assertEqual(restaurant.geo_cell, geo.geo_cell(restaurant.latitude, restaurant.longitude))
+            opening, closing = restaurant.opening_minute, restaurant.closing_minute
+            restaurant.set_opening_minutes()
+            self.assertEqual((opening, closing), (restaurant.opening_minute, restaurant.closing_minute))
+        self.assertEqual(restaurants.search(restaurants[0].name).first(), restaurants[0])
+        self.assertFalse(RestaurantImage.objects.exclude(thumbnails_for="").exists())
+        self.assertTrue(Food.cuisines.through.objects.exists())
+
+    def test_same_seed_should_generate_the_same_data(self):
+        def snapshot(prefix, seed):
+            # Everything but the prefix in the name (the search document starts with it)
+            return [
+                (r.city, r.cost_for_two, r.average_rating, r.review_count, r.search_document.split(" ", 2)[-1])
+                for r in self.generate(prefix=prefix, seed=seed).order_by("pk")
+            ]
+
+        self.assertEqual(snapshot("a", seed=1), snapshot("b", seed=1))
+        self.assertNotEqual(snapshot("c", seed=1), snapshot("d", seed=2))
+
+    def test_existing_prefix_should_be_rejected(self):
+        self.generate(restaurants=1)
+        with self.assertRaisesMessage(CommandError, "prefix 'gen' exists"):
+            self.generate(restaurants=1)
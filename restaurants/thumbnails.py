@@ -0,0 +1,116 @@
+"""
+Resized JPEG and WebP derivatives of uploaded food and restaurant photos.
+
+Derivatives live next to the original as <name>.<width>w.<ext>, one per width in
+THUMBNAIL_WIDTHS (never upscaled, so small originals just get re-encoded copies). A
+model's thumbnails_for records which upload they were made from; the templates only
+offer the srcset while it matches the current image, so a replaced or still-processing
+photo falls back to the original.
+"""
+import atexit
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+THUMBNAIL_WIDTHS = (320, 640, 960)
+THUMBNAIL_FORMATS = {"webp": ("WEBP", "image/webp"), "jpeg": ("JPEG", "image/jpeg")}
+THUMBNAIL_QUALITY = 80
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def derivative_name(name, width, fmt):
+    return f"{os.path.splitext(name)[0]}.{width}w.{fmt}"
+
+
+def srcset(name, fmt, storage=default_storage):
+    return ", ".join(f"{storage.url(derivative_name(name, width, fmt))} {width}w" for width in THUMBNAIL_WIDTHS)
+
+
+def generate_derivatives(name, storage=default_storage):
+    """Write every width and format of the image stored at name; returns the derivative names."""
+    with storage.open(name, "rb") as f:
+        with Image.open(f) as original:
+            original = ImageOps.exif_transpose(original).convert("RGB")
+
+    written = []
+    for width in THUMBNAIL_WIDTHS:
+        resized = original
+        if original.width > width:
+            height = round(original.height * width / original.width)
+            resized = original.resize((width, height), Image.Resampling.LANCZOS)
+        for fmt, (pil_format, _) in THUMBNAIL_FORMATS.items():
+            buffer = BytesIO()
+            resized.save(buffer, pil_format, quality=THUMBNAIL_QUALITY, optimize=True)
+            target = derivative_name(name, width, fmt)
+            # storage.save() would pick a new name rather than overwrite a previous derivative.
+            storage.delete(target)
+            written.append(storage.save(target, ContentFile(buffer.getvalue())))
+    return written
+
+
+def build_thumbnails(model, pk, name):
+    """Generate the derivatives for one row's image and mark the row, unless the image changed meanwhile."""
+    try:
+        generate_derivatives(name)
+    except Exception:
+        logger.exception("Could not build thumbnails for %s", name)
+        return False
+    return mark_thumbnails_built(model, {pk: name}) > 0
+
+
+def mark_thumbnails_built(model, names):
+    """Record {pk: image name} as processed and bump the cached cards and menus showing them."""
+    from .menu import invalidate_menus
+    from .models import Food, Restaurant
+
+    rows = [
+        row for row in model.objects.filter(pk__in=names).only("pk", "image", "restaurant_id")
+        if row.image.name == names[row.pk]
+    ]
+    for row in rows:
+        row.thumbnails_for = row.image.name
+    model.objects.bulk_update(rows, ["thumbnails_for"], batch_size=500)
+
+    restaurant_ids = {row.restaurant_id for row in rows}
+    Restaurant.objects.filter(pk__in=restaurant_ids).touch()
+    if model is Food:
+        invalidate_menus(restaurant_ids)
+    return len(rows)
+
+
+def _build_in_worker(model, pk, name):
+    try:
+        return build_thumbnails(model, pk, name)
+    finally:
+        connections.close_all()  # the pool thread's own connections
+
+
+def schedule_thumbnails(instance):
+    """Queue derivative generation for instance.image on the worker pool (inline when THUMBNAILS_ASYNC is off)."""
+    job = (type(instance), instance.pk, instance.image.name)
+    if not getattr(settings, "THUMBNAILS_ASYNC", True):
+        return build_thumbnails(*job)
+    return _get_executor().submit(_build_in_worker, *job)
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=getattr(settings, "THUMBNAIL_WORKERS", 2), thread_name_prefix="thumbnails"
+            )
+            atexit.register(_executor.shutdown)
+    return _executor
@@ -1,14 +1,21 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import async_views, views
+
+# The hot read views and the toggles have async versions for ASGI deployments.
+hot = async_views if settings.ASYNC_VIEWS else views
 
 app_name = "restaurants"
 
 urlpatterns = [
-    path("", views.RestaurantListView.as_view(), name="restaurant_list"),
-    path("<int:pk>/", views.RestaurantDetailView.as_view(), name="restaurant_detail"),
-    path("<int:restaurant_id>/foods/", views.FoodListView.as_view(), name="restaurant_foods"),
-    path("bookmark/toggle/", views.toggle_bookmark, name="toggle_bookmark"),
-    path("visited/toggle/", views.toggle_visited, name="toggle_visited"),
+    path("", hot.RestaurantListView.as_view(), name="restaurant_list"),
+    path("<int:pk>/", hot.RestaurantDetailView.as_view(), name="restaurant_detail"),
+    path("<int:pk>/reviews/", views.restaurant_reviews, name="restaurant_reviews"),
+    path("<int:restaurant_id>/foods/", hot.FoodListView.as_view(), name="restaurant_foods"),
+    path("bookmark/toggle/", hot.toggle_bookmark, name="toggle_bookmark"),
+    path("visited/toggle/", hot.toggle_visited, name="toggle_visited"),
+    path("api/", views.restaurant_list_api, name="restaurant_list_api"),
+    path("toggles/batch/", views.toggle_batch, name="toggle_batch"),
     path("<int:restaurant_id>/add-review/", views.AddReviewView.as_view(), name="add_review"),
     path("delete-review/<int:pk>/", views.DeleteReviewView.as_view(), name="delete_review"),
 ]
@@ -1,12 +1,17 @@
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Restaurant, Food, Cuisine, Bookmark, Visited, Review
-from django.views.generic import ListView, DetailView, CreateView, DeleteView, UpdateView
+from .models import Restaurant, RestaurantImage, Food, Cuisine, Bookmark, Visited, Review
+from django.views.generic import DetailView, DeleteView, TemplateView, UpdateView
 from django.db.models import Count, Avg
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from .forms import ReviewForm
 from django.urls import reverse
 from django_filters.views import FilterView
-from .filters import RestaurantFilter
+from .filters import FoodFilter, RestaurantFilter
+from .menu import MENU_CACHE_TIMEOUT, menu_cache_key
+from django.core.cache import cache
+from django.core.paginator import Page, Paginator
+from .pagination import KeysetPaginator, InvalidCursor
+from django.http import Http404
 # Create your views here.
 class RestaurantListView(FilterView):
     model = Restaurant
@@ -16,83 +21,323 @@ class RestaurantListView(FilterView):
     filterset_class = RestaurantFilter
     ordering = ['-average_rating']
 
+    cursor_kwarg = 'cursor'
+
     def get_queryset(self):
-        qs = super().get_queryset().prefetch_related('images').with_user_bookmarks(self.request.user).with_user_visited(self.request.user)
+        qs = super().get_queryset().with_cover_image().with_user_bookmarks(self.request.user).with_user_visited(self.request.user)
         return qs
 
+    def paginate_queryset(self, queryset, page_size):
+        # Opt-in keyset mode: any request carrying ?cursor= (empty for the first page) skips OFFSET and COUNT(*).
+        if self.cursor_kwarg not in self.request.GET:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(queryset, page_size)
+        try:
+            page = paginator.page(self.request.GET.get(self.cursor_kwarg) or None)
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+REVIEWS_PER_PAGE = 10
+
+
+def _review_paginator(restaurant_id):
+    # Newest first, keyset-paginated on (created_at, id) so deep pages cost the same as the first.
+    reviews = Review.objects.filter(restaurant_id=restaurant_id).select_related('user').order_by('-created_at', '-id')
+    return KeysetPaginator(reviews, REVIEWS_PER_PAGE)
+
+
+def _review_page(restaurant_id, cursor=None):
+    return _review_paginator(restaurant_id).page(cursor)
+
+
 class RestaurantDetailView(DetailView):
     model = Restaurant
     template_name = "restaurants/detail.html"  
     context_object_name = "restaurant"
 
     def get_queryset(self):
-        return super().get_queryset().prefetch_related('images', 'cuisines', 'reviews__user').with_user_visited(self.request.user)
+        return super().get_queryset().prefetch_related('images', 'cuisines').with_user_visited(self.request.user)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["reviews"] = self.object.reviews.select_related('user').all()
+        context["reviews"] = _review_page(self.object.pk)
         context["rating_stats"] = self.object.get_rating_stats()
         return context
 
 
-class FoodListView(ListView):
-    model = Food
+def restaurant_reviews(request, pk):
+    """Next page of review cards for the detail page's "Load more reviews" button."""
+    try:
+        page = _review_page(pk, request.GET.get("cursor") or None)
+    except InvalidCursor as e:
+        raise Http404(str(e))
+    return render(request, "reviews/review-page.html", {"reviews": page, "restaurant_id": pk})
+
+
+class FoodListView(TemplateView):
+    """A restaurant's menu, filtered by FoodFilter and paginated, with each page cached (see menu.py)."""
     template_name = "foods/list.html"
-    context_object_name = "foods"
+    paginate_by = 24
+    page_kwarg = 'page'
 
-    def get_queryset(self):
-        self.restaurant = get_object_or_404(Restaurant, pk=self.kwargs['restaurant_id'])
-        return Food.objects.filter(restaurant=self.restaurant).prefetch_related('cuisines')
-    
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        context['restaurant'] = self.restaurant
-        return context
+    def get(self, request, *args, **kwargs):
+        key, foods = self.get_menu_key()
+        menu = cache.get(key) if key else None
+        if menu is None:
+            menu = self.load_menu(foods)
+            if key:
+                cache.set(key, menu, MENU_CACHE_TIMEOUT)
+        return self.render_menu(menu)
+
+    def get_menu_key(self):
+        """Build the filterset; return the page's cache key (None if uncacheable) and its queryset."""
+        restaurant_id = self.kwargs['restaurant_id']
+        self.filterset = FoodFilter(
+            self.request.GET or None,
+            queryset=Food.objects.filter(restaurant_id=restaurant_id).order_by('pk'),
+        )
+        self.page_number = self.request.GET.get(self.page_kwarg) or 1
+        if self.filterset.is_bound and not self.filterset.is_valid():
+            return None, Food.objects.none()  # like FilterView, an invalid filter lists nothing
+        filters = self.filterset.form.cleaned_data if self.filterset.is_bound else {}
+        return menu_cache_key(restaurant_id, filters, self.page_number), self.filterset.qs
+
+    def load_menu(self, foods):
+        restaurant = get_object_or_404(Restaurant.objects.only('name'), pk=self.kwargs['restaurant_id'])
+        page = Paginator(foods, self.paginate_by).get_page(self.page_number)
+        return {
+            'restaurant': restaurant,
+            'foods': list(page.object_list),
+            'number': page.number,
+            'count': page.paginator.count,
+        }
+
+    def render_menu(self, menu):
+        # Rebuild the page around the cached rows; range() stands in for the full result.
+        paginator = Paginator(range(menu['count']), self.paginate_by)
+        page = Page(menu['foods'], menu['number'], paginator)
+        return self.render_to_response(self.get_context_data(
+            restaurant=menu['restaurant'],
+            foods=page.object_list,
+            page_obj=page,
+            paginator=paginator,
+            is_paginated=page.has_other_pages(),
+            filter=self.filterset,
+        ))
 
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
-from django.views.decorators.http import require_POST
-from .models import Bookmark, Restaurant
+from django.views.decorators.http import require_GET, require_POST, condition
+from django.views.decorators.vary import vary_on_cookie
+from django.core.files.storage import default_storage
+from django.db.models import Max
+import hashlib
+from django.db import IntegrityError, transaction
+import json
 
-@require_POST
-@login_required
-def toggle_bookmark(request):
-    restaurant_id = request.POST.get("restaurant_id")
+TOGGLE_MODELS = {"bookmark": Bookmark, "visited": Visited}
+
+
+def _parse_restaurant_id(value):
+    restaurant_id = int(value)
+    if restaurant_id <= 0:
+        raise ValueError(value)
+    return restaurant_id
+
+
+def _parse_state(value):
+    # Only JSON true/false, or null/absent to flip; bool("false") would be True.
+    if value is not None and not isinstance(value, bool):
+        raise ValueError(value)
+    return value
+
+
+def _toggle(model, user, restaurant_id):
+    """
+    Flip the user's row for restaurant_id in at most two statements: a DELETE, and
+    only when nothing was deleted an INSERT that ignores a concurrent duplicate.
+    A missing restaurant surfaces as the foreign key's IntegrityError.
+    """
+    deleted, _ = model.objects.filter(user=user, restaurant_id=restaurant_id).delete()
+    if deleted:
+        return False
+    model.objects.bulk_create([model(user=user, restaurant_id=restaurant_id)], ignore_conflicts=True)
+    return True
+
+
+def _toggle_view(request, model, state_key):
     try:
-        restaurant = Restaurant.objects.get(id=restaurant_id)
-    except (Restaurant.DoesNotExist, ValueError, TypeError):
+        restaurant_id = _parse_restaurant_id(request.POST.get("restaurant_id"))
+        state = _toggle(model, request.user, restaurant_id)
+    except (TypeError, ValueError, IntegrityError):
         return JsonResponse({"error": "Invalid restaurant ID"}, status=400)
+    return JsonResponse({state_key: state})
 
-    bookmark, created = Bookmark.objects.get_or_create(
-        user=request.user,
-        restaurant=restaurant
-    )
-
-    if not created:
-        bookmark.delete()
-        return JsonResponse({"bookmarked": False})
 
-    return JsonResponse({"bookmarked": True})
+@require_POST
+@login_required
+def toggle_bookmark(request):
+    return _toggle_view(request, Bookmark, "bookmarked")
 
 @require_POST
 @login_required
 def toggle_visited(request):
-    restaurant_id = request.POST.get("restaurant_id")
+    return _toggle_view(request, Visited, "visited")
+
+@require_POST
+@login_required
+def toggle_batch(request):
+    """
+    Apply many bookmark/visited changes from an offline client in one request.
+
+    Body: {"toggles": [{"type": "bookmark" | "visited", "restaurant_id": 1, "state": true}, ...]}
+    where "state" is optional and the toggle flips the current state without it.
+    Changes apply in order; each type costs one SELECT, one DELETE and one INSERT.
+    """
+    try:
+        toggles = json.loads(request.body)["toggles"]
+        ops = [
+            (TOGGLE_MODELS[op["type"]], _parse_restaurant_id(op["restaurant_id"]), _parse_state(op.get("state")))
+            for op in toggles
+        ]
+    except (ValueError, TypeError, KeyError, AttributeError):
+        return JsonResponse({"error": "Invalid toggle batch"}, status=400)
+
+    result = {}
     try:
-        restaurant = Restaurant.objects.get(id=restaurant_id)
-    except (TypeError, ValueError, Restaurant.DoesNotExist):
+        with transaction.atomic():
+            for kind, model in TOGGLE_MODELS.items():
+                restaurant_ids = {restaurant_id for op_model, restaurant_id, _ in ops if op_model is model}
+                if not restaurant_ids:
+                    continue
+                existing = set(
+                    model.objects.filter(user=request.user, restaurant_id__in=restaurant_ids)
+                    .values_list("restaurant_id", flat=True)
+                )
+                states = {restaurant_id: restaurant_id in existing for restaurant_id in restaurant_ids}
+                for op_model, restaurant_id, state in ops:
+                    if op_model is model:
+                        states[restaurant_id] = state if state is not None else not states[restaurant_id]
+
+                removed = [rid for rid, state in states.items() if not state and rid in existing]
+                added = [rid for rid, state in states.items() if state and rid not in existing]
+                if removed:
+                    model.objects.filter(user=request.user, restaurant_id__in=removed).delete()
+                if added:
+                    model.objects.bulk_create(
+                        [model(user=request.user, restaurant_id=rid) for rid in added], ignore_conflicts=True
+                    )
+                result[kind] = {str(rid): state for rid, state in states.items()}
+    except IntegrityError:
         return JsonResponse({"error": "Invalid restaurant ID"}, status=400)
+    return JsonResponse(result)
+
+API_PAGE_SIZE = 20
+API_FIELDS = [
+    "id", "name", "city", "address", "cost_for_two", "diet_type", "average_rating", "review_count",
+    "opening_time", "closing_time", "is_spotlight", "latitude", "longitude", "updated_at",
+]
+
+
+def _api_filterset(request):
+    if not hasattr(request, "_restaurant_api_filterset"):
+        request._restaurant_api_filterset = RestaurantFilter(
+            request.GET, queryset=Restaurant.objects.order_by("-average_rating"), request=request
+        )
+    return request._restaurant_api_filterset
+
+
+def _api_saved_filters(filterset):
+    """The ?bookmarked=/?visited= filters in use, which make the result depend on the user."""
+    if not filterset.is_valid():
+        return []
+    return [name for name in RestaurantFilter.SAVED if filterset.form.cleaned_data.get(name)]
+
+
+def _api_version(request):
+    """
+    Newest change and row count of the whole filtered result, from one aggregate query.
+    Under the saved-list filters the newest bookmark or visit counts as a change too.
+    """
+    if not hasattr(request, "_restaurant_api_version"):
+        filterset = _api_filterset(request)
+        queryset = filterset.qs if filterset.is_valid() else Restaurant.objects.none()
+        version = queryset.order_by().aggregate(
+            Max("updated_at"), count=Count("pk"),
+            **{f"last_{name}": Max(f"{name}_at") for name in _api_saved_filters(filterset)},
+        )
+        changes = [value for key, value in version.items() if key != "count" and value is not None]
+        request._restaurant_api_version = {"last_modified": max(changes, default=None), "count": version["count"]}
+    return request._restaurant_api_version
+
+
+def _api_etag(request):
+    version = _api_version(request)
+    last_modified = version["last_modified"]
+    # Every change to a listed restaurant bumps updated_at; the count catches deletions.
+    # A saved list belongs to the user, so their id keeps one user's ETag from matching another's.
+    user = request.user.pk if _api_saved_filters(_api_filterset(request)) else None
+    key = "|".join([
+        request.GET.urlencode(),
+        str(user or ""),
+        last_modified.isoformat() if last_modified else "",
+        str(version["count"]),
+    ])
+    return hashlib.sha256(key.encode()).hexdigest()[:32]
 
-    visited, created = Visited.objects.get_or_create(
-        user=request.user,
-        restaurant=restaurant
-    )
 
-    if not created:
-        visited.delete()
-        return JsonResponse({"visited": False})
+def _api_last_modified(request):
+    return _api_version(request)["last_modified"]
 
-    return JsonResponse({"visited": True})
+
+@require_GET
+@vary_on_cookie
+@condition(etag_func=_api_etag, last_modified_func=_api_last_modified)
+def restaurant_list_api(request):
+    """
+    JSON version of the restaurant list, taking the same filters as RestaurantListView
+    and paginated by ?cursor=. Conditional requests are answered with a 304 from the
+    aggregate behind the ETag, before any page is built. ?bookmarked= and ?visited= list
+    the session user's restaurants, hence Vary: Cookie.
+    """
+    filterset = _api_filterset(request)
+    if not filterset.is_valid():
+        return JsonResponse({"errors": filterset.errors}, status=400)
+
+    queryset = filterset.qs
+    ordering = [field.lstrip("-") for field in KeysetPaginator.get_ordering(queryset)]
+    paginator = KeysetPaginator(queryset.values(*API_FIELDS, *[f for f in ordering if f not in API_FIELDS]), API_PAGE_SIZE)
+    try:
+        page = paginator.page(request.GET.get("cursor") or None)
+    except InvalidCursor as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    ids = [row["id"] for row in page]
+    cuisines, images = {}, {}
+    for restaurant_id, name in Restaurant.cuisines.through.objects.filter(restaurant_id__in=ids).values_list(
+        "restaurant_id", "cuisine__name"
+    ):
+        cuisines.setdefault(restaurant_id, []).append(name)
+    for restaurant_id, image in RestaurantImage.objects.filter(restaurant_id__in=ids).order_by("pk").values_list(
+        "restaurant_id", "image"
+    ):
+        images.setdefault(restaurant_id, []).append(default_storage.url(image))
+
+    results = [
+        {
+            **{field: row[field] for field in API_FIELDS},
+            **({"distance_km": round(row["distance_km"], 2)} if "distance_km" in row else {}),
+            "cuisines": cuisines.get(row["id"], []),
+            "images": images.get(row["id"], []),
+        }
+        for row in page
+    ]
+    return JsonResponse({
+        "results": results,
+        "next": page.next_cursor,
+        "previous": page.previous_cursor,
+    })
 
 class AddReviewView(LoginRequiredMixin, UpdateView):  
     model = Review
@@ -101,12 +346,9 @@ class AddReviewView(LoginRequiredMixin, UpdateView):
 
     def get_object(self, queryset=None):
         self.restaurant = get_object_or_404(Restaurant, id=self.kwargs["restaurant_id"])
-        review, created = Review.objects.get_or_create(
-            user=self.request.user,
-            restaurant=self.restaurant,
-            defaults={"rating": 0, "comment": ""}
-        )
-        return review
+        # Unsaved until the form is valid, so a placeholder review never reaches the rating aggregates.
+        review = Review.objects.filter(user=self.request.user, restaurant=self.restaurant).first()
+        return review or Review(user=self.request.user, restaurant=self.restaurant)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -114,8 +356,14 @@ class AddReviewView(LoginRequiredMixin, UpdateView):
         return context
 
     def form_valid(self, form):
-        review = form.save()
-        review.restaurant.update_average_rating()
+        # rating aggregates are updated by the Review signals
+        try:
+            with transaction.atomic():
+                form.save()
+        except IntegrityError:
+            # A double submit created the review since get_object(); apply this one as an update.
+            review = Review.objects.get(user=self.request.user, restaurant=self.restaurant)
+            self.get_form_class()(form.data, instance=review).save()
         return redirect("restaurants:restaurant_detail", pk=self.restaurant.id)
 
 class DeleteReviewView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
@@ -124,12 +372,5 @@ class DeleteReviewView(LoginRequiredMixin, UserPassesTestMixin, DeleteView):
     def test_func(self):
         return self.get_object().user == self.request.user
 
-    def delete(self, request, *args, **kwargs):
-        self.object = self.get_object()
-        restaurant = self.object.restaurant  # save restaurant before deletion
-        response = super().delete(request, *args, **kwargs)
-        restaurant.update_average_rating()  # update after deletion
-        return response
-
     def get_success_url(self):
         return reverse('restaurants:restaurant_detail', kwargs={'pk': self.object.restaurant.id})